@@ -1,13 +1,18 @@
-from asyncio.subprocess import Process
+import asyncio
+from asyncio import Future
+import os
+from subprocess import Popen
 from loguru import logger
 
+from .reaper import Reaper
 from ...shared import FileDescriptor, Signal, ExitCode, ExecutionID
 
 
 class Execution:
 
     _id: ExecutionID
-    _process: Process
+    _process: Popen[bytes]
+    _exit_code: Future[ExitCode]
     _stdin: FileDescriptor
     _stdout: FileDescriptor
     _stderr: FileDescriptor
@@ -15,13 +20,17 @@ class Execution:
 
     def __init__(self,
         id: ExecutionID,
-        process: Process,
+        process: Popen[bytes],
+        reaper: Reaper,
         stdin: FileDescriptor, 
         stdout: FileDescriptor, 
         stderr: FileDescriptor
     ):
         self._id = id
         self._process = process
+        # Reaped as soon as it exits, whether or not anybody waits for it.
+        self._exit_code = reaper.watch(process.pid)
+        self._exit_code.add_done_callback(self._on_exit)
         self._stdin = stdin
         self._stdout = stdout
         self._stderr = stderr
@@ -43,12 +52,22 @@ class Execution:
         return self._stderr
     
     async def kill(self, signal: Signal) -> None:
+        # Not through `Popen.send_signal`, which may reap the process behind the reaper's back.
+        # The pid is only reaped by the reaper, which resolves the exit code in the same loop
+        # iteration: while the exit code is pending, the pid is still ours to signal.
+        if self._exit_code.done():
+            logger.debug(f"Execution {self.id} already exited, not killing it")
+            return
         logger.info(f"Killing execution {self.id} with signal {signal}")
-        self._process.send_signal(signal)
+        os.kill(self._process.pid, signal)
+
+    def _on_exit(self, exit_code: Future[ExitCode]) -> None:
+        # Also keeps `Popen` from ever waiting for the pid once it may be reused.
+        self._process.returncode = exit_code.result()
 
     async def wait_for(self) -> ExitCode:
-        exit_code = await self._process.wait()
-        return exit_code
+        # Shielded, so that a waiter giving up does not cancel the exit for the others.
+        return await asyncio.shield(self._exit_code)
     
     @property
     def exit_code(self) -> ExitCode | None:
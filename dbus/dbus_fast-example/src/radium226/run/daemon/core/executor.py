@@ -1,13 +1,15 @@
 import asyncio
 from asyncio import get_event_loop
-from asyncio.subprocess import Process
+from functools import partial
 import os
 import signal
+from subprocess import Popen
 
 from loguru import logger
 
 from .types import ExecutorConfig
 from .execution import Execution
+from .reaper import Reaper
 from ...shared import ExecutionContext, ExecutionID, FileDescriptor
 
 
@@ -20,8 +22,11 @@ class Executor:
 
     _executions: dict[ExecutionID, Execution] = {}
 
+    _reaper: Reaper
+
     def __init__(self, config: ExecutorConfig):
         self._config = config
+        self._reaper = Reaper()
 
     async def execute(self, context: ExecutionContext) -> Execution:
         loop = get_event_loop()
@@ -30,18 +35,17 @@ class Executor:
         stdout_read_fd, stdout_write_fd = await loop.run_in_executor(None, os.pipe)
         stdin_read_fd, stdin_write_fd = await loop.run_in_executor(None, os.pipe)
 
-        def switch_uid():
-            os.setuid(context.user_id)
-
-        process = await asyncio.create_subprocess_exec(
-            *context.command,
+        # Not through asyncio, whose child watcher would reap the process: our reaper does.
+        process = await loop.run_in_executor(None, partial(
+            Popen,
+            context.command,
             stdin=stdin_read_fd,
             stdout=stdout_write_fd,
             stderr=stderr_write_fd,
             env=context.environment_variables,
             cwd=str(context.current_working_folder_path),
-            preexec_fn=switch_uid,
-        )
+            user=context.user_id,
+        ))
         await loop.run_in_executor(None, os.close, stdout_write_fd)
         await loop.run_in_executor(None, os.close, stderr_write_fd)
 
@@ -56,13 +60,13 @@ class Executor:
     
     async def _create_execution(
         self, 
-        process: Process, 
+        process: Popen[bytes], 
         stdin: FileDescriptor, 
         stdout: FileDescriptor, 
         stderr: FileDescriptor
     ) -> Execution:
         id = len(self._executions) + 1
-        execution = Execution(id=id, process=process, stdin=stdin, stdout=stdout, stderr=stderr)
+        execution = Execution(id=id, process=process, reaper=self._reaper, stdin=stdin, stdout=stdout, stderr=stderr)
         self._executions[id] = execution
         return execution
         
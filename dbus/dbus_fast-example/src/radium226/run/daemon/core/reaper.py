@@ -0,0 +1,37 @@
+import asyncio
+import os
+
+from ...shared import ExitCode
+
+
+class Reaper:
+    """Reap child processes as they exit, watching a pidfd per child on the event loop.
+
+    One reaper is shared by all the executions: each child only costs an fd and a reader, rather
+    than a waiter of asyncio's child watcher, and a pidfd keeps pointing at its process whatever
+    happens to SIGCHLD or to its pid. The exit code is forgotten once the child is reaped, as its
+    pid may then be reused: callers keep the future returned by `watch`.
+    """
+
+    _exits: dict[int, asyncio.Future[ExitCode]]
+
+    def __init__(self) -> None:
+        self._exits = {}
+
+    def watch(self, pid: int) -> asyncio.Future[ExitCode]:
+        exit_code = self._exits.get(pid)
+        if exit_code is None:
+            loop = asyncio.get_running_loop()
+            pidfd = os.pidfd_open(pid)
+            exit_code = self._exits[pid] = loop.create_future()
+            loop.add_reader(pidfd, self._reap, loop, pid, pidfd)
+        return exit_code
+
+    def _reap(self, loop: asyncio.AbstractEventLoop, pid: int, pidfd: int) -> None:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        # The pidfd is readable once the process exited, so this does not block.
+        _, status = os.waitpid(pid, 0)
+        exit_code = self._exits.pop(pid)
+        if not exit_code.done():
+            exit_code.set_result(os.waitstatus_to_exitcode(status))
@@ -114,6 +114,27 @@ async def test_kill(executor: Executor, sh_with_trap_and_for_loop_command: Comma
     assert exit_code == 2
 
 
+async def test_wait_for_from_several_waiters(executor: Executor, sh_with_trap_and_for_loop_command: Command):
+    execution = await executor.execute(context=ExecutionContext(
+        command=sh_with_trap_and_for_loop_command,
+    ))
+    exit_codes = await asyncio.gather(*[execution.wait_for() for _ in range(3)])
+    assert exit_codes == [1, 1, 1]
+    assert execution.exit_code == 1
+
+
+async def test_wait_for_once_exited(executor: Executor):
+    execution = await executor.execute(context=ExecutionContext(
+        command=["true"],
+    ))
+    while execution.exit_code is None:
+        await asyncio.sleep(0.1)
+    assert await execution.wait_for() == 0
+    # Reaped already, so there is nothing left to signal.
+    await execution.kill(signal=SIGTERM)
+    assert await execution.wait_for() == 0
+
+
 async def test_to_write_to_stdin(executor: Executor, tr_command: Command):
     execution = await executor.execute(context=ExecutionContext(
         command=tr_command,
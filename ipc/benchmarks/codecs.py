@@ -0,0 +1,57 @@
+"""Compare the encode/decode cost per message of the CLI codecs.
+
+`trusted` is the decode cost of the same codec without validation, as used by `run --trust-server`.
+
+    uv run python benchmarks/codecs.py
+"""
+
+import timeit
+from collections.abc import Callable
+
+from radium226.studies.ipc.cli.codecs import CODECS, TRUSTED_CODECS
+from radium226.studies.ipc.cli.messages import (
+    CommandNotFound,
+    KillProcess,
+    ProcessKilled,
+    ProcessOutput,
+    ProcessStarted,
+    ProcessTerminated,
+    RunProcess,
+)
+
+_REQUEST_ID = "6f1c1d5e-8f0b-4b7e-9a55-5d6f0c1e2a3b"
+
+MESSAGES = [
+    RunProcess(id=_REQUEST_ID, command="rsync", args=["-a", "--delete", "/srv/data/", "backup:/srv/data/"]),
+    KillProcess(id=_REQUEST_ID, pid=424242, signal=15),
+    ProcessStarted(request_id=_REQUEST_ID, pid=424242),
+    ProcessTerminated(request_id=_REQUEST_ID, exit_code=0),
+    CommandNotFound(request_id=_REQUEST_ID, command="rsync"),
+    ProcessKilled(request_id=_REQUEST_ID, pid=424242),
+    ProcessOutput(request_id=_REQUEST_ID, stream="stdout", data=bytes(range(256)) * 16),
+]
+
+_NUMBER = 20_000
+
+
+def _time_ns(function: Callable[[], object]) -> float:
+    # The best of a few runs, the others being slowed down by whatever else the machine does.
+    return min(timeit.repeat(function, number=_NUMBER, repeat=5)) / _NUMBER * 1e9
+
+
+def main() -> None:
+    print(f"{'message':>18} {'codec':>8} {'size':>6} {'encode':>10} {'decode':>10} {'trusted':>10}")
+    for message in MESSAGES:
+        for name, codec in CODECS.items():
+            trusted_codec = TRUSTED_CODECS[name]
+            data = codec.encode(message)
+            assert codec.decode(data) == message
+            assert trusted_codec.decode(data) == message
+            encode_ns = _time_ns(lambda: codec.encode(message))
+            decode_ns = _time_ns(lambda: codec.decode(data))
+            trusted_ns = _time_ns(lambda: trusted_codec.decode(data))
+            print(f"{type(message).__name__:>18} {name:>8} {len(data):>5}B {encode_ns:>8.0f}ns {decode_ns:>8.0f}ns {trusted_ns:>8.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare NullCharFraming and LengthPrefixedFraming across payload sizes.
+
+Each frame is sent through a pair of connected `Connection`s so the numbers include the
+receive loop that feeds the framing, not only the framing itself.
+
+    uv run python benchmarks/framing.py
+"""
+
+import asyncio
+import socket
+import time
+
+from radium226.studies.ipc.transport import Connection, Frame, Framing, LengthPrefixedFraming, NullCharFraming
+
+PAYLOAD_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000, 4_000_000, 16_000_000]
+
+FRAMINGS: dict[str, Framing] = {
+    "null-char": NullCharFraming(),
+    "length-prefixed": LengthPrefixedFraming(),
+}
+
+_BYTES_PER_SIZE = 64_000_000
+
+
+async def measure(framing: Framing, payload_size: int) -> tuple[int, float]:
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    sender = Connection.from_socket(left, framing)
+    receiver = Connection.from_socket(right, framing)
+    payload = b"x" * payload_size
+    iterations = max(1, min(1_000, _BYTES_PER_SIZE // payload_size))
+
+    async def send() -> None:
+        for _ in range(iterations):
+            await sender.send_frame(Frame(payload))
+
+    try:
+        started_at = time.perf_counter()
+        sending_task = asyncio.create_task(send())
+        for _ in range(iterations):
+            frame = await receiver.receive_frame()
+            assert len(frame.data) == payload_size
+        await sending_task
+        return iterations, time.perf_counter() - started_at
+    finally:
+        await sender.aclose()
+        await receiver.aclose()
+
+
+async def main() -> None:
+    print(f"{'payload':>12} {'framing':>16} {'frames':>7} {'per frame':>12} {'throughput':>12}")
+    for payload_size in PAYLOAD_SIZES:
+        for name, framing in FRAMINGS.items():
+            iterations, elapsed = await measure(framing, payload_size)
+            per_frame_ms = elapsed / iterations * 1_000
+            throughput_mb_s = payload_size * iterations / elapsed / 1_000_000
+            print(f"{payload_size:>12} {name:>16} {iterations:>7} {per_frame_ms:>10.3f}ms {throughput_mb_s:>9.1f}MB/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""Compare the ipc round trips and event throughput on each available event loop.
+
+Runs a few benchmarks of the suite on the default asyncio loop and, when it is installed, on
+uvloop (`uv sync --extra uvloop`):
+
+    uv run python benchmarks/loops.py
+"""
+
+import asyncio
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+
+from loguru import logger
+
+from radium226.studies.ipc.ipc import open_server
+from radium226.studies.ipc.transport import LengthPrefixedFraming
+
+from suite import CODEC, concurrency, events, handle_ping, round_trip
+
+_ITERATIONS = 5_000
+
+
+def _loop_factories() -> dict[str, Callable[[], asyncio.AbstractEventLoop]]:
+    factories: dict[str, Callable[[], asyncio.AbstractEventLoop]] = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop is not installed, only measuring asyncio")
+    else:
+        factories["uvloop"] = uvloop.new_event_loop
+    return factories
+
+
+async def measure() -> dict[str, float]:
+    framing = LengthPrefixedFraming()
+    socket_path = Path(tempfile.mkdtemp()) / "loops.sock"
+    async with open_server(socket_path, CODEC, handler=handle_ping, framing=framing):
+        [latency] = await round_trip(socket_path, framing, _ITERATIONS)
+        event_rates = await events(socket_path, framing, _ITERATIONS)
+        scaling = await concurrency(socket_path, framing, _ITERATIONS)
+    return {
+        "p50_us": latency["p50_us"],
+        "p99_us": latency["p99_us"],
+        "events_per_second": max(result["events_per_second"] for result in event_rates),
+        "requests_per_second": max(result["requests_per_second"] for result in scaling),
+    }
+
+
+def main() -> None:
+    print(f"{'loop':>8} {'p50':>10} {'p99':>10} {'events/s':>10} {'requests/s':>11}")
+    for name, factory in _loop_factories().items():
+        logger.remove()
+        result = asyncio.run(measure(), loop_factory=factory)
+        print(
+            f"{name:>8} {result['p50_us']:>8.0f}us {result['p99_us']:>8.0f}us "
+            f"{result['events_per_second']:>10.0f} {result['requests_per_second']:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
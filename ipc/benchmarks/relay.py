@@ -0,0 +1,100 @@
+"""Compare handing fds over to the process with streaming its output back as events.
+
+Each run asks a server using the CLI's request handler to run `head -c SIZE /dev/zero` and
+waits until all of the output has been read, either from the pipe whose write end was passed
+along with the request, or from the `ProcessOutput` events.
+
+    uv run python benchmarks/relay.py
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from loguru import logger
+
+from radium226.studies.ipc.cli.app import handle_request
+from radium226.studies.ipc.cli.codecs import CODECS
+from radium226.studies.ipc.cli.messages import ProcessOutput, RunProcess
+from radium226.studies.ipc.client import Client
+from radium226.studies.ipc.ipc import open_client, open_server
+from radium226.studies.ipc.protocol import ResponseHandler
+from radium226.studies.ipc.transport import LengthPrefixedFraming
+
+OUTPUT_SIZES = [0, 1_000_000, 16_000_000, 128_000_000]
+
+_RUNS = 5
+
+
+async def _drain(fd: int) -> int:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=1024 * 1024)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0))
+    size = 0
+    try:
+        while chunk := await reader.read(1024 * 1024):
+            size += len(chunk)
+    finally:
+        transport.close()
+    return size
+
+
+async def run_with_fds(client: Client, output_size: int) -> int:
+    read_fd, stdout_fd = os.pipe()
+    fds = [os.open(os.devnull, os.O_RDONLY), stdout_fd, os.dup(stdout_fd)]
+    draining = asyncio.create_task(_drain(read_fd))
+    try:
+        await client.request(
+            RunProcess(id=str(uuid.uuid4()), command="head", args=["-c", str(output_size), "/dev/zero"]),
+            fds=fds,
+        )
+    finally:
+        # Only the process may hold the write end, or the pipe never reaches EOF.
+        for fd in fds:
+            os.close(fd)
+    return await draining
+
+
+async def run_streamed(client: Client, output_size: int) -> int:
+    size = 0
+
+    async def on_event(event: object, fds: list[int]) -> None:
+        nonlocal size
+        if isinstance(event, ProcessOutput):
+            size += len(event.data)
+
+    await client.request(
+        RunProcess(id=str(uuid.uuid4()), command="head", args=["-c", str(output_size), "/dev/zero"], io="stream"),
+        handler=ResponseHandler(on_event=on_event),
+    )
+    return size
+
+
+MODES = {
+    "fds": run_with_fds,
+    "stream": run_streamed,
+}
+
+
+async def main() -> None:
+    logger.remove()
+    socket_path = Path(tempfile.mkdtemp()) / "relay.sock"
+    async with open_server(socket_path, list(CODECS.values()), handler=handle_request, framing=LengthPrefixedFraming()):
+        print(f"{'output':>12} {'codec':>8} {'mode':>7} {'per run':>10} {'throughput':>12}")
+        for output_size in OUTPUT_SIZES:
+            for codec_name, codec in CODECS.items():
+                async with open_client(socket_path, codec, framing=LengthPrefixedFraming()) as client:
+                    for mode, run in MODES.items():
+                        started_at = time.perf_counter()
+                        for _ in range(_RUNS):
+                            assert await run(client, output_size) == output_size
+                        elapsed = (time.perf_counter() - started_at) / _RUNS
+                        throughput_mb_s = output_size / elapsed / 1_000_000
+                        print(f"{output_size:>12} {codec_name:>8} {mode:>7} {elapsed * 1_000:>8.1f}ms {throughput_mb_s:>9.1f}MB/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Compare how long launching a process takes depending on the server's memory usage.
+
+Spawns `true` with each spawner of the CLI's process registry, and with the
+`asyncio.create_subprocess_exec` it used before, while the benchmark holds more and more memory
+to stand for a server whose heap grew over time:
+
+    uv run python benchmarks/spawn.py
+"""
+
+import asyncio
+import os
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+
+from radium226.studies.ipc.cli.processes import ForkServerSpawner, PosixSpawner, ProcessExit
+
+HEAP_SIZES = [0, 512 * 1024 * 1024, 2 * 1024 * 1024 * 1024]
+
+_SPAWNS = 200
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+async def _create_subprocess_exec(stdio: int) -> tuple[float, Awaitable[object]]:
+    started_at = time.perf_counter()
+    process = await asyncio.create_subprocess_exec("true", stdin=stdio, stdout=stdio, stderr=stdio, start_new_session=True)
+    return time.perf_counter() - started_at, process.wait()
+
+
+def _with_spawner(spawner: PosixSpawner | ForkServerSpawner) -> Callable[[int], Awaitable[tuple[float, Awaitable[ProcessExit]]]]:
+    async def spawn(stdio: int) -> tuple[float, Awaitable[ProcessExit]]:
+        started_at = time.perf_counter()
+        _, exited = await spawner.spawn("true", [], stdio, stdio, stdio)
+        return time.perf_counter() - started_at, exited
+
+    return spawn
+
+
+async def measure(heap_size: int) -> dict[str, list[float]]:
+    # Touch every page, so that the memory is actually mapped and has to be accounted for.
+    heap = bytearray(heap_size)
+    heap[::_PAGE_SIZE] = b"\x01" * len(range(0, heap_size, _PAGE_SIZE))
+
+    spawners = {
+        "create_subprocess_exec": _create_subprocess_exec,
+        "posix-spawn": _with_spawner(PosixSpawner()),
+        "fork-server": _with_spawner(ForkServerSpawner()),
+    }
+    stdio = os.open(os.devnull, os.O_RDWR)
+    samples: dict[str, list[float]] = {}
+    try:
+        for name, spawn in spawners.items():
+            # The first spawn starts the fork server.
+            _, exited = await spawn(stdio)
+            await exited
+            samples[name] = []
+            for _ in range(_SPAWNS):
+                elapsed, exited = await spawn(stdio)
+                samples[name].append(elapsed)
+                await exited
+    finally:
+        os.close(stdio)
+    return samples
+
+
+async def main() -> None:
+    logger.remove()
+    print(f"{'heap':>8} {'spawner':>24} {'p50':>10} {'p99':>10}")
+    for heap_size in HEAP_SIZES:
+        for name, samples in (await measure(heap_size)).items():
+            quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+            print(f"{heap_size // (1024 * 1024):>6}MB {name:>24} {quantiles[49] * 1e6:>8.0f}us {quantiles[98] * 1e6:>8.0f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,256 @@
+"""Measure the latency and throughput of `open_server`/`open_client` over a temporary socket.
+
+Every benchmark runs against an in-process server with a minimal handler, so the numbers are
+about the transport, client and server rather than about the work done by requests. Results are
+written as JSON, to compare them between commits:
+
+    uv run python benchmarks/suite.py --output results/$(git rev-parse --short HEAD).json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Literal
+
+import click
+from loguru import logger
+from pydantic import BaseModel, TypeAdapter
+
+from radium226.studies.ipc.client import Client
+from radium226.studies.ipc.ipc import open_client, open_server
+from radium226.studies.ipc.protocol import Codec, Emit, Request, ResponseHandler
+from radium226.studies.ipc.transport import Framing, LengthPrefixedFraming, NullCharFraming
+
+
+class Chunk(BaseModel):
+    request_id: str
+    index: int
+    type: Literal["chunk"] = "chunk"
+
+
+class Pong(BaseModel):
+    request_id: str
+    payload: str = ""
+    type: Literal["pong"] = "pong"
+
+
+class Ping(BaseModel, Request[Pong, Chunk]):
+    id: str
+    payload: str = ""
+    events: int = 0
+    type: Literal["ping"] = "ping"
+
+
+_ADAPTER = TypeAdapter(Ping | Pong | Chunk)
+
+
+def encode(message: Ping | Pong | Chunk) -> bytes:
+    return message.model_dump_json().encode()
+
+
+def decode(data: bytes | memoryview) -> Ping | Pong | Chunk:
+    return _ADAPTER.validate_json(bytes(data))
+
+
+CODEC: Codec[Ping, Chunk, Pong] = Codec(encode=encode, decode=decode)
+
+FRAMINGS: dict[str, Framing] = {framing.name: framing for framing in (NullCharFraming(), LengthPrefixedFraming())}
+
+
+async def handle_ping(request: Ping, fds: list[int], emit: Emit[Chunk]) -> tuple[Pong, list[int]]:
+    for index in range(request.events):
+        await emit(Chunk(request_id=request.id, index=index), [])
+    # Echo the fds back, the way a server handing out resources would.
+    return Pong(request_id=request.id, payload=request.payload), fds
+
+
+def _ping(**fields: Any) -> Ping:
+    return Ping(id=str(uuid.uuid4()), **fields)
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    quantiles = statistics.quantiles(samples, n=1000, method="inclusive")
+    return {
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": quantiles[499] * 1e6,
+        "p90_us": quantiles[899] * 1e6,
+        "p99_us": quantiles[989] * 1e6,
+        "p999_us": quantiles[998] * 1e6,
+        "max_us": max(samples) * 1e6,
+    }
+
+
+async def _time_requests(client: Client, make_request: Callable[[], Awaitable[None]], iterations: int) -> list[float]:
+    for _ in range(min(100, iterations)):
+        await make_request()
+    samples = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        await make_request()
+        samples.append(time.perf_counter() - started_at)
+    return samples
+
+
+async def round_trip(socket_path: Path, framing: Framing, iterations: int) -> list[dict[str, Any]]:
+    async with open_client(socket_path, CODEC, framing=framing) as client:
+        samples = await _time_requests(client, lambda: client.request(_ping()), iterations)
+    return [{"requests": iterations, **_percentiles(samples)}]
+
+
+async def fd_passing(socket_path: Path, framing: Framing, iterations: int) -> list[dict[str, Any]]:
+    results = []
+    async with open_client(socket_path, CODEC, framing=framing) as client:
+        for fd_count in (0, 1, 3, 8):
+            async def request_with_fds() -> None:
+                fds = [os.open(os.devnull, os.O_RDONLY) for _ in range(fd_count)]
+                received: list[int] = []
+
+                async def on_response(response: Pong, response_fds: list[int]) -> None:
+                    received.extend(response_fds)
+
+                try:
+                    await client.request(_ping(), fds=fds, handler=ResponseHandler(on_response=on_response))
+                finally:
+                    for fd in fds + received:
+                        os.close(fd)
+
+            samples = await _time_requests(client, request_with_fds, iterations)
+            results.append({"fds": fd_count, "requests": iterations, **_percentiles(samples)})
+    return results
+
+
+async def events(socket_path: Path, framing: Framing, iterations: int) -> list[dict[str, Any]]:
+    results = []
+    async with open_client(socket_path, CODEC, framing=framing) as client:
+        for event_count in (1_000, 10_000, 100_000):
+            received = 0
+
+            async def on_event(event: Chunk, fds: list[int]) -> None:
+                nonlocal received
+                received += 1
+
+            started_at = time.perf_counter()
+            await client.request(_ping(events=event_count), handler=ResponseHandler(on_event=on_event))
+            elapsed = time.perf_counter() - started_at
+            assert received == event_count
+            results.append({"events": event_count, "seconds": elapsed, "events_per_second": event_count / elapsed})
+    return results
+
+
+async def payload_throughput(socket_path: Path, framing: Framing, iterations: int) -> list[dict[str, Any]]:
+    results = []
+    async with open_client(socket_path, CODEC, framing=framing) as client:
+        for payload_size in (100, 10_000, 1_000_000, 8_000_000):
+            payload = "x" * payload_size
+            count = max(3, min(iterations, 100_000_000 // payload_size))
+            started_at = time.perf_counter()
+            for _ in range(count):
+                await client.request(_ping(payload=payload))
+            elapsed = time.perf_counter() - started_at
+            results.append({
+                "payload_bytes": payload_size,
+                "requests": count,
+                "seconds": elapsed,
+                # The payload travels both ways.
+                "megabytes_per_second": 2 * payload_size * count / elapsed / 1e6,
+            })
+    return results
+
+
+async def concurrency(socket_path: Path, framing: Framing, iterations: int) -> list[dict[str, Any]]:
+    results = []
+    for client_count in (1, 4, 16):
+        for in_flight in (1, 16, 128):
+            requests_per_client = max(in_flight, iterations // client_count)
+
+            async def run_client() -> None:
+                async with open_client(socket_path, CODEC, framing=framing) as client:
+                    remaining = requests_per_client
+
+                    async def worker() -> None:
+                        nonlocal remaining
+                        while remaining > 0:
+                            remaining -= 1
+                            await client.request(_ping())
+
+                    await asyncio.gather(*(worker() for _ in range(in_flight)))
+
+            started_at = time.perf_counter()
+            await asyncio.gather(*(run_client() for _ in range(client_count)))
+            elapsed = time.perf_counter() - started_at
+            total = requests_per_client * client_count
+            results.append({
+                "clients": client_count,
+                "in_flight_per_client": in_flight,
+                "requests": total,
+                "seconds": elapsed,
+                "requests_per_second": total / elapsed,
+            })
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[Path, Framing, int], Awaitable[list[dict[str, Any]]]]] = {
+    "round_trip": round_trip,
+    "fd_passing": fd_passing,
+    "events": events,
+    "payload_throughput": payload_throughput,
+    "concurrency": concurrency,
+}
+
+
+def _environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+async def run_suite(names: list[str], framing_names: list[str], iterations: int) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    socket_path = Path(tempfile.mkdtemp()) / "suite.sock"
+    for framing_name in framing_names:
+        framing = FRAMINGS[framing_name]
+        async with open_server(socket_path, CODEC, handler=handle_ping, framing=framing):
+            for name in names:
+                logger.info("Running {} with {} framing", name, framing_name)
+                for measurement in await BENCHMARKS[name](socket_path, framing, iterations):
+                    results.append({"benchmark": name, "framing": framing_name, **measurement})
+    return {"environment": _environment(), "iterations": iterations, "results": results}
+
+
+@click.command()
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path), default=None, help="Write the results there instead of stdout.")
+@click.option("--benchmark", "names", multiple=True, type=click.Choice(list(BENCHMARKS)), default=list(BENCHMARKS), show_default=True)
+@click.option("--framing", "framing_names", multiple=True, type=click.Choice(list(FRAMINGS)), default=list(FRAMINGS), show_default=True)
+@click.option("--iterations", type=click.IntRange(min=1), default=5_000, show_default=True, help="Requests per measurement.")
+def main(output: Path | None, names: tuple[str, ...], framing_names: tuple[str, ...], iterations: int) -> None:
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"] == "__main__")
+    report = asyncio.run(run_suite(list(names), list(framing_names), iterations))
+    text = json.dumps(report, indent=2)
+    if output is None:
+        click.echo(text)
+    else:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
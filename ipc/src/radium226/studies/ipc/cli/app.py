@@ -1,174 +1,414 @@
 import asyncio
+import json
 import os
+import shlex
 import signal
 import sys
+import time
 import uuid
+from contextlib import suppress
+from functools import partial
 from pathlib import Path
 
 import click
 from loguru import logger
 
-from ..ipc import open_server, open_client
-from ..protocol import ResponseHandler, Emit, Codec
-from .messages import RunProcess, KillProcess, ProcessTerminated, CommandNotFound, ProcessKilled, ProcessStarted, Response, Event
+from ..ipc import open_server, open_client, open_supervisor
+from ..metrics import NULL_METRICS, InMemoryMetrics
+from ..protocol import ResponseHandler, Emit
+from ..server import Limits
+from ..transport import Framing, LengthPrefixedFraming, NullCharFraming
+from .codecs import CODECS, TRUSTED_CODECS
+from .messages import (
+    RunProcess,
+    KillProcess,
+    ListProcesses,
+    ProcessTerminated,
+    CommandNotFound,
+    ProcessKilled,
+    ProcessNotFound,
+    ProcessInfo,
+    ProcessList,
+    ProcessStarted,
+    ProcessOutput,
+    RequestFailed,
+    Event,
+)
+from .processes import ForkServerSpawner, PosixSpawner, ProcessRegistry, RunningProcess, Spawner
+from .signals import SignalForwarder
 
-from pydantic import Discriminator, TypeAdapter
-from typing import Annotated, Never
+from typing import Any, Coroutine, Literal, Never
 
 _DEFAULT_SOCKET_PATH = Path("/tmp/radium226-studies-ipc.sock")
 
+# In order of preference, fastest first.
+_FRAMINGS: dict[str, Framing] = {
+    framing.name: framing for framing in (LengthPrefixedFraming(), NullCharFraming())
+}
 
-async def async_noop(*_args: object) -> None:
-    pass
 
-_TYPE_ADAPTER = TypeAdapter(
-    Annotated[
-        RunProcess | KillProcess | ProcessStarted | ProcessTerminated | CommandNotFound | ProcessKilled,
-        Discriminator("type"),
-    ]
-)
+# Output is relayed in events of up to this many bytes, sent at the latest this long after their
+# first byte was read: large enough to amortize the per-event cost, short enough to stay interactive.
+_OUTPUT_BATCH_SIZE = 64 * 1024
 
+_OUTPUT_BATCH_WINDOW = 0.005
 
-def encode(message: RunProcess | KillProcess | Event | Response) -> bytes:
-    return message.model_dump_json().encode()
 
+_LOOPS = ["asyncio", "uvloop"]
 
-def decode(data: bytes) -> RunProcess | KillProcess | Event | Response:
-    return _TYPE_ADAPTER.validate_json(data.decode())
+_SPAWNERS: dict[str, type[Spawner]] = {
+    "posix-spawn": PosixSpawner,
+    "fork-server": ForkServerSpawner,
+}
 
 
-CODEC = Codec[RunProcess | KillProcess, ProcessStarted, ProcessTerminated | CommandNotFound | ProcessKilled](
-    encode=encode,
-    decode=decode,
-)
+def _run[T](coroutine: Coroutine[Any, Any, T], loop_name: str) -> T:
+    if loop_name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            coroutine.close()
+            raise click.UsageError("uvloop is not installed, install the uvloop extra to use it")
+        return asyncio.run(coroutine, loop_factory=uvloop.new_event_loop)
+    return asyncio.run(coroutine)
 
 
-@click.group()
-def app() -> None:
+async def async_noop(*_args: object) -> None:
     pass
 
 
-@app.command("start-server")
-@click.option("--socket-path", default=_DEFAULT_SOCKET_PATH, type=click.Path(path_type=Path), show_default=True)
-def start_server(socket_path: Path) -> None:
-    async def handler(request: RunProcess | KillProcess, fds: list[int], emit: Emit[Event]) -> tuple[ProcessTerminated | CommandNotFound | ProcessKilled, list[int]]:
-        match request:
-            case RunProcess(id=id, command=command, args=args):
-                if len(fds) < 3:
-                    raise ValueError(f"Expected 3 file descriptors (stdin, stdout, stderr), got {len(fds)}")
-
-                stdin_fd, stdout_fd, stderr_fd = fds[0], fds[1], fds[2]
-
-                try:
-                    process = await asyncio.create_subprocess_exec(
-                        command, *args,
-                        stdin=stdin_fd,
-                        stdout=stdout_fd,
-                        stderr=stderr_fd,
-                        start_new_session=True,
-                    )
-                except FileNotFoundError:
-                    os.close(stdin_fd)
-                    os.close(stdout_fd)
-                    os.close(stderr_fd)
-                    return CommandNotFound(request_id=id, command=command), []
-
-                await emit(ProcessStarted(pid=process.pid), [])
+async def _relay_output(request_id: str, name: Literal["stdout", "stderr"], reader: asyncio.StreamReader, emit: Emit[Event]) -> None:
+    while chunk := await reader.read(_OUTPUT_BATCH_SIZE):
+        batch = bytearray(chunk)
+        with suppress(TimeoutError):
+            async with asyncio.timeout(_OUTPUT_BATCH_WINDOW):
+                while len(batch) < _OUTPUT_BATCH_SIZE:
+                    if not (chunk := await reader.read(_OUTPUT_BATCH_SIZE - len(batch))):
+                        break
+                    batch += chunk
+        # Waits while the client is not keeping up, which stops reading and fills the pipe.
+        await emit(ProcessOutput(request_id=request_id, stream=name, data=bytes(batch)), [])
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+async def _open_reader(fd: int) -> tuple[asyncio.StreamReader, asyncio.BaseTransport]:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_OUTPUT_BATCH_SIZE)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0))
+    return reader, transport
+
+
+async def _wait_for_exit(process: RunningProcess) -> ProcessTerminated | RequestFailed:
+    try:
+        # Shielded, so that the registry still gets the exit status once we stop waiting.
+        process_exit = await asyncio.shield(process.exited)
+    except ConnectionError as e:
+        # The fork server died, taking the process down with it.
+        logger.warning("Lost track of process {} ({}): {}", process.pid, process.command, e)
+        return RequestFailed(request_id=process.request_id, reason=f"Lost track of the process: {e}")
+    except asyncio.CancelledError:
+        # The client gave up on the request, so the process has nobody to report to.
+        logger.info("Request {} cancelled, terminating process group {}", process.request_id, process.pid)
+        with suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGTERM)
+        raise
+    logger.info(
+        "Process {} ({}) exited with code {} after {:.3f}s, using {:.3f}s of user and {:.3f}s of system CPU time and {} KiB of memory",
+        process.pid, process.command, process_exit.exit_code, process_exit.wall_seconds,
+        process_exit.user_cpu_seconds, process_exit.system_cpu_seconds, process_exit.max_rss_kib,
+    )
+    return ProcessTerminated(
+        request_id=process.request_id,
+        exit_code=process_exit.exit_code,
+        wall_seconds=process_exit.wall_seconds,
+        user_cpu_seconds=process_exit.user_cpu_seconds,
+        system_cpu_seconds=process_exit.system_cpu_seconds,
+        max_rss_kib=process_exit.max_rss_kib,
+    )
+
+
+def _spawn_failed(request_id: str, command: str, error: OSError) -> CommandNotFound | RequestFailed:
+    if isinstance(error, FileNotFoundError):
+        return CommandNotFound(request_id=request_id, command=command)
+    logger.warning("Failed to spawn {}: {}", command, error)
+    return RequestFailed(request_id=request_id, reason=f"Failed to spawn {command}: {error}")
+
+
+# The processes started by this server, which is one per worker process.
+_PROCESSES = ProcessRegistry()
+
+
+async def handle_request(
+    request: RunProcess | KillProcess | ListProcesses,
+    fds: list[int],
+    emit: Emit[Event],
+    processes: ProcessRegistry = _PROCESSES,
+) -> tuple[ProcessTerminated | CommandNotFound | ProcessKilled | ProcessNotFound | ProcessList | RequestFailed, list[int]]:
+    match request:
+        case RunProcess(id=id, command=command, args=args, io="stream"):
+            stdout_fd, stdout_write_fd = os.pipe()
+            stderr_fd, stderr_write_fd = os.pipe()
+            stdin_fd = os.open(os.devnull, os.O_RDONLY)
+            try:
+                process = await processes.spawn(id, command, args, stdin_fd, stdout_write_fd, stderr_write_fd)
+            except OSError as e:
+                os.close(stdout_fd)
+                os.close(stderr_fd)
+                return _spawn_failed(id, command, e), []
+            finally:
+                # Only the process may hold the write ends, or the pipes never reach EOF.
+                os.close(stdin_fd)
+                os.close(stdout_write_fd)
+                os.close(stderr_write_fd)
+
+            await emit(ProcessStarted(request_id=id, pid=process.pid), [])
+
+            stdout, stdout_transport = await _open_reader(stdout_fd)
+            stderr, stderr_transport = await _open_reader(stderr_fd)
+            try:
+                # Relay all the output before answering, so it reaches the client first.
+                _, _, response = await asyncio.gather(
+                    _relay_output(id, "stdout", stdout, emit),
+                    _relay_output(id, "stderr", stderr, emit),
+                    _wait_for_exit(process),
+                )
+            finally:
+                stdout_transport.close()
+                stderr_transport.close()
+            return response, []
+
+        case RunProcess(id=id, command=command, args=args):
+            if len(fds) < 3:
+                raise ValueError(f"Expected 3 file descriptors (stdin, stdout, stderr), got {len(fds)}")
+
+            stdin_fd, stdout_fd, stderr_fd = fds[0], fds[1], fds[2]
 
+            try:
+                process = await processes.spawn(id, command, args, stdin_fd, stdout_fd, stderr_fd)
+            except OSError as e:
+                return _spawn_failed(id, command, e), []
+            finally:
                 os.close(stdin_fd)
                 os.close(stdout_fd)
                 os.close(stderr_fd)
 
-                await process.wait()
+            await emit(ProcessStarted(request_id=id, pid=process.pid), [])
+
+            return await _wait_for_exit(process), []
+
+        case KillProcess(id=id, pid=pid, signal=sig):
+            # Only signal our own children: any other pid could belong to anyone, or be reused.
+            if processes.get(pid) is None:
+                if not processes.exhaustive:
+                    logger.warning("Refusing to kill process {}, which was not started by this worker", pid)
+                    return RequestFailed(
+                        request_id=id,
+                        reason=f"Process {pid} was not started by the worker serving this connection, and only that worker can signal it",
+                    ), []
+                logger.warning("Refusing to kill process {}, which was not started by this server", pid)
+                return ProcessNotFound(request_id=id, pid=pid), []
+            logger.info("Killing process group {} with signal {}", pid, signal.Signals(sig).name)
+            # Each process leads a session of its own, so its process group id is its pid.
+            with suppress(ProcessLookupError):
+                os.killpg(pid, sig)
+            return ProcessKilled(request_id=id, pid=pid), []
+
+        case ListProcesses(id=id):
+            if not processes.exhaustive:
+                return RequestFailed(request_id=id, reason="Listing processes is not supported with several workers, which each only know their own"), []
+            return ProcessList(
+                request_id=id,
+                processes=[
+                    ProcessInfo(request_id=process.request_id, pid=process.pid, command=process.command, args=process.args, started_at=process.started_at)
+                    for process in processes.processes
+                ],
+            ), []
+
+        case _:
+            raise ValueError(f"Unknown request: {request}")
 
-                return ProcessTerminated(request_id=id, exit_code=process.returncode or 0), []
 
-            case KillProcess(id=id, pid=pid, signal=sig):
-                logger.info("Killing process group {} with signal {}", pid, signal.Signals(sig).name)
-                os.killpg(os.getpgid(pid), sig)
-                return ProcessKilled(request_id=id, pid=pid), []
+@click.group()
+def app() -> None:
+    pass
 
-            case _:
-                raise ValueError(f"Unknown request: {request}")
 
-    async def run() -> None:
-        async with open_server(socket_path, CODEC, handler=handler) as server:
-            await server.wait_forever()
+@app.command("start-server")
+@click.option("--socket-path", default=_DEFAULT_SOCKET_PATH, type=click.Path(path_type=Path), show_default=True)
+@click.option("--loop", "loop_name", default="asyncio", type=click.Choice(_LOOPS), show_default=True, help="Event loop implementation to run on.")
+@click.option("--framing", "framing_names", multiple=True, default=list(_FRAMINGS), type=click.Choice(list(_FRAMINGS)), show_default=True, help="Framing to support, repeat in order of preference.")
+@click.option("--codec", "codec_names", multiple=True, default=list(CODECS), type=click.Choice(list(CODECS)), show_default=True, help="Codec to support, repeat in order of preference.")
+@click.option("--max-concurrent-requests", type=click.IntRange(min=1), default=None, help="Requests handled at once across all clients.")
+@click.option("--max-concurrent-requests-per-connection", type=click.IntRange(min=1), default=None, help="Requests handled at once for a single client.")
+@click.option("--max-outstanding-requests-per-connection", type=click.IntRange(min=1), default=None, help="Requests handled or waiting for a slot per client, beyond which its requests are queued.")
+@click.option("--workers", "worker_count", type=click.IntRange(min=1), default=1, show_default=True, help="Processes handling connections, handed over by a supervisor when more than one. Each only knows the processes it started: listing processes is then refused, and so is killing one from another connection than the one that ran it.")
+@click.option("--metrics-interval", type=click.FloatRange(min=0, min_open=True), default=None, help="Log the server metrics every this many seconds.")
+@click.option("--spawner", "spawner_name", default="posix-spawn", type=click.Choice(list(_SPAWNERS)), show_default=True, help="Spawn processes from the server itself, or from a small helper process.")
+def start_server(
+    socket_path: Path,
+    framing_names: tuple[str, ...],
+    codec_names: tuple[str, ...],
+    max_concurrent_requests: int | None,
+    max_concurrent_requests_per_connection: int | None,
+    max_outstanding_requests_per_connection: int | None,
+    worker_count: int,
+    metrics_interval: float | None,
+    spawner_name: str,
+    loop_name: str,
+) -> None:
+    if worker_count > 1 and metrics_interval is not None:
+        raise click.UsageError("--metrics-interval is not supported with --workers yet")
+
+    async def log_metrics(metrics: InMemoryMetrics, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Metrics: {}", json.dumps(metrics.snapshot()))
 
-    asyncio.run(run())
+    async def run() -> None:
+        limits = Limits(
+            max_concurrent_requests=max_concurrent_requests,
+            max_concurrent_requests_per_connection=max_concurrent_requests_per_connection,
+            max_outstanding_requests_per_connection=max_outstanding_requests_per_connection,
+        )
+        codecs = [CODECS[name] for name in codec_names]
+        framings = [_FRAMINGS[name] for name in framing_names]
+        # Workers get a copy of the registry, which starts its spawner there on first use.
+        handler = partial(handle_request, processes=ProcessRegistry(_SPAWNERS[spawner_name](), exhaustive=worker_count == 1))
+        if worker_count > 1:
+            async with open_supervisor(socket_path, codecs, handler=handler, worker_count=worker_count, framing=framings, limits=limits) as supervisor:
+                await supervisor.wait_forever()
+            return
+
+        metrics = InMemoryMetrics()
+        async with open_server(socket_path, codecs, handler=handler, framing=framings, limits=limits, metrics=NULL_METRICS if metrics_interval is None else metrics) as server:
+            if metrics_interval is None:
+                await server.wait_forever()
+            else:
+                await log_metrics(metrics, metrics_interval)
+
+    _run(run(), loop_name)
 
 
 @app.command("run")
 @click.argument("command")
 @click.argument("args", nargs=-1)
 @click.option("--socket-path", default=_DEFAULT_SOCKET_PATH, type=click.Path(path_type=Path), show_default=True)
-def run_process(command: str, args: tuple[str, ...], socket_path: Path) -> None:
+@click.option("--loop", "loop_name", default="asyncio", type=click.Choice(_LOOPS), show_default=True, help="Event loop implementation to run on.")
+@click.option("--framing", "framing_names", multiple=True, default=list(_FRAMINGS), type=click.Choice(list(_FRAMINGS)), show_default=True, help="Framing to support, repeat in order of preference.")
+@click.option("--codec", "codec_names", multiple=True, default=list(CODECS), type=click.Choice(list(CODECS)), show_default=True, help="Codec to support, repeat in order of preference.")
+@click.option("--timeout", type=click.FloatRange(min=0, min_open=True), default=None, help="Seconds after which the process is terminated and the command gives up.")
+@click.option("--io", type=click.Choice(["fds", "stream"]), default="fds", show_default=True, help="Hand our stdin/stdout/stderr over to the process, or have its output streamed back (without stdin).")
+@click.option("--trust-server", is_flag=True, default=False, help="Skip validating the messages received from the server.")
+@click.option("--kill-timeout", type=click.FloatRange(min=0), default=10.0, show_default=True, help="Seconds after forwarding SIGTERM before sending SIGKILL to a process still running.")
+def run_process(command: str, args: tuple[str, ...], socket_path: Path, framing_names: tuple[str, ...], codec_names: tuple[str, ...], timeout: float | None, io: Literal["fds", "stream"], loop_name: str, trust_server: bool, kill_timeout: float) -> None:
     exit_code = 0
+    codecs = TRUSTED_CODECS if trust_server else CODECS
 
     async def run() -> int:
-        async with open_client(socket_path, CODEC) as client:
-            stdin_fd = os.dup(0)
-            stdout_fd = os.dup(1)
-            stderr_fd = os.dup(2)
+        async with open_client(socket_path, [codecs[name] for name in codec_names], framing=[_FRAMINGS[name] for name in framing_names]) as client:
+            fds = [os.dup(0), os.dup(1), os.dup(2)] if io == "fds" else []
 
-            pid: int | None = None
-            pending_signals: list[signal.Signals] = []
             result_exit_code = 0
             loop = asyncio.get_running_loop()
 
-            def _send_kill(target_pid: int, sig: signal.Signals) -> None:
-                asyncio.create_task(
-                    client.request(
-                        KillProcess(id=str(uuid.uuid4()), pid=target_pid, signal=sig),
-                        handler=ResponseHandler[Never, ProcessKilled](
-                            on_response=async_noop,
-                        ),
-                        fds=[],
-                    )
+            async def send_kill(target_pid: int, sig: signal.Signals) -> None:
+                await client.request(
+                    KillProcess(id=str(uuid.uuid4()), pid=target_pid, signal=sig),
+                    handler=ResponseHandler[Never, ProcessKilled | ProcessNotFound | RequestFailed](
+                        on_response=async_noop,
+                    ),
+                    fds=[],
                 )
 
-            def forward_signal(sig: signal.Signals) -> None:
-                if pid is not None:
-                    _send_kill(pid, sig)
-                else:
-                    pending_signals.append(sig)
+            def on_escalate() -> None:
+                click.echo(f"[signal] Process still running {kill_timeout}s after SIGTERM, sending SIGKILL", err=True)
 
+            forwarder = SignalForwarder(send_kill, kill_timeout, on_escalate)
             for sig in (signal.SIGINT, signal.SIGTERM):
-                loop.add_signal_handler(sig, forward_signal, sig)
-
-            async def on_event(event: ProcessStarted, fds: list[int]) -> None:
-                nonlocal pid
-                pid = event.pid
-                click.echo(f"[event] Process started with PID {event.pid}", err=True)
-                for queued_sig in pending_signals:
-                    _send_kill(pid, queued_sig)
-                pending_signals.clear()
-
-            async def on_response(response: ProcessTerminated | CommandNotFound, fds: list[int]) -> None:
+                loop.add_signal_handler(sig, forwarder.forward, sig)
+
+            async def on_event(event: ProcessStarted | ProcessOutput, fds: list[int]) -> None:
+                match event:
+                    case ProcessStarted(pid=started_pid):
+                        click.echo(f"[event] Process started with PID {started_pid}", err=True)
+                        forwarder.start(started_pid)
+                    case ProcessOutput(stream=stream, data=data):
+                        # Written off the loop, and awaited so that the server slows down with us.
+                        await asyncio.to_thread(_write_all, 1 if stream == "stdout" else 2, data)
+
+            async def on_response(response: ProcessTerminated | CommandNotFound | RequestFailed, fds: list[int]) -> None:
                 nonlocal result_exit_code
                 match response:
-                    case ProcessTerminated(exit_code=exit_code):
-                        click.echo(f"[response] Process terminated with exit code {exit_code}", err=True)
+                    case ProcessTerminated(exit_code=exit_code, wall_seconds=wall_seconds, user_cpu_seconds=user_cpu_seconds, system_cpu_seconds=system_cpu_seconds, max_rss_kib=max_rss_kib):
+                        usage = ""
+                        if wall_seconds is not None:
+                            usage = f" after {wall_seconds:.3f}s (user {user_cpu_seconds:.3f}s, system {system_cpu_seconds:.3f}s, max RSS {max_rss_kib} KiB)"
+                        click.echo(f"[response] Process terminated with exit code {exit_code}{usage}", err=True)
                         result_exit_code = exit_code
                     case CommandNotFound(command=cmd):
                         click.echo(f"[response] Command not found: {cmd}", err=True)
                         result_exit_code = 127
+                    case RequestFailed(reason=reason):
+                        click.echo(f"[response] Request failed: {reason}", err=True)
+                        result_exit_code = 125
 
+            deadline = time.time() + timeout if timeout is not None else None
             try:
                 await client.request(
-                    RunProcess(id=str(uuid.uuid4()), command=command, args=list(args)),
-                    handler=ResponseHandler[ProcessStarted, ProcessTerminated | CommandNotFound](
+                    RunProcess(id=str(uuid.uuid4()), command=command, args=list(args), io=io, deadline=deadline),
+                    handler=ResponseHandler[ProcessStarted | ProcessOutput, ProcessTerminated | CommandNotFound | RequestFailed](
                         on_response=on_response,
                         on_event=on_event,
                     ),
-                    fds=[stdin_fd, stdout_fd, stderr_fd],
+                    fds=fds,
                 )
+            except TimeoutError:
+                click.echo(f"[timeout] Gave up after {timeout}s", err=True)
+                result_exit_code = 124
             finally:
                 for sig in (signal.SIGINT, signal.SIGTERM):
                     loop.remove_signal_handler(sig)
+                await forwarder.aclose()
 
             return result_exit_code
 
-    exit_code = asyncio.run(run())
+    exit_code = _run(run(), loop_name)
     if exit_code != 0:
         sys.exit(exit_code)
+
+
+@app.command("list-processes")
+@click.option("--socket-path", default=_DEFAULT_SOCKET_PATH, type=click.Path(path_type=Path), show_default=True)
+@click.option("--framing", "framing_names", multiple=True, default=list(_FRAMINGS), type=click.Choice(list(_FRAMINGS)), show_default=True, help="Framing to support, repeat in order of preference.")
+@click.option("--codec", "codec_names", multiple=True, default=list(CODECS), type=click.Choice(list(CODECS)), show_default=True, help="Codec to support, repeat in order of preference.")
+def list_processes(socket_path: Path, framing_names: tuple[str, ...], codec_names: tuple[str, ...]) -> None:
+    processes: list[ProcessInfo] = []
+    failure: str | None = None
+
+    async def on_response(response: ProcessList | RequestFailed, fds: list[int]) -> None:
+        nonlocal failure
+        match response:
+            case ProcessList():
+                processes.extend(response.processes)
+            case RequestFailed(reason=reason):
+                failure = reason
+
+    async def run() -> None:
+        async with open_client(socket_path, [CODECS[name] for name in codec_names], framing=[_FRAMINGS[name] for name in framing_names]) as client:
+            await client.request(
+                ListProcesses(id=str(uuid.uuid4())),
+                handler=ResponseHandler[Never, ProcessList | RequestFailed](on_response=on_response),
+            )
+
+    asyncio.run(run())
+    if failure is not None:
+        raise click.ClickException(failure)
+    now = time.time()
+    click.echo(f"{'PID':>8} {'ELAPSED':>10}  {'REQUEST':<36}  COMMAND")
+    for process in processes:
+        click.echo(f"{process.pid:>8} {now - process.started_at:>9.1f}s  {process.request_id:<36}  {shlex.join([process.command, *process.args])}")
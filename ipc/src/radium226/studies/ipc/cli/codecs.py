@@ -0,0 +1,201 @@
+from collections.abc import Callable
+from typing import Annotated
+
+import msgpack
+from pydantic import BaseModel, Discriminator, TypeAdapter
+
+from ..protocol import Codec
+from .messages import (
+    RunProcess,
+    KillProcess,
+    ListProcesses,
+    Cancel,
+    ProcessTerminated,
+    CommandNotFound,
+    ProcessKilled,
+    ProcessNotFound,
+    ProcessList,
+    ProcessStarted,
+    ProcessOutput,
+    RequestFailed,
+    Response,
+    Event,
+)
+
+type Message = RunProcess | KillProcess | ListProcesses | Cancel | Event | Response
+
+type CliCodec = Codec[
+    RunProcess | KillProcess | ListProcesses,
+    ProcessStarted | ProcessOutput,
+    ProcessTerminated | CommandNotFound | ProcessKilled | ProcessNotFound | ProcessList | RequestFailed,
+]
+
+
+_TYPE_ADAPTER = TypeAdapter(
+    Annotated[
+        RunProcess | KillProcess | ListProcesses | Cancel | ProcessStarted | ProcessOutput | ProcessTerminated | CommandNotFound | ProcessKilled | ProcessNotFound | ProcessList | RequestFailed,
+        Discriminator("type"),
+    ]
+)
+
+
+def cancel(request_id: str) -> Cancel:
+    return Cancel(cancelled_id=request_id)
+
+
+def encode_json(message: Message) -> bytes:
+    return message.model_dump_json().encode()
+
+
+def decode_json(data: bytes | memoryview) -> Message:
+    return _TYPE_ADAPTER.validate_json(bytes(data))
+
+
+JSON_CODEC: CliCodec = Codec(
+    encode=encode_json,
+    decode=decode_json,
+    name="json",
+    cancel=cancel,
+)
+
+
+# Messages travel as `[tag, *field values]`: the integer tag replaces the `type` string and the
+# field names are implied by their position. Tags must never be reused.
+_MESSAGE_TYPES: dict[int, type[BaseModel]] = {
+    1: RunProcess,
+    2: KillProcess,
+    3: ProcessStarted,
+    4: ProcessTerminated,
+    5: CommandNotFound,
+    6: ProcessKilled,
+    7: Cancel,
+    8: ProcessOutput,
+    9: ListProcesses,
+    10: ProcessList,
+    11: ProcessNotFound,
+    12: RequestFailed,
+}
+
+_TAGS: dict[type[BaseModel], int] = {message_type: tag for tag, message_type in _MESSAGE_TYPES.items()}
+
+# The position of each field on the wire, spelled out rather than taken from the order of the
+# model's fields, which moves whenever a field is added to a base class. Only ever append to these,
+# and bump `PROTOCOL_VERSION` in the handshake whenever they change.
+_FIELD_NAMES: dict[type[BaseModel], tuple[str, ...]] = {
+    RunProcess: ("id", "command", "args", "deadline", "io"),
+    KillProcess: ("id", "pid", "signal", "deadline"),
+    ProcessStarted: ("pid", "request_id"),
+    ProcessTerminated: ("request_id", "exit_code", "wall_seconds", "user_cpu_seconds", "system_cpu_seconds", "max_rss_kib"),
+    CommandNotFound: ("request_id", "command"),
+    ProcessKilled: ("request_id", "pid"),
+    Cancel: ("cancelled_id",),
+    ProcessOutput: ("request_id", "stream", "data"),
+    ListProcesses: ("id", "deadline"),
+    ProcessList: ("request_id", "processes"),
+    ProcessNotFound: ("request_id", "pid"),
+    RequestFailed: ("request_id", "reason"),
+}
+
+for _message_type, _field_names in _FIELD_NAMES.items():
+    if set(_field_names) != _message_type.model_fields.keys() - {"type"}:
+        raise TypeError(f"The wire layout of {_message_type.__name__} does not match its fields: {_field_names}")
+
+# What decoding a message needs, per tag: the validator of its model, which `model_validate` would
+# look up for each message, and the names of its fields.
+_DECODERS: dict[int, tuple[Callable[[dict[str, object]], Message], tuple[str, ...]]] = {
+    tag: (message_type.__pydantic_validator__.validate_python, _FIELD_NAMES[message_type])
+    for tag, message_type in _MESSAGE_TYPES.items()
+}
+
+_TYPE_NAMES: dict[type[BaseModel], str] = {
+    message_type: message_type.model_fields["type"].default for message_type in _MESSAGE_TYPES.values()
+}
+
+_FIELD_COUNTS: dict[type[BaseModel], int] = {
+    message_type: len(message_type.model_fields) for message_type in _MESSAGE_TYPES.values()
+}
+
+
+# Messages nesting models, which arrive as dicts and need validating to become models again.
+_NESTING_TYPES: set[type[BaseModel]] = {ProcessList}
+
+
+def _construct[ModelT: BaseModel](model_type: type[ModelT], fields: dict[str, object]) -> ModelT:
+    # What `model_construct` does, without looking up defaults and aliases field by field, which
+    # makes it slower than validating. Our encoders write every field, so a frame missing some
+    # comes from another version of the peer and is validated instead.
+    if len(fields) != _FIELD_COUNTS[model_type] or model_type in _NESTING_TYPES:
+        return model_type.model_validate(fields)
+    message = model_type.__new__(model_type)
+    _set = object.__setattr__
+    _set(message, "__dict__", fields)
+    _set(message, "__pydantic_fields_set__", set(fields))
+    _set(message, "__pydantic_extra__", None)
+    _set(message, "__pydantic_private__", None)
+    return message
+
+
+def _pack_default(value: object) -> object:
+    # Field values are packed as they are; only nested models need converting.
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Cannot pack {type(value).__name__}")
+
+
+_PACKER = msgpack.Packer(default=_pack_default)
+
+
+def encode_msgpack(message: Message) -> bytes:
+    message_type = type(message)
+    return _PACKER.pack([_TAGS[message_type], *(getattr(message, name) for name in _FIELD_NAMES[message_type])])
+
+
+def decode_msgpack(data: bytes | memoryview) -> Message:
+    tag, *values = msgpack.unpackb(data)
+    validate, field_names = _DECODERS[tag]
+    return validate(dict(zip(field_names, values)))
+
+
+def decode_msgpack_trusted(data: bytes | memoryview) -> Message:
+    tag, *values = msgpack.unpackb(data)
+    message_type = _MESSAGE_TYPES[tag]
+    fields = dict(zip(_FIELD_NAMES[message_type], values))
+    fields["type"] = _TYPE_NAMES[message_type]
+    return _construct(message_type, fields)
+
+
+MSGPACK_CODEC: CliCodec = Codec(
+    encode=encode_msgpack,
+    decode=decode_msgpack,
+    name="msgpack",
+    binary=True,
+    cancel=cancel,
+    min_version=2,
+)
+
+TRUSTED_MSGPACK_CODEC: CliCodec = Codec(
+    encode=encode_msgpack,
+    decode=decode_msgpack_trusted,
+    name="msgpack",
+    binary=True,
+    cancel=cancel,
+    min_version=2,
+)
+
+
+# In order of preference. JSON comes first: pydantic-core parses and validates it in one pass,
+# which decodes the small messages most requests exchange faster than unpacking msgpack and then
+# validating the values (see benchmarks/codecs.py). msgpack carries bytes as they are rather than
+# as base64, which makes it far faster for output relayed with `--io stream`: a server relaying
+# large outputs can prefer it with `--codec msgpack --codec json`.
+CODECS: dict[str, CliCodec] = {
+    codec.name: codec for codec in (JSON_CODEC, MSGPACK_CODEC)
+}
+
+# The same codecs, building the messages they receive without validating them: only for peers
+# that are trusted to send well-formed messages, i.e. for clients of our own server. JSON keeps
+# validating: pydantic-core parses and validates it in one pass, dispatching on `type`, which is
+# as fast as parsing it to a dict and constructing the message from there.
+TRUSTED_CODECS: dict[str, CliCodec] = {
+    codec.name: codec for codec in (JSON_CODEC, TRUSTED_MSGPACK_CODEC)
+}
@@ -0,0 +1,93 @@
+"""The helper process of `ForkServerSpawner`, which spawns processes on behalf of the server.
+
+It is run as a script, not imported, so that it only loads a few modules of the standard library
+and stays small for as long as it lives, however large the server grows. It talks to the server
+over a `SOCK_SEQPACKET` socket, one JSON message per packet:
+
+- The server sends `{"id": ..., "argv": [...]}` along with the stdin, stdout and stderr fds.
+- The helper answers `{"id": ..., "pid": ...}`, or `{"id": ..., "errno": ...}` if spawning failed.
+- Once a process exits, the helper reaps it and sends `{"pid": ..., "exit_code": ..., ...}` with
+  its resource usage.
+
+It exits once the server closes its end of the socket.
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+_MAX_MESSAGE_SIZE = 256 * 1024
+
+# Ignored by the helper, SIGINT by `main` and the others by Python, but not to be passed on: the
+# children must die from a forwarded Ctrl-C, or from writing to a closed pipe.
+_DEFAULT_SIGNALS = (signal.SIGINT, signal.SIGPIPE, signal.SIGXFSZ)
+
+
+def _spawn(channel: socket.socket, started_at: dict[int, float]) -> bool:
+    data, fds, _flags, _addr = socket.recv_fds(channel, _MAX_MESSAGE_SIZE, 3, socket.MSG_CMSG_CLOEXEC)
+    if not data:
+        return False
+    request = json.loads(data)
+    argv = request["argv"]
+    try:
+        file_actions = [(os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate(fds)]
+        pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=file_actions, setsid=True, setsigdef=_DEFAULT_SIGNALS)
+    except OSError as e:
+        reply = {"id": request["id"], "errno": e.errno}
+    else:
+        started_at[pid] = time.monotonic()
+        reply = {"id": request["id"], "pid": pid}
+    finally:
+        for fd in fds:
+            os.close(fd)
+    channel.sendall(json.dumps(reply).encode())
+    return True
+
+
+def _reap(channel: socket.socket, started_at: dict[int, float]) -> None:
+    while started_at:
+        pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        if not pid:
+            return
+        channel.sendall(json.dumps({
+            "pid": pid,
+            "exit_code": os.waitstatus_to_exitcode(status),
+            "wall_seconds": time.monotonic() - started_at.pop(pid),
+            "user_cpu_seconds": rusage.ru_utime,
+            "system_cpu_seconds": rusage.ru_stime,
+            "max_rss_kib": rusage.ru_maxrss,
+        }).encode())
+
+
+def main(fd: int) -> None:
+    # Interrupting the terminal reaches every process of the group: leave it to the server.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Exits are noticed through the wakeup fd, which needs a handler to be called.
+    wakeup_fd, wakeup_write_fd = os.pipe()
+    os.set_blocking(wakeup_write_fd, False)
+    signal.set_wakeup_fd(wakeup_write_fd)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+
+    channel = socket.socket(fileno=fd)
+    # Inherited from the server, but not to be passed on: children holding it would keep the
+    # server from noticing that we died.
+    channel.set_inheritable(False)
+    started_at: dict[int, float] = {}
+    poll = select.poll()
+    poll.register(channel, select.POLLIN)
+    poll.register(wakeup_fd, select.POLLIN)
+    while True:
+        for ready_fd, _ in poll.poll():
+            if ready_fd == wakeup_fd:
+                os.read(wakeup_fd, 4096)
+                _reap(channel, started_at)
+            elif not _spawn(channel, started_at):
+                return
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
@@ -1,6 +1,6 @@
 from typing import Annotated, Literal, Never
 
-from pydantic import BaseModel, Discriminator
+from pydantic import BaseModel, ConfigDict, Discriminator
 
 from ..protocol import Request
 
@@ -8,6 +8,11 @@ from ..protocol import Request
 class ProcessTerminated(BaseModel):
     request_id: str
     exit_code: int
+    # Resources used by the process, from `wait4`, left out by servers predating them.
+    wall_seconds: float | None = None
+    user_cpu_seconds: float | None = None
+    system_cpu_seconds: float | None = None
+    max_rss_kib: int | None = None
     type: Literal["process_terminated"] = "process_terminated"
 
 
@@ -17,15 +22,36 @@ class CommandNotFound(BaseModel):
     type: Literal["command_not_found"] = "command_not_found"
 
 
+class RequestFailed(BaseModel):
+    """The server could not handle the request, for a reason meant to be shown to the user."""
+    request_id: str
+    reason: str
+    type: Literal["request_failed"] = "request_failed"
+
+
 class ProcessStarted(BaseModel):
     pid: int
+    request_id: str | None = None
     type: Literal["process_started"] = "process_started"
 
 
-class RunProcess(BaseModel, Request[ProcessTerminated | CommandNotFound, ProcessStarted]):
+class ProcessOutput(BaseModel):
+    # Output is arbitrary bytes: JSON carries it as base64, binary codecs as it is.
+    model_config = ConfigDict(ser_json_bytes="base64", val_json_bytes="base64")
+
+    request_id: str
+    stream: Literal["stdout", "stderr"]
+    data: bytes
+    type: Literal["process_output"] = "process_output"
+
+
+class RunProcess(BaseModel, Request[ProcessTerminated | CommandNotFound | RequestFailed, ProcessStarted | ProcessOutput]):
     id: str
     command: str
     args: list[str] = []
+    io: Literal["fds", "stream"] = "fds"
+    """`fds` runs the process on the stdin, stdout and stderr fds sent along with the request,
+    `stream` runs it without stdin and relays its output as `ProcessOutput` events."""
     type: Literal["run_process"] = "run_process"
 
 
@@ -35,12 +61,51 @@ class ProcessKilled(BaseModel):
     type: Literal["process_killed"] = "process_killed"
 
 
-class KillProcess(BaseModel, Request[ProcessKilled, Never]):
+class ProcessNotFound(BaseModel):
+    request_id: str
+    pid: int
+    type: Literal["process_not_found"] = "process_not_found"
+
+
+class KillProcess(BaseModel, Request[ProcessKilled | ProcessNotFound | RequestFailed, Never]):
+    """Signal a process group, which must be one of a process started by the server.
+
+    With several workers, only the worker that started the process knows it: the request then has
+    to come through the connection that ran the process, and fails otherwise.
+    """
     id: str
     pid: int
     signal: int
     type: Literal["kill_process"] = "kill_process"
 
 
-type Response = Annotated[ProcessTerminated | CommandNotFound | ProcessKilled, Discriminator("type")]
-type Event = ProcessStarted
+class ProcessInfo(BaseModel):
+    request_id: str
+    pid: int
+    command: str
+    args: list[str]
+    started_at: float
+
+
+class ProcessList(BaseModel):
+    request_id: str
+    processes: list[ProcessInfo]
+    type: Literal["process_list"] = "process_list"
+
+
+class ListProcesses(BaseModel, Request[ProcessList | RequestFailed, Never]):
+    """List the processes started by the server that are still running.
+
+    Fails with several workers, each of which only knows the processes it started.
+    """
+    id: str
+    type: Literal["list_processes"] = "list_processes"
+
+
+class Cancel(BaseModel):
+    cancelled_id: str
+    type: Literal["cancel"] = "cancel"
+
+
+type Response = Annotated[ProcessTerminated | CommandNotFound | ProcessKilled | ProcessNotFound | ProcessList | RequestFailed, Discriminator("type")]
+type Event = ProcessStarted | ProcessOutput
@@ -0,0 +1,247 @@
+"""Spawn the processes run for clients and keep track of them until they exit.
+
+Children are reaped with `os.wait4`, which reports the resources they used along with their exit
+status: asyncio's child watchers only report the status. Two spawners are available:
+
+- `PosixSpawner` spawns from the server itself with `posix_spawn`, and has a `Reaper` watch the
+  children's pidfds.
+- `ForkServerSpawner` has a small helper process spawn and reap the children, so that launching
+  them does not depend on how much memory the server uses.
+"""
+
+import asyncio
+import errno
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections.abc import Sequence
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class ProcessExit:
+    exit_code: int
+    """Negative signal number when the process was killed by a signal, like `Popen.returncode`."""
+    wall_seconds: float
+    user_cpu_seconds: float
+    system_cpu_seconds: float
+    max_rss_kib: int
+    """Linux reports it in KiB. It also counts the memory of the spawning process until the child
+    called exec, so it is at least the size of that process for short-lived children."""
+
+
+class Spawner(Protocol):
+    async def spawn(self, command: str, args: Sequence[str], stdin: int, stdout: int, stderr: int) -> tuple[int, asyncio.Future[ProcessExit]]:
+        """Run *command* in a session of its own, on the given stdio fds.
+
+        Returns its pid and a future of its exit. Raises `FileNotFoundError` when *command* cannot
+        be found, and another `OSError` when it cannot be spawned for another reason.
+        """
+        ...
+
+
+class Reaper:
+    """Reap children as they exit, watching a pidfd per child on the event loop.
+
+    It is meant to be shared by all the children of a loop: each only costs an fd and a reader,
+    not a thread or a waiting coroutine, and a pidfd keeps pointing at its process whatever
+    happens to SIGCHLD or to its pid.
+    """
+
+    def __init__(self) -> None:
+        self._exits: dict[int, asyncio.Future[ProcessExit]] = {}
+
+    def watch(self, pid: int) -> asyncio.Future[ProcessExit]:
+        """Return the future of the exit of our child *pid*, the same for every caller."""
+        exited = self._exits.get(pid)
+        if exited is None:
+            loop = asyncio.get_running_loop()
+            pidfd = os.pidfd_open(pid)
+            exited = self._exits[pid] = loop.create_future()
+            loop.add_reader(pidfd, self._reap, loop, pid, pidfd, time.monotonic())
+        return exited
+
+    def _reap(self, loop: asyncio.AbstractEventLoop, pid: int, pidfd: int, started_at: float) -> None:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        # The pidfd is readable once the process exited, so this does not block.
+        _, status, rusage = os.wait4(pid, 0)
+        _set_result(self._exits.pop(pid), ProcessExit(
+            exit_code=os.waitstatus_to_exitcode(status),
+            wall_seconds=time.monotonic() - started_at,
+            user_cpu_seconds=rusage.ru_utime,
+            system_cpu_seconds=rusage.ru_stime,
+            max_rss_kib=rusage.ru_maxrss,
+        ))
+
+
+# Ignored by Python, and so by the server, but not to be passed on: a child writing to a closed pipe
+# is expected to die from SIGPIPE, as when run from a shell.
+_DEFAULT_SIGNALS = (signal.SIGPIPE, signal.SIGXFSZ)
+
+
+class PosixSpawner:
+    def __init__(self) -> None:
+        self._reaper = Reaper()
+
+    async def spawn(self, command: str, args: Sequence[str], stdin: int, stdout: int, stderr: int) -> tuple[int, asyncio.Future[ProcessExit]]:
+        file_actions = [(os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate((stdin, stdout, stderr))]
+        pid = os.posix_spawnp(command, [command, *args], os.environ, file_actions=file_actions, setsid=True, setsigdef=_DEFAULT_SIGNALS)
+        return pid, self._reaper.watch(pid)
+
+
+def _set_result[T](future: asyncio.Future[T], result: T) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+_FORKSERVER_SCRIPT = Path(__file__).with_name("forkserver.py")
+
+_MAX_MESSAGE_SIZE = 256 * 1024
+
+
+class ForkServerSpawner:
+    """Spawn processes from a helper process, started on first use and again if it dies.
+
+    Spawning from the server copies its page tables, or at least its memory mappings, so it gets
+    slower as the server grows. The helper stays as small as a bare interpreter.
+
+    If the helper dies, the processes it spawned are terminated, since nothing could report their
+    exit anymore, and their exit futures fail with `ConnectionError`, as do pending spawns.
+    """
+
+    def __init__(self) -> None:
+        self._channel: socket.socket | None = None
+        self._helper_pid: int | None = None
+        self._reading: asyncio.Task | None = None
+        self._next_request_id = 0
+        self._spawns: dict[int, asyncio.Future[tuple[int, asyncio.Future[ProcessExit]]]] = {}
+        self._exits: dict[int, asyncio.Future[ProcessExit]] = {}
+
+    def _start(self) -> socket.socket:
+        channel, helper_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        with helper_end:
+            helper_end.set_inheritable(True)
+            # Isolated and without site-packages: the helper only needs the standard library.
+            argv = [sys.executable, "-I", "-S", str(_FORKSERVER_SCRIPT), str(helper_end.fileno())]
+            self._helper_pid = os.posix_spawn(sys.executable, argv, os.environ)
+        channel.setblocking(False)
+        self._channel = channel
+        self._reading = asyncio.create_task(self._read_loop(channel))
+        logger.info("Started fork server (pid={})", self._helper_pid)
+        return channel
+
+    async def _read_loop(self, channel: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while data := await loop.sock_recv(channel, _MAX_MESSAGE_SIZE):
+                message = json.loads(data)
+                if "id" in message:
+                    spawned = self._spawns.pop(message["id"])
+                    if "pid" in message:
+                        # Registered before reading on, so that the exit can't come first.
+                        exited = self._exits[message["pid"]] = loop.create_future()
+                        spawned.set_result((message["pid"], exited))
+                    else:
+                        spawned.set_exception(OSError(message["errno"], os.strerror(message["errno"])))
+                else:
+                    pid = message.pop("pid")
+                    _set_result(self._exits.pop(pid), ProcessExit(**message))
+        except OSError:
+            pass
+        finally:
+            logger.warning("Fork server (pid={}) exited", self._helper_pid)
+            channel.close()
+            self._channel = None
+            # Its children are not ours: nothing will report their exit anymore, so rather than
+            # leaving them running unaccounted for, terminate them. Right away, as their pids are
+            # only theirs until they exit and get reaped by whoever inherited them.
+            for pid in self._exits:
+                logger.warning("Terminating process group {}, orphaned by the fork server", pid)
+                with suppress(ProcessLookupError):
+                    os.killpg(pid, signal.SIGTERM)
+            if self._helper_pid is not None:
+                await loop.run_in_executor(None, os.waitpid, self._helper_pid, 0)
+            for future in [*self._spawns.values(), *self._exits.values()]:
+                if not future.done():
+                    future.set_exception(ConnectionError("Fork server exited"))
+            self._spawns.clear()
+            self._exits.clear()
+
+    async def spawn(self, command: str, args: Sequence[str], stdin: int, stdout: int, stderr: int) -> tuple[int, asyncio.Future[ProcessExit]]:
+        loop = asyncio.get_running_loop()
+        request_id = self._next_request_id
+        self._next_request_id += 1
+        data = json.dumps({"id": request_id, "argv": [command, *args]}).encode()
+        # A larger packet would reach the helper truncated, without a request id to answer to.
+        if len(data) > _MAX_MESSAGE_SIZE:
+            raise OSError(errno.E2BIG, f"Command line of {len(data)} bytes exceeds the {_MAX_MESSAGE_SIZE} bytes the fork server accepts")
+        channel = self._channel or self._start()
+        while True:
+            try:
+                socket.send_fds(channel, [data], [stdin, stdout, stderr])
+                break
+            except BlockingIOError:
+                writable = loop.create_future()
+                loop.add_writer(channel, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(channel)
+        # Only registered once sent, as the helper cannot answer before, and so that a failed send
+        # does not leave a pending spawn behind.
+        spawned = self._spawns[request_id] = loop.create_future()
+        return await spawned
+
+
+@dataclass
+class RunningProcess:
+    request_id: str
+    pid: int
+    command: str
+    args: list[str]
+    started_at: float
+    """Wall clock time, as returned by `time.time()`."""
+    exited: asyncio.Future[ProcessExit]
+
+
+class ProcessRegistry:
+    def __init__(self, spawner: Spawner | None = None, exhaustive: bool = True) -> None:
+        self._spawner = spawner or PosixSpawner()
+        self._processes: dict[int, RunningProcess] = {}
+        # False when each worker of the server has a registry of its own, which then only knows the
+        # processes started by that worker.
+        self.exhaustive = exhaustive
+
+    @property
+    def processes(self) -> list[RunningProcess]:
+        return list(self._processes.values())
+
+    def get(self, pid: int) -> RunningProcess | None:
+        """Return the process with this *pid* if it was spawned by us and did not exit yet."""
+        return self._processes.get(pid)
+
+    async def spawn(self, request_id: str, command: str, args: Sequence[str], stdin: int, stdout: int, stderr: int) -> RunningProcess:
+        """Run *command* in a session of its own, on the given stdio fds.
+
+        Raises `FileNotFoundError` when *command* cannot be found, and another `OSError` when it
+        cannot be spawned for another reason.
+        """
+        pid, exited = await self._spawner.spawn(command, args, stdin, stdout, stderr)
+        process = RunningProcess(request_id, pid, command, list(args), time.time(), exited)
+        self._processes[pid] = process
+        exited.add_done_callback(lambda _: self._forget(process))
+        return process
+
+    def _forget(self, process: RunningProcess) -> None:
+        # Its pid may already have been reused by a process spawned since it exited.
+        if self._processes.get(process.pid) is process:
+            del self._processes[process.pid]
@@ -0,0 +1,70 @@
+"""Forward the signals received by `ipc run` to the process it runs on the server."""
+
+import asyncio
+import signal
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+
+from loguru import logger
+
+
+class SignalForwarder:
+    """Send the signals to forward from a single task, one request at a time.
+
+    Signals arriving while a request is on its way are coalesced: a burst of them, e.g. from
+    mashing Ctrl-C, sends at most one more request per distinct signal. Forwarding SIGTERM arms a
+    timer which forwards SIGKILL if the process is still running once it expires.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, signal.Signals], Awaitable[object]],
+        kill_timeout: float | None = None,
+        on_escalate: Callable[[], None] | None = None,
+    ) -> None:
+        self._send = send
+        self._kill_timeout = kill_timeout
+        self._on_escalate = on_escalate
+        loop = asyncio.get_running_loop()
+        self._pid: asyncio.Future[int] = loop.create_future()
+        # Used as an ordered set: signals are sent in the order they first arrived.
+        self._pending: dict[signal.Signals, None] = {}
+        self._wakeup = asyncio.Event()
+        self._escalation: asyncio.TimerHandle | None = None
+        self._task = asyncio.create_task(self._forward_loop())
+
+    def start(self, pid: int) -> None:
+        """Start forwarding to *pid*, including the signals received until now."""
+        if not self._pid.done():
+            self._pid.set_result(pid)
+
+    def forward(self, sig: signal.Signals) -> None:
+        self._pending[sig] = None
+        self._wakeup.set()
+
+    def _escalate(self) -> None:
+        if self._on_escalate is not None:
+            self._on_escalate()
+        self.forward(signal.SIGKILL)
+
+    async def _forward_loop(self) -> None:
+        pid = await self._pid
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                sig = next(iter(self._pending))
+                del self._pending[sig]
+                try:
+                    await self._send(pid, sig)
+                except Exception:
+                    logger.warning("Failed to forward {} to process {}", sig.name, pid)
+                if sig == signal.SIGTERM and self._kill_timeout is not None and self._escalation is None:
+                    self._escalation = asyncio.get_running_loop().call_later(self._kill_timeout, self._escalate)
+
+    async def aclose(self) -> None:
+        if self._escalation is not None:
+            self._escalation.cancel()
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
@@ -1,11 +1,15 @@
 import asyncio
+import time
 from contextlib import asynccontextmanager
+from collections.abc import Sequence
 from pathlib import Path
 from typing import AsyncIterator
 
 from loguru import logger
 
-from .protocol import Codec, Request, Response, ResponseHandler, validate_response
+from .handshake import HANDSHAKE_TIMEOUT, offer, preferences
+from .metrics import DECODE_SECONDS, NULL_METRICS, REQUEST_SECONDS, Metrics
+from .protocol import Codec, Request, Response, ResponseHandler, is_event, is_response, remaining_time, validate_event
 from .transport import Connection, Frame, Framing, NullCharFraming, open_connection
 
 
@@ -14,9 +18,11 @@ class Client[RequestT: Request, EventT, ResponseT: Response]():
         self,
         connection: Connection,
         codec: Codec[RequestT, EventT, ResponseT],
+        metrics: Metrics = NULL_METRICS,
     ) -> None:
         self._connection = connection
         self._codec = codec
+        self._metrics = metrics
         self._pending: dict[str, tuple[asyncio.Future[None], RequestT, ResponseHandler[EventT, ResponseT]]] = {}
         self._receive_task: asyncio.Task = asyncio.create_task(self._receive_loop())
 
@@ -24,18 +30,44 @@ class Client[RequestT: Request, EventT, ResponseT: Response]():
     async def connect(
         cls,
         socket_path: Path,
-        codec: Codec[RequestT, EventT, ResponseT],
-        framing: Framing = NullCharFraming(),
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        handshake_timeout: float = HANDSHAKE_TIMEOUT,
+        metrics: Metrics = NULL_METRICS,
     ) -> "Client[RequestT, EventT, ResponseT]":
-        connection = await open_connection(socket_path, framing)
-        return cls(connection, codec)
+        """Connect and negotiate the wire format, offering `codec` and `framing` in order of preference."""
+        connection = await open_connection(socket_path, metrics=metrics)
+        try:
+            wire_format = await offer(connection, preferences(codec), preferences(framing), handshake_timeout)
+        except BaseException:
+            await connection.aclose()
+            raise
+        return cls(connection, wire_format.codec, metrics)
+
+    @property
+    def pending_count(self) -> int:
+        """Number of requests still waiting for their response."""
+        return len(self._pending)
+
+    @property
+    def closed(self) -> bool:
+        """Whether the connection is gone, after which no response can arrive."""
+        return self._receive_task.done()
 
     async def request(
         self,
         request: RequestT,
         fds: list[int] | None = None,
         handler: ResponseHandler[EventT, ResponseT] | None = None,
+        timeout: float | None = None,
     ) -> None:
+        """Send *request* and wait for its response.
+
+        Gives up with `TimeoutError` after *timeout* seconds or at the request's deadline. When
+        the wait times out or is cancelled, the server is asked to cancel the request too.
+        """
+        if self.closed:
+            raise ConnectionError("Connection closed")
         if fds is None:
             fds = []
         if handler is None:
@@ -43,32 +75,64 @@ class Client[RequestT: Request, EventT, ResponseT: Response]():
         loop = asyncio.get_running_loop()
         future: asyncio.Future[None] = loop.create_future()
         self._pending[request.id] = (future, request, handler)
-        await self._connection.send_frame(Frame(self._codec.encode(request), fds))
-        await future
+        started_at = time.perf_counter()
+        try:
+            async with asyncio.timeout(remaining_time(request, timeout)):
+                await self._connection.send_frame(Frame(self._codec.encode(request), fds))
+                await future
+            self._metrics.observe(REQUEST_SECONDS, time.perf_counter() - started_at)
+        except (TimeoutError, asyncio.CancelledError):
+            if self._pending.pop(request.id, None) is not None:
+                await self._cancel(request)
+            raise
+        finally:
+            self._pending.pop(request.id, None)
+
+    async def _cancel(self, request: RequestT) -> None:
+        if self._codec.cancel is None:
+            return
+        logger.debug("Cancelling request {} (id={})", type(request).__name__, request.id)
+        try:
+            await self._connection.send_frame(Frame(self._codec.encode(self._codec.cancel(request.id))))
+        except (OSError, EOFError):
+            pass
+
+    async def _dispatch(self, message: EventT | ResponseT, fds: list[int]) -> None:
+        request_id = getattr(message, "request_id", None)
+        if request_id is None:
+            # Untagged events go to every pending request expecting that event type.
+            for _, (_, original_request, response_handler) in list(self._pending.items()):
+                if is_event(original_request, message):
+                    if response_handler.on_event is not None:
+                        await response_handler.on_event(message, fds)
+            return
+
+        entry = self._pending.get(request_id)
+        if entry is None:
+            return
+        future, original_request, response_handler = entry
+        if is_response(original_request, message):
+            del self._pending[request_id]
+            if response_handler.on_response is not None:
+                await response_handler.on_response(message, fds)
+            if not future.done():
+                future.set_result(None)
+        else:
+            validate_event(original_request, message)
+            if response_handler.on_event is not None:
+                await response_handler.on_event(message, fds)
 
     async def _receive_loop(self) -> None:
         try:
-            async for frame in self._connection:
-                try:
-                    message = self._codec.decode(frame.data)
-                    match message:
-                        case Response() as response:
-                            entry = self._pending.pop(response.request_id, None)
-                            if entry is not None:
-                                future, original_request, response_handler = entry
-                                validate_response(original_request, response)
-                                if response_handler.on_response is not None:
-                                    await response_handler.on_response(response, frame.fds)
-                                if not future.done():
-                                    future.set_result(None)
-                        case event:
-                            for _, (_, original_request, response_handler) in list(self._pending.items()):
-                                event_type = getattr(original_request.__class__, "__event_type__", None)
-                                if event_type is not None and isinstance(event, event_type):
-                                    if response_handler.on_event is not None:
-                                        await response_handler.on_event(event, frame.fds)
-                except Exception:
-                    logger.warning("Error processing received frame, skipping")
+            async for frames in self._connection.batches():
+                for frame in frames:
+                    try:
+                        decode_started_at = time.perf_counter()
+                        message = self._codec.decode(frame.data)
+                        self._metrics.observe(DECODE_SECONDS, time.perf_counter() - decode_started_at)
+                        await self._dispatch(message, frame.fds)
+                    except Exception:
+                        logger.warning("Error processing received frame, skipping")
         finally:
             for request_id, (future, _, _) in list(self._pending.items()):
                 if not future.done():
@@ -92,10 +156,12 @@ class Client[RequestT: Request, EventT, ResponseT: Response]():
     async def open(
         cls,
         socket_path: Path,
-        codec: Codec[RequestT, EventT, ResponseT],
-        framing: Framing = NullCharFraming(),
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        handshake_timeout: float = HANDSHAKE_TIMEOUT,
+        metrics: Metrics = NULL_METRICS,
     ) -> AsyncIterator["Client[RequestT, EventT, ResponseT]"]:
-        client = await cls.connect(socket_path, codec, framing)
+        client = await cls.connect(socket_path, codec, framing, handshake_timeout, metrics)
         try:
             yield client
         finally:
@@ -0,0 +1,199 @@
+"""Connection handshake selecting the protocol version, codec and framing.
+
+The client opens every connection with a hello frame listing what it supports, in order of
+preference, and the server answers with its pick. Both frames are JSON objects delimited by a
+NUL byte whatever gets negotiated, so that every version can read them:
+
+    {"hello": {"version": 2, "codecs": ["msgpack", "json"], "framings": ["length-prefixed", "null-char"]}}
+    {"welcome": {"version": 2, "codec": "msgpack", "framing": "length-prefixed"}}
+    {"error": "No codec and framing in common"}
+
+Peers that predate the handshake are still understood, as long as they use a text codec over
+NUL framing: the server recognizes their first frame as a request, and the client gives up
+waiting for the welcome after `HANDSHAKE_TIMEOUT`.
+
+The agreed version is the lowest of both ends, and a codec is only picked when that version is at
+least its `min_version`, so that peers disagreeing on how a codec lays out messages never use it.
+"""
+
+import asyncio
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from loguru import logger
+
+from .protocol import Codec, Request, Response
+from .transport import Connection, Frame, Framing, NullCharFraming
+
+PROTOCOL_VERSION = 2
+"""1: first version with the handshake.
+2: binary codecs append `deadline` (then `io` for RunProcess) to the fields of requests.
+"""
+
+MIN_PROTOCOL_VERSION = 1
+
+LEGACY_PROTOCOL_VERSION = 0
+
+HANDSHAKE_TIMEOUT = 1.0
+
+HANDSHAKE_FRAMING = NullCharFraming()
+
+
+class HandshakeError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class WireFormat[RequestT: Request, EventT, ResponseT: Response]():
+    """What both ends of a connection agreed on."""
+    version: int
+    codec: Codec[RequestT, EventT, ResponseT]
+    framing: Framing
+
+
+def preferences[T](option: T | Sequence[T]) -> list[T]:
+    """Accept either a single option or several in order of preference."""
+    return list(option) if isinstance(option, Sequence) else [option]
+
+
+def _compatible(codec: Codec, framing: Framing) -> bool:
+    return framing.binary_safe or not codec.binary
+
+
+def _legacy[RequestT: Request, EventT, ResponseT: Response](
+    codecs: list[Codec[RequestT, EventT, ResponseT]],
+    framings: list[Framing],
+) -> WireFormat[RequestT, EventT, ResponseT] | None:
+    """The wire format spoken before the handshake existed, if we still support it."""
+    codec = next((codec for codec in codecs if not codec.binary), None)
+    framing = next((framing for framing in framings if framing.name == HANDSHAKE_FRAMING.name), None)
+    if codec is None or framing is None:
+        return None
+    return WireFormat(LEGACY_PROTOCOL_VERSION, codec, framing)
+
+
+def _select[RequestT: Request, EventT, ResponseT: Response](
+    codecs: list[Codec[RequestT, EventT, ResponseT]],
+    framings: list[Framing],
+    version: int,
+    codec_names: list[str],
+    framing_names: list[str],
+) -> tuple[Codec[RequestT, EventT, ResponseT], Framing] | None:
+    # Our own order wins: the server knows best which formats it handles fastest.
+    for codec in codecs:
+        if codec.name not in codec_names or codec.min_version > version:
+            continue
+        for framing in framings:
+            if framing.name in framing_names and _compatible(codec, framing):
+                return codec, framing
+    return None
+
+
+async def _send(connection: Connection, message: dict[str, Any]) -> None:
+    await connection.send_frame(Frame(json.dumps(message).encode()))
+    await connection.drain()
+
+
+def _parse_hello(frame: Frame) -> tuple[int, list[str], list[str]] | None:
+    try:
+        hello = json.loads(bytes(frame.data))["hello"]
+        return int(hello["version"]), list(hello["codecs"]), list(hello["framings"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+async def offer[RequestT: Request, EventT, ResponseT: Response](
+    connection: Connection,
+    codecs: list[Codec[RequestT, EventT, ResponseT]],
+    framings: list[Framing],
+    timeout: float = HANDSHAKE_TIMEOUT,
+) -> WireFormat[RequestT, EventT, ResponseT]:
+    """Client side: propose `codecs` and `framings` and switch `connection` to the server's pick."""
+    connection.set_framing(HANDSHAKE_FRAMING)
+    await _send(connection, {
+        "hello": {
+            "version": PROTOCOL_VERSION,
+            "codecs": [codec.name for codec in codecs],
+            "framings": [framing.name for framing in framings],
+        },
+    })
+
+    try:
+        async with asyncio.timeout(timeout):
+            frame = await connection.receive_frame()
+    except TimeoutError:
+        wire_format = _legacy(codecs, framings)
+        if wire_format is None:
+            raise HandshakeError(f"Server did not answer the handshake within {timeout}s")
+        logger.warning("Server did not answer the handshake, assuming it predates it")
+        connection.set_framing(wire_format.framing)
+        return wire_format
+
+    try:
+        reply = json.loads(bytes(frame.data))
+    except ValueError as e:
+        raise HandshakeError("Malformed handshake reply") from e
+    if "error" in reply:
+        raise HandshakeError(f"Server refused the handshake: {reply['error']}")
+
+    try:
+        welcome = reply["welcome"]
+        version = int(welcome["version"])
+        codec = next(codec for codec in codecs if codec.name == welcome["codec"])
+        framing = next(framing for framing in framings if framing.name == welcome["framing"])
+    except (TypeError, KeyError, StopIteration) as e:
+        raise HandshakeError(f"Unexpected handshake reply: {reply}") from e
+    if version < codec.min_version:
+        raise HandshakeError(f"Server picked the {codec.name} codec at protocol version {version}, below {codec.min_version}")
+
+    logger.debug("Negotiated protocol version {} with {} codec and {} framing", version, codec.name, framing.name)
+    connection.set_framing(framing)
+    return WireFormat(version, codec, framing)
+
+
+async def accept[RequestT: Request, EventT, ResponseT: Response](
+    connection: Connection,
+    codecs: list[Codec[RequestT, EventT, ResponseT]],
+    framings: list[Framing],
+) -> tuple[WireFormat[RequestT, EventT, ResponseT], Frame | None]:
+    """Server side: answer the client's hello and switch `connection` to the selected format.
+
+    When the client predates the handshake, its first frame is already a message: it is returned
+    alongside the legacy wire format so that the caller can handle it.
+    """
+    connection.set_framing(HANDSHAKE_FRAMING)
+    frame = await connection.receive_frame()
+
+    hello = _parse_hello(frame)
+    if hello is None:
+        wire_format = _legacy(codecs, framings)
+        if wire_format is None:
+            raise HandshakeError("Client did not start with a handshake")
+        logger.debug("Client did not start with a handshake, assuming it predates it")
+        return wire_format, frame
+
+    version, codec_names, framing_names = hello
+    if version < MIN_PROTOCOL_VERSION:
+        await _send(connection, {"error": f"Protocol version {version} is no longer supported"})
+        raise HandshakeError(f"Client speaks protocol version {version}, below {MIN_PROTOCOL_VERSION}")
+
+    version = min(version, PROTOCOL_VERSION)
+    selected = _select(codecs, framings, version, codec_names, framing_names)
+    if selected is None:
+        await _send(connection, {"error": "No codec and framing in common"})
+        raise HandshakeError(f"No codec and framing in common with client offering {codec_names} and {framing_names}")
+
+    codec, framing = selected
+    wire_format = WireFormat(version, codec, framing)
+    await _send(connection, {
+        "welcome": {
+            "version": wire_format.version,
+            "codec": codec.name,
+            "framing": framing.name,
+        },
+    })
+    logger.debug("Negotiated protocol version {} with {} codec and {} framing", wire_format.version, codec.name, framing.name)
+    connection.set_framing(framing)
+    return wire_format, None
@@ -1,12 +1,16 @@
 import asyncio
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from collections.abc import Sequence
 from pathlib import Path
 from typing import AsyncIterator
 
 from .client import Client
+from .metrics import NULL_METRICS, Metrics
+from .pool import DEFAULT_POOL_SIZE, ClientPool
 from .protocol import Codec, Request, Response
-from .server import RequestHandler, Server
+from .server import Limits, OverloadHandler, RequestHandler, Server
 from .transport import Framing, NullCharFraming
+from .workers import Supervisor
 
 _POLL_INTERVAL = 0.01
 _POLL_TIMEOUT = 5.0
@@ -14,47 +18,95 @@ _POLL_TIMEOUT = 5.0
 
 def open_server[RequestT: Request, EventT, ResponseT: Response](
     socket_path: Path,
-    codec: Codec[RequestT, EventT, ResponseT],
+    codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
     *,
     handler: RequestHandler[RequestT, EventT, ResponseT],
-    framing: Framing = NullCharFraming(),
+    framing: Framing | Sequence[Framing] = NullCharFraming(),
+    limits: Limits = Limits(),
+    on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+    metrics: Metrics = NULL_METRICS,
 ) -> AbstractAsyncContextManager[Server[RequestT, EventT, ResponseT]]:
     @asynccontextmanager
     async def _ctx() -> AsyncIterator[Server[RequestT, EventT, ResponseT]]:
-        async with Server.open(socket_path, handler, codec, framing) as server:
-            serving_task = asyncio.create_task(server.serve())
-            elapsed = 0.0
-            while not socket_path.exists():
-                await asyncio.sleep(_POLL_INTERVAL)
-                elapsed += _POLL_INTERVAL
-                if elapsed >= _POLL_TIMEOUT:
-                    serving_task.cancel()
-                    raise TimeoutError(
-                        f"Server socket {socket_path} did not appear within {_POLL_TIMEOUT}s"
-                    )
-            try:
+        async with Server.open(socket_path, handler, codec, framing, limits, on_overload, metrics) as server:
+            async with _serving(server, socket_path):
                 yield server
-            finally:
-                serving_task.cancel()
-                try:
-                    await serving_task
-                except asyncio.CancelledError:
-                    pass
-                except BaseException:
-                    raise
 
     return _ctx()
 
 
+def open_supervisor[RequestT: Request, EventT, ResponseT: Response](
+    socket_path: Path,
+    codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+    *,
+    handler: RequestHandler[RequestT, EventT, ResponseT],
+    worker_count: int,
+    framing: Framing | Sequence[Framing] = NullCharFraming(),
+    limits: Limits = Limits(),
+    on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+) -> AbstractAsyncContextManager[Supervisor[RequestT, EventT, ResponseT]]:
+    @asynccontextmanager
+    async def _ctx() -> AsyncIterator[Supervisor[RequestT, EventT, ResponseT]]:
+        async with Supervisor.open(socket_path, handler, codec, framing, limits, on_overload, worker_count) as supervisor:
+            async with _serving(supervisor, socket_path):
+                yield supervisor
+
+    return _ctx()
+
+
+@asynccontextmanager
+async def _serving(server: Server | Supervisor, socket_path: Path) -> AsyncIterator[None]:
+    serving_task = asyncio.create_task(server.serve())
+    elapsed = 0.0
+    while not socket_path.exists():
+        if serving_task.done():
+            # Failed before listening, e.g. because a worker could not be started.
+            serving_task.result()
+        await asyncio.sleep(_POLL_INTERVAL)
+        elapsed += _POLL_INTERVAL
+        if elapsed >= _POLL_TIMEOUT:
+            serving_task.cancel()
+            raise TimeoutError(
+                f"Server socket {socket_path} did not appear within {_POLL_TIMEOUT}s"
+            )
+    try:
+        yield
+    finally:
+        serving_task.cancel()
+        try:
+            await serving_task
+        except asyncio.CancelledError:
+            pass
+        except BaseException:
+            raise
+
+
 def open_client[RequestT: Request, EventT, ResponseT: Response](
     socket_path: Path,
-    codec: Codec[RequestT, EventT, ResponseT],
+    codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
     *,
-    framing: Framing = NullCharFraming(),
+    framing: Framing | Sequence[Framing] = NullCharFraming(),
+    metrics: Metrics = NULL_METRICS,
 ) -> AbstractAsyncContextManager[Client[RequestT, EventT, ResponseT]]:
     @asynccontextmanager
     async def _ctx() -> AsyncIterator[Client[RequestT, EventT, ResponseT]]:
-        async with Client.open(socket_path, codec, framing) as client:
+        async with Client.open(socket_path, codec, framing, metrics=metrics) as client:
             yield client
 
     return _ctx()
+
+
+def open_client_pool[RequestT: Request, EventT, ResponseT: Response](
+    socket_path: Path,
+    codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+    *,
+    framing: Framing | Sequence[Framing] = NullCharFraming(),
+    size: int = DEFAULT_POOL_SIZE,
+    metrics: Metrics = NULL_METRICS,
+) -> AbstractAsyncContextManager[ClientPool[RequestT, EventT, ResponseT]]:
+    @asynccontextmanager
+    async def _ctx() -> AsyncIterator[ClientPool[RequestT, EventT, ResponseT]]:
+        async with ClientPool.open(socket_path, codec, framing, size, metrics=metrics) as pool:
+            yield pool
+
+    return _ctx()
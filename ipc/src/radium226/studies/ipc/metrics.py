@@ -0,0 +1,123 @@
+"""Counters and histograms recorded on the hot paths of the transport, client and server.
+
+Metrics go to a `Metrics` implementation, `NULL_METRICS` by default, which records nothing.
+`InMemoryMetrics` aggregates them in-process, to be read with `snapshot()`.
+
+The per-frame and per-request log lines are wrapped in `if __debug__:`, so running Python with
+`-O` compiles them out and leaves these metrics as the only cost on the hot path.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+FRAMES_RECEIVED = "ipc.frames.received"
+FRAMES_SENT = "ipc.frames.sent"
+BYTES_RECEIVED = "ipc.bytes.received"
+BYTES_SENT = "ipc.bytes.sent"
+SEND_QUEUE_DEPTH = "ipc.send_queue.depth"
+"""Frames waiting in a connection's send queue, observed every time a frame is queued."""
+ACTIVE_CONNECTIONS = "ipc.connections.active"
+"""Incremented when a connection is accepted, decremented when it closes."""
+REQUESTS = "ipc.requests"
+DECODE_SECONDS = "ipc.decode.seconds"
+HANDLER_SECONDS = "ipc.handler.seconds"
+"""Time from a request being decoded to its response being queued, on the server."""
+REQUEST_SECONDS = "ipc.request.seconds"
+"""Time from a request being sent to its response being handled, on the client."""
+
+
+class Metrics(Protocol):
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add *value*, which may be negative, to the counter *name*."""
+        ...
+
+    def observe(self, name: str, value: float) -> None:
+        """Record *value* in the histogram *name*."""
+        ...
+
+
+class NullMetrics:
+    def increment(self, name: str, value: int = 1) -> None:
+        pass
+
+    def observe(self, name: str, value: float) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+# Four buckets per power of two: quantiles are estimated within about 19% of the actual value.
+_BUCKETS_PER_OCTAVE = 4
+
+
+@dataclass
+class Histogram:
+    count: int = 0
+    total: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+    # Values in `(2 ** ((index - 1) / 4), 2 ** (index / 4)]` are counted under `index`, zero and
+    # negative values under `None`.
+    buckets: dict[int | None, int] = field(default_factory=dict)
+
+    def record(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        index = math.ceil(math.log2(value) * _BUCKETS_PER_OCTAVE) if value > 0 else None
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the *q*-quantile, as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return self.min
+        for index in sorted(index for index in self.buckets if index is not None):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** (index / _BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else math.nan,
+            "min": self.min,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class InMemoryMetrics:
+    """Aggregate metrics in-process, e.g. to expose them through a request or dump them on exit."""
+
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(value)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+        }
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
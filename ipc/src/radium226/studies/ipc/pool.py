@@ -0,0 +1,155 @@
+import asyncio
+from collections.abc import Sequence
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+from typing import AsyncIterator
+
+from loguru import logger
+
+from .client import Client
+from .handshake import HANDSHAKE_TIMEOUT
+from .metrics import NULL_METRICS, Metrics
+from .protocol import Codec, Request, Response, ResponseHandler
+from .transport import Framing, NullCharFraming
+
+DEFAULT_POOL_SIZE = 4
+
+HEALTH_CHECK_INTERVAL = 5.0
+
+
+class ClientPool[RequestT: Request, EventT, ResponseT: Response]():
+    """Multiplex requests over up to `size` long-lived `Client` connections.
+
+    Connections are opened on demand: a request goes to the connection with the fewest pending
+    requests, and a new one is only opened while every open connection is busy. A health check
+    replaces connections that were closed by the server, and dead connections are replaced on
+    the next request anyway.
+    """
+
+    def __init__(
+        self,
+        socket_path: Path,
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        size: int = DEFAULT_POOL_SIZE,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+        handshake_timeout: float = HANDSHAKE_TIMEOUT,
+        metrics: Metrics = NULL_METRICS,
+    ) -> None:
+        if size < 1:
+            raise ValueError(f"Pool size must be at least 1, got {size}")
+        self._socket_path = socket_path
+        self._codec = codec
+        self._framing = framing
+        self._handshake_timeout = handshake_timeout
+        self._metrics = metrics
+        self._health_check_interval = health_check_interval
+        # Each slot holds the task opening its client, done once connected (or failed).
+        self._slots: list[asyncio.Task[Client[RequestT, EventT, ResponseT]] | None] = [None] * size
+        self._health_check_task: asyncio.Task = asyncio.create_task(self._health_check_loop())
+
+    @property
+    def size(self) -> int:
+        return len(self._slots)
+
+    def _connect(self) -> asyncio.Task[Client[RequestT, EventT, ResponseT]]:
+        return asyncio.create_task(
+            Client.connect(self._socket_path, self._codec, self._framing, self._handshake_timeout, self._metrics)
+        )
+
+    @staticmethod
+    def _live_client(slot: asyncio.Task[Client[RequestT, EventT, ResponseT]] | None) -> Client[RequestT, EventT, ResponseT] | None:
+        if slot is None or not slot.done() or slot.cancelled() or slot.exception() is not None:
+            return None
+        client = slot.result()
+        return None if client.closed else client
+
+    def _is_dead(self, slot: asyncio.Task[Client[RequestT, EventT, ResponseT]] | None) -> bool:
+        return slot is not None and slot.done() and self._live_client(slot) is None
+
+    async def _discard(self, slot: asyncio.Task[Client[RequestT, EventT, ResponseT]]) -> None:
+        if slot.cancelled():
+            return
+        if (error := slot.exception()) is not None:
+            logger.warning("Failed to connect to {}: {}", self._socket_path, error)
+            return
+        await slot.result().aclose()
+
+    async def _acquire(self) -> Client[RequestT, EventT, ResponseT]:
+        clients = [client for slot in self._slots if (client := self._live_client(slot)) is not None]
+        client = min(clients, key=lambda client: client.pending_count, default=None)
+        if client is not None and (client.pending_count == 0 or len(clients) == self.size):
+            return client
+
+        free_index = next(
+            (index for index, slot in enumerate(self._slots) if slot is None or self._is_dead(slot)),
+            None,
+        )
+        if free_index is not None:
+            slot = self._slots[free_index]
+            connecting = self._slots[free_index] = self._connect()
+            if slot is not None:
+                await self._discard(slot)
+        elif client is not None:
+            # The remaining slots are still connecting, so share the least busy connection.
+            return client
+        else:
+            connecting = next(slot for slot in self._slots if slot is not None and not slot.done())
+
+        try:
+            return await asyncio.shield(connecting)
+        except (OSError, EOFError, TimeoutError):
+            if client is not None:
+                return client
+            raise
+
+    async def request(
+        self,
+        request: RequestT,
+        fds: list[int] | None = None,
+        handler: ResponseHandler[EventT, ResponseT] | None = None,
+        timeout: float | None = None,
+    ) -> None:
+        client = await self._acquire()
+        await client.request(request, fds, handler, timeout)
+
+    async def _health_check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._health_check_interval)
+            for index, slot in enumerate(self._slots):
+                if self._is_dead(slot):
+                    assert slot is not None
+                    logger.info("Reconnecting pooled client {} to {}", index, self._socket_path)
+                    self._slots[index] = self._connect()
+                    await self._discard(slot)
+
+    async def aclose(self) -> None:
+        self._health_check_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._health_check_task
+        for slot in self._slots:
+            if slot is None:
+                continue
+            if not slot.done():
+                slot.cancel()
+                with suppress(asyncio.CancelledError, Exception):
+                    await slot
+            await self._discard(slot)
+        self._slots = [None] * self.size
+
+    @classmethod
+    @asynccontextmanager
+    async def open(
+        cls,
+        socket_path: Path,
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        size: int = DEFAULT_POOL_SIZE,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+        metrics: Metrics = NULL_METRICS,
+    ) -> AsyncIterator["ClientPool[RequestT, EventT, ResponseT]"]:
+        pool = cls(socket_path, codec, framing, size, health_check_interval, metrics=metrics)
+        try:
+            yield pool
+        finally:
+            await pool.aclose()
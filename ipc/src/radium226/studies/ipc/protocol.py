@@ -1,4 +1,5 @@
-from typing import Any, Awaitable, Callable, Protocol, runtime_checkable, get_args, get_origin
+import time
+from typing import Any, Awaitable, Callable, Never, Protocol, runtime_checkable, get_args, get_origin
 from dataclasses import dataclass
 
 
@@ -11,6 +12,8 @@ class Request[ResponseT, EventT]:
     """
 
     id: str
+    deadline: float | None = None
+    """Wall-clock time (as in `time.time()`) after which nobody waits for the response anymore."""
 
     def __init_subclass__(cls, **kwargs: Any) -> None:
         super().__init_subclass__(**kwargs)
@@ -30,6 +33,21 @@ class Response(Protocol):
     request_id: str
 
 
+@runtime_checkable
+class Cancel(Protocol):
+    """Structural protocol: any object with `cancelled_id: str` asks to cancel that request."""
+    cancelled_id: str
+
+
+def remaining_time(request: Request[Any, Any], timeout: float | None = None) -> float | None:
+    """Seconds left before *request*'s deadline or *timeout*, whichever comes first."""
+    deadline = getattr(request, "deadline", None)
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    return remaining if timeout is None else min(timeout, remaining)
+
+
 def _type_name(t: Any) -> str:
     if hasattr(t, "__name__"):
         return t.__name__
@@ -52,8 +70,24 @@ def validate_response(request: Request[Any, Any], response: Any) -> None:
         )
 
 
+def is_response(request: Request[Any, Any], message: Any) -> bool:
+    """Tell whether *message* is the request's phantom ``ResponseT`` rather than one of its events."""
+    expected = getattr(request.__class__, "__response_type__", None)
+    return expected is not None and isinstance(message, expected)
+
+
+def is_event(request: Request[Any, Any], message: Any) -> bool:
+    """Tell whether *message* is the request's phantom ``EventT`` (never true for ``Never``)."""
+    expected = getattr(request.__class__, "__event_type__", None)
+    return expected is not None and expected is not Never and isinstance(message, expected)
+
+
 def validate_event(request: Request[Any, Any], event: Any) -> None:
-    """Validate that *event* matches the request's phantom ``EventT``."""
+    """Validate that *event* matches the request's phantom ``EventT``.
+
+    Events may carry the ``request_id`` of their request so that clients route them with a
+    lookup; when they do, it must be this request's id.
+    """
     try:
         expected = request.__class__.__event_type__
     except AttributeError:
@@ -66,6 +100,12 @@ def validate_event(request: Request[Any, Any], event: Any) -> None:
             f"Request {type(request).__name__} expects event of type "
             f"{_type_name(expected)}, got {type(event).__name__}"
         )
+    request_id = getattr(event, "request_id", None)
+    if request_id is not None and request_id != request.id:
+        raise ValueError(
+            f"Event {type(event).__name__} is tagged with request {request_id}, "
+            f"emitted for request {request.id}"
+        )
 
 
 type Emit[EventT] = Callable[[EventT, list[int]], Awaitable[None]]
@@ -73,13 +113,21 @@ type Emit[EventT] = Callable[[EventT, list[int]], Awaitable[None]]
 
 type Encode[MessageT] = Callable[[MessageT], bytes]
 
-type Decode[MessageT] = Callable[[bytes], MessageT]
+type Decode[MessageT] = Callable[[bytes | memoryview], MessageT]
 
 
 @dataclass
 class Codec[RequestT: Request, EventT, ResponseT: Response]():
-    encode: Encode[RequestT | EventT | ResponseT]
-    decode: Decode[RequestT | EventT | ResponseT]
+    encode: Encode[RequestT | EventT | ResponseT | Cancel]
+    decode: Decode[RequestT | EventT | ResponseT | Cancel]
+    name: str = "json"
+    """Identifies the codec during the connection handshake."""
+    binary: bool = False
+    """Whether encoded messages may contain any byte, which requires a binary-safe framing."""
+    cancel: Callable[[str], Cancel] | None = None
+    """Build the message cancelling a request from its id, if the protocol has one."""
+    min_version: int = 0
+    """Lowest protocol version encoding messages the way this codec does, e.g. since a layout change."""
 
 
 type OnEvent[EventT] = Callable[[EventT, list[int]], Awaitable[None]]
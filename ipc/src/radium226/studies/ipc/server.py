@@ -1,91 +1,239 @@
 import asyncio
-from contextlib import asynccontextmanager
+import os
+import time
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from collections.abc import Sequence
+from dataclasses import dataclass
 from pathlib import Path
-from typing import AsyncIterator, Awaitable, Callable
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine
 
 from loguru import logger
 
-from .protocol import Codec, Emit, Request, Response, validate_event, validate_response
+from .handshake import HandshakeError, accept, preferences
+from .metrics import ACTIVE_CONNECTIONS, DECODE_SECONDS, HANDLER_SECONDS, NULL_METRICS, REQUESTS, Metrics
+from .protocol import Cancel, Codec, Emit, Request, Response, remaining_time, validate_event, validate_response
 from .transport import Connection, Frame, Framing, NullCharFraming, accept_connections
 
 type RequestHandler[RequestT: Request, EventT, ResponseT: Response] = Callable[[RequestT, list[int], Emit[EventT]], Awaitable[tuple[ResponseT, list[int]]]]
 
+type OverloadHandler[RequestT: Request, ResponseT: Response] = Callable[[RequestT], ResponseT]
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Admission control for request dispatch. `None` means unlimited.
+
+    A request is outstanding from the moment it is admitted until its handler returns, and
+    running while its handler holds a slot. When a connection reaches
+    `max_outstanding_requests_per_connection`, the server answers further requests with the
+    overload handler if there is one, and otherwise queues them until a request completes. The
+    connection keeps being read meanwhile, so that the client can still cancel requests to make
+    room for others.
+    """
+
+    max_concurrent_requests: int | None = None
+    max_concurrent_requests_per_connection: int | None = None
+    max_outstanding_requests_per_connection: int | None = None
+
+
+def _slots(limit: int | None) -> AbstractAsyncContextManager[Any]:
+    return asyncio.Semaphore(limit) if limit is not None else nullcontext()
+
 
 class Server[RequestT: Request, EventT, ResponseT: Response]():
     def __init__(
         self,
         socket_path: Path,
         handler: RequestHandler[RequestT, EventT, ResponseT],
-        codec: Codec[RequestT, EventT, ResponseT],
-        framing: Framing = NullCharFraming(),
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        limits: Limits = Limits(),
+        on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+        metrics: Metrics = NULL_METRICS,
     ) -> None:
         self._socket_path = socket_path
         self._handler = handler
-        self._codec = codec
-        self._framing = framing
+        # In order of preference, the first one the client also supports is used.
+        self._codecs = preferences(codec)
+        self._framings = preferences(framing)
+        self._limits = limits
+        self._on_overload = on_overload
+        self._metrics = metrics
+        self._request_slots = _slots(limits.max_concurrent_requests)
         self._connections: list[Connection] = []
+        self._tasks: set[asyncio.Task] = set()
+        self._listening = False
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _handle_request(
+        self,
+        connection: Connection,
+        codec: Codec[RequestT, EventT, ResponseT],
+        request: RequestT,
+        fds: list[int],
+        connection_slots: AbstractAsyncContextManager[Any],
+        admission: asyncio.Semaphore | None,
+        admitted: bool,
+    ) -> None:
+        handled = False
+        started_at = time.perf_counter()
+        try:
+            # The deadline covers waiting for a slot too: once it passes, nobody wants the response.
+            async with asyncio.timeout(remaining_time(request)):
+                if not admitted and admission is not None:
+                    await admission.acquire()
+                    admitted = True
+                async with connection_slots, self._request_slots:
+                    handled = True
+                    await self._run_handler(connection, codec, request, fds)
+            self._metrics.observe(HANDLER_SECONDS, time.perf_counter() - started_at)
+        except TimeoutError:
+            logger.warning("Request {} (id={}) missed its deadline, abandoning it", type(request).__name__, request.id)
+        except asyncio.CancelledError:
+            logger.info("Request {} (id={}) cancelled", type(request).__name__, request.id)
+            raise
+        finally:
+            if not handled:
+                for fd in fds:
+                    os.close(fd)
+            if admitted and admission is not None:
+                admission.release()
+
+    async def _reject(self, connection: Connection, codec: Codec[RequestT, EventT, ResponseT], request: RequestT, fds: list[int], on_overload: OverloadHandler[RequestT, ResponseT]) -> None:
+        for fd in fds:
+            os.close(fd)
+        try:
+            response = on_overload(request)
+            validate_response(request, response)
+            await connection.send_frame(Frame(codec.encode(response), []))
+        except Exception:
+            logger.exception("Failed to reject request {} (id={})", type(request).__name__, request.id)
+
+    async def _run_handler(self, connection: Connection, codec: Codec[RequestT, EventT, ResponseT], request: RequestT, fds: list[int]) -> None:
+        async def emit(event: EventT, fds: list[int] | None = None) -> None:
+            validate_event(request, event)
+            if __debug__:
+                logger.debug("Emitting event {} for request {}", type(event).__name__, request.id)
+            data = codec.encode(event)
+            try:
+                await connection.send_frame(Frame(data, fds or []))
+            except (OSError, EOFError):
+                logger.warning("Client disconnected during event emit for request {}", request.id)
+
+        try:
+            response, response_fds = await self._handler(request, fds, emit)
+            validate_response(request, response)
+            if __debug__:
+                logger.info("Sending response {} for request {} ({} fds)", type(response).__name__, request.id, len(response_fds))
+            await connection.send_frame(
+                Frame(codec.encode(response), response_fds)
+            )
+        except Exception:
+            logger.exception("Handler raised an exception for request {} (id={})", type(request).__name__, request.id)
 
     async def _handle_connection(self, connection: Connection) -> None:
         self._connections.append(connection)
+        self._metrics.increment(ACTIVE_CONNECTIONS)
         logger.info("Client connected (total connections: {})", len(self._connections))
 
+        limit = self._limits.max_outstanding_requests_per_connection
+        admission = asyncio.Semaphore(limit) if limit is not None else None
+        connection_slots = _slots(self._limits.max_concurrent_requests_per_connection)
+        # Handler tasks by request id, cancelled on request or once the client is gone.
+        running: dict[str, asyncio.Task] = {}
+
         try:
-            async for frame in connection:
-                logger.debug("Received frame ({} bytes, {} fds)", len(frame.data), len(frame.fds))
+            try:
+                wire_format, first_frame = await accept(connection, self._codecs, self._framings)
+            except (HandshakeError, EOFError, OSError) as e:
+                logger.warning("Handshake failed: {}", e)
+                return
+            codec = wire_format.codec
+
+            async def handle_frame(frame: Frame) -> None:
+                if __debug__:
+                    logger.debug("Received frame ({} bytes, {} fds)", len(frame.data), len(frame.fds))
+                decode_started_at = time.perf_counter()
                 try:
-                    message = self._codec.decode(frame.data)
+                    message = codec.decode(frame.data)
                 except Exception:
                     logger.warning("Failed to decode frame ({} bytes), skipping", len(frame.data))
-                    continue
+                    return
+                self._metrics.observe(DECODE_SECONDS, time.perf_counter() - decode_started_at)
 
                 match message:
+                    case Cancel(cancelled_id=cancelled_id):
+                        task = running.get(cancelled_id)
+                        if task is None:
+                            logger.debug("Ignoring cancellation of request {}, which is not running", cancelled_id)
+                            return
+                        logger.info("Client cancelled request {}", cancelled_id)
+                        task.cancel()
+
                     case Request() as request:
-                        logger.info("Received request {} (id={})", type(request).__name__, request.id)
-
-                        async def handle_request(request: RequestT, fds: list[int]) -> None:
-                            async def emit(event: EventT, fds: list[int] | None = None) -> None:
-                                validate_event(request, event)
-                                logger.debug("Emitting event {} for request {}", type(event).__name__, request.id)
-                                data = self._codec.encode(event)
-                                try:
-                                    await connection.send_frame(Frame(data, fds or []))
-                                except (OSError, EOFError):
-                                    logger.warning("Client disconnected during event emit for request {}", request.id)
-
-                            try:
-                                response, response_fds = await self._handler(request, fds, emit)
-                                validate_response(request, response)
-                                logger.info("Sending response {} for request {} ({} fds)", type(response).__name__, request.id, len(response_fds))
-                                await connection.send_frame(
-                                    Frame(self._codec.encode(response), response_fds)
-                                )
-                            except Exception:
-                                logger.exception("Handler raised an exception for request {} (id={})", type(request).__name__, request.id)
-
-                        asyncio.create_task(handle_request(request, frame.fds))
+                        self._metrics.increment(REQUESTS)
+                        if __debug__:
+                            logger.info("Received request {} (id={})", type(request).__name__, request.id)
+                        admitted = admission is None or not admission.locked()
+                        if not admitted:
+                            if self._on_overload is not None:
+                                logger.warning("Rejecting request {} (id={}): too many outstanding requests", type(request).__name__, request.id)
+                                await self._reject(connection, codec, request, frame.fds, self._on_overload)
+                                return
+                            # Its task waits to be admitted, while the connection keeps being read.
+                            logger.debug("Too many outstanding requests, queueing request {}", request.id)
+                        elif admission is not None:
+                            # Not locked, so this takes the slot without waiting.
+                            await admission.acquire()
+                        task = self._spawn(self._handle_request(connection, codec, request, frame.fds, connection_slots, admission, admitted))
+                        running[request.id] = task
+                        task.add_done_callback(lambda _, request_id=request.id: running.pop(request_id, None))
 
                     case _:
                         logger.warning("Received non-Request message: {}", type(message).__name__)
+
+            if first_frame is not None:
+                await handle_frame(first_frame)
+            async for frames in connection.batches():
+                for frame in frames:
+                    await handle_frame(frame)
         finally:
+            for task in list(running.values()):
+                task.cancel()
             if connection in self._connections:
                 self._connections.remove(connection)
+                self._metrics.increment(ACTIVE_CONNECTIONS, -1)
             logger.info("Client disconnected (remaining connections: {})", len(self._connections))
             await connection.aclose()
 
     async def serve(self) -> None:
         logger.info("Server listening on {}", self._socket_path)
-        async for connection in accept_connections(self._socket_path, self._framing):
-            asyncio.create_task(self._handle_connection(connection))
+        self._listening = True
+        await self.serve_connections(accept_connections(self._socket_path, metrics=self._metrics))
+
+    async def serve_connections(self, connections: AsyncIterator[Connection]) -> None:
+        """Serve connections accepted elsewhere, e.g. handed over by a supervisor process."""
+        async for connection in connections:
+            self._spawn(self._handle_connection(connection))
 
     async def wait_forever(self) -> None:
         await asyncio.get_running_loop().create_future()
 
     async def aclose(self) -> None:
         logger.info("Server shutting down ({} active connections)", len(self._connections))
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         for connection in list(self._connections):
             await connection.aclose()
         self._connections.clear()
-        if self._socket_path.exists():
+        if self._listening and self._socket_path.exists():
             self._socket_path.unlink()
             logger.debug("Removed socket file {}", self._socket_path)
 
@@ -95,10 +243,13 @@ class Server[RequestT: Request, EventT, ResponseT: Response]():
         cls,
         socket_path: Path,
         handler: RequestHandler[RequestT, EventT, ResponseT],
-        codec: Codec[RequestT, EventT, ResponseT],
-        framing: Framing = NullCharFraming(),
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        limits: Limits = Limits(),
+        on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+        metrics: Metrics = NULL_METRICS,
     ) -> AsyncIterator["Server[RequestT, EventT, ResponseT]"]:
-        server: Server[RequestT, EventT, ResponseT] = cls(socket_path, handler, codec, framing)
+        server: Server[RequestT, EventT, ResponseT] = cls(socket_path, handler, codec, framing, limits, on_overload, metrics)
         try:
             yield server
         finally:
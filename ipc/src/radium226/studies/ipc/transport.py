@@ -1,71 +1,164 @@
 import array
 import asyncio
+import os
 import socket
+import struct
+from collections import deque
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import AsyncIterator, Protocol, runtime_checkable
 
 from loguru import logger
 
+from .metrics import BYTES_RECEIVED, BYTES_SENT, FRAMES_RECEIVED, FRAMES_SENT, NULL_METRICS, SEND_QUEUE_DEPTH, Metrics
+
 MAX_BUFFER_SIZE = 16 * 1024 * 1024
 
 
 @dataclass
 class Frame:
-    data: bytes
+    """A framed payload and the fds that came along with it.
+
+    On receive, `data` is a read-only view into the connection's receive buffer: it stays valid,
+    but keeping it alive also keeps that buffer alive, so copy it with `bytes()` to hold on to it.
+    """
+
+    data: bytes | memoryview
     fds: list[int] = field(default_factory=list)
 
 
 @runtime_checkable
 class Framing(Protocol):
-    def delimit(self, data: bytes) -> bytes: ...
-    def extract(self, buffer: bytes) -> tuple[bytes | None, bytes]: ...
+    name: str
+    """Identifies the framing during the connection handshake."""
+
+    binary_safe: bool
+    """Whether payloads may contain any byte, as opposed to text payloads only."""
+
+    def delimit(self, data: bytes | memoryview) -> list[bytes | memoryview]:
+        """Return the buffers that make up the frame on the wire, without copying `data`."""
+        ...
+
+    def locate(self, buffer: bytearray, start: int, end: int) -> tuple[int, int, int] | None:
+        """Find the first complete frame in `buffer[start:end]`.
+
+        Returns `(payload_start, payload_end, frame_end)` as absolute indexes in `buffer`,
+        or `None` when more data is needed.
+        """
+        ...
 
 
 class NullCharFraming:
-    def delimit(self, data: bytes) -> bytes:
-        return data + b"\x00"
+    name = "null-char"
+    binary_safe = False
+
+    def delimit(self, data: bytes | memoryview) -> list[bytes | memoryview]:
+        return [data, b"\x00"]
+
+    def locate(self, buffer: bytearray, start: int, end: int) -> tuple[int, int, int] | None:
+        idx = buffer.find(b"\x00", start, end)
+        if idx == -1:
+            return None
+        return start, idx, idx + 1
+
+
+class LengthPrefixedFraming:
+    """Frames are prefixed with their payload size as a big-endian unsigned 32-bit integer.
+
+    The payload is never scanned, so extracting a frame costs O(frame) whatever its content.
+    """
+
+    name = "length-prefixed"
+    binary_safe = True
+
+    _HEADER = struct.Struct("!I")
+    _MAX_PAYLOAD_SIZE = MAX_BUFFER_SIZE - _HEADER.size
+
+    def delimit(self, data: bytes | memoryview) -> list[bytes | memoryview]:
+        if len(data) > self._MAX_PAYLOAD_SIZE:
+            raise BufferError(f"Frame of {len(data)} bytes exceeds {self._MAX_PAYLOAD_SIZE} bytes")
+        return [self._HEADER.pack(len(data)), data]
 
-    def extract(self, buffer: bytes) -> tuple[bytes | None, bytes]:
-        if b"\x00" not in buffer:
-            return None, buffer
-        idx = buffer.index(b"\x00")
-        return buffer[:idx], buffer[idx + 1:]
+    def locate(self, buffer: bytearray, start: int, end: int) -> tuple[int, int, int] | None:
+        payload_start = start + self._HEADER.size
+        if end < payload_start:
+            return None
+        (size,) = self._HEADER.unpack_from(buffer, start)
+        if size > self._MAX_PAYLOAD_SIZE:
+            raise BufferError(f"Announced frame of {size} bytes exceeds {self._MAX_PAYLOAD_SIZE} bytes")
+        payload_end = payload_start + size
+        if end < payload_end:
+            return None
+        return payload_start, payload_end, payload_end
 
 
 _CMSG_SPACE_SIZE = 256  # large enough for a few FDs
 
+_MIN_RECEIVE_SIZE = 4096
+
+_MAX_RECEIVE_SIZE = 1024 * 1024
+
+_INITIAL_BUFFER_SIZE = 64 * 1024
+
+SEND_QUEUE_SIZE = 1024
+
+_MAX_FRAMES_PER_SEND = 256  # keeps the iovec list well below IOV_MAX
+
+# Delimited buffers, fds, and the future to resolve once written (only set for frames with fds).
+type _QueuedFrame = tuple[list[bytes | memoryview], list[int], asyncio.Future[None] | None]
 
 class Connection:
-    def __init__(self, sock: socket.socket, framing: Framing) -> None:
+    def __init__(self, sock: socket.socket, framing: Framing, metrics: Metrics = NULL_METRICS) -> None:
         self._socket = sock
         self._socket.setblocking(False)
         self._framing = framing
-        self._buffer = b""
+        self._metrics = metrics
+        # Received bytes live in `_buffer[_read_offset:_write_offset]`. Bytes before `_read_offset`
+        # may still be referenced by frames handed out earlier, so they are never overwritten:
+        # when space runs out, the unread bytes move to a fresh buffer instead.
+        self._buffer = bytearray(_INITIAL_BUFFER_SIZE)
+        self._read_offset = 0
+        self._write_offset = 0
+        self._receive_size = _MIN_RECEIVE_SIZE
+        # Stream offset of `_buffer[0]`, used to attach fds to the right frame.
+        self._buffer_position = 0
+        # fds received with a chunk belong to the frame holding the last byte of that chunk,
+        # because the kernel stops a read right after the message carrying them.
+        self._pending_fds: deque[tuple[int, list[int]]] = deque()
         self._read_waiter: asyncio.Future | None = None
+        self._reading = False
         self._write_waiter: asyncio.Future | None = None
+        self._send_queue: asyncio.Queue[_QueuedFrame] = asyncio.Queue(SEND_QUEUE_SIZE)
+        self._send_task: asyncio.Task | None = None
+        self._send_error: OSError | None = None
 
     @classmethod
-    def from_socket(cls, sock: socket.socket, framing: Framing = NullCharFraming()) -> "Connection":
-        return cls(sock, framing)
+    def from_socket(cls, sock: socket.socket, framing: Framing = NullCharFraming(), metrics: Metrics = NULL_METRICS) -> "Connection":
+        return cls(sock, framing, metrics)
 
-    async def _wait_readable(self, loop: asyncio.AbstractEventLoop) -> None:
-        fd = self._socket.fileno()
-        self._read_waiter = loop.create_future()
+    def set_framing(self, framing: Framing) -> None:
+        """Frame everything sent or received from now on with `framing`, e.g. once negotiated."""
+        self._framing = framing
 
-        def _on_readable() -> None:
-            loop.remove_reader(fd)
-            waiter = self._read_waiter
-            if waiter is not None and not waiter.done():
-                waiter.set_result(None)
+    def _on_readable(self) -> None:
+        waiter = self._read_waiter
+        if waiter is None or waiter.done():
+            # Nobody is reading, e.g. while a frame is being handled: stop watching the socket rather
+            # than being called again on every iteration of the loop until somebody does.
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._reading = False
+            return
+        waiter.set_result(None)
 
-        loop.add_reader(fd, _on_readable)
+    async def _wait_readable(self, loop: asyncio.AbstractEventLoop) -> None:
+        # The reader callback stays registered between waits, so a connection that keeps receiving
+        # does not add and remove it for every chunk.
+        self._read_waiter = loop.create_future()
+        if not self._reading:
+            loop.add_reader(self._socket.fileno(), self._on_readable)
+            self._reading = True
         try:
             await self._read_waiter
-        except asyncio.CancelledError:
-            if self._socket.fileno() != -1:
-                loop.remove_reader(self._socket.fileno())
-            raise
         finally:
             self._read_waiter = None
 
@@ -90,79 +183,230 @@ class Connection:
             self._write_waiter = None
 
     async def send_frame(self, frame: Frame) -> None:
+        """Queue *frame* for the connection's writer task, waiting while the queue is full.
+
+        Frames are written in call order. A frame carrying fds is only acknowledged once it has
+        been written, so callers may close their fds as soon as this returns.
+        """
+        self._raise_send_error()
+        if self._send_task is None:
+            self._send_task = asyncio.create_task(self._send_loop())
+
+        buffers = self._framing.delimit(frame.data)
+        sent = asyncio.get_running_loop().create_future() if frame.fds else None
+        await self._send_queue.put((buffers, frame.fds, sent))
+        self._metrics.observe(SEND_QUEUE_DEPTH, self._send_queue.qsize())
+        # The writer may have failed while we were waiting for room in the queue.
+        self._raise_send_error()
+        if sent is not None:
+            await sent
+
+    def _raise_send_error(self) -> None:
+        if self._send_error is not None:
+            self._fail_pending_sends([], None, self._send_error)
+            raise self._send_error
+
+    async def drain(self) -> None:
+        """Wait until every queued frame has been written."""
+        await self._send_queue.join()
+        self._raise_send_error()
+
+    async def _send_loop(self) -> None:
         loop = asyncio.get_running_loop()
-        data = self._framing.delimit(frame.data)
-        ancdata: list = (
-            [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", frame.fds))]
-            if frame.fds else []
-        )
-        while data:
+        queue = self._send_queue
+        batch: list[_QueuedFrame] = []
+        carried: _QueuedFrame | None = None
+        try:
+            while True:
+                batch.append(carried if carried is not None else await queue.get())
+                carried = None
+                # The kernel hands fds over with the read that reaches the end of the message
+                # carrying them, so a frame with fds must be the only frame of its sendmsg.
+                fds = batch[0][1]
+                if not fds:
+                    while not queue.empty() and len(batch) < _MAX_FRAMES_PER_SEND:
+                        item = queue.get_nowait()
+                        if item[1]:
+                            carried = item
+                            break
+                        batch.append(item)
+
+                buffers = [buffer for frame_buffers, _, _ in batch for buffer in frame_buffers]
+                ancdata: list = (
+                    [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+                    if fds else []
+                )
+
+                while buffers:
+                    try:
+                        n = self._socket.sendmsg(buffers, ancdata)
+                    except BlockingIOError:
+                        await self._wait_writable(loop)
+                        continue
+                    self._metrics.increment(BYTES_SENT, n)
+                    ancdata = []
+                    while buffers and n >= len(buffers[0]):
+                        n -= len(buffers.pop(0))
+                    if n:
+                        buffers[0] = memoryview(buffers[0])[n:]
+
+                self._metrics.increment(FRAMES_SENT, len(batch))
+                for _, _, sent in batch:
+                    if sent is not None and not sent.done():
+                        sent.set_result(None)
+                    queue.task_done()
+                batch.clear()
+        except OSError as e:
+            self._send_error = e
+            self._fail_pending_sends(batch, carried, e)
+        except asyncio.CancelledError:
+            self._fail_pending_sends(batch, carried, ConnectionError("Connection closed"))
+            raise
+
+    def _fail_pending_sends(
+        self,
+        batch: list[_QueuedFrame],
+        carried: _QueuedFrame | None,
+        error: BaseException,
+    ) -> None:
+        if carried is not None:
+            batch.append(carried)
+        while not self._send_queue.empty():
+            batch.append(self._send_queue.get_nowait())
+        for _, _, sent in batch:
+            if sent is not None and not sent.done():
+                sent.set_exception(error)
+            self._send_queue.task_done()
+        batch.clear()
+
+    def _extract_frame(self) -> Frame | None:
+        located = self._framing.locate(self._buffer, self._read_offset, self._write_offset)
+        if located is None:
+            return None
+        payload_start, payload_end, frame_end = located
+        self._read_offset = frame_end
+
+        fds: list[int] = []
+        frame_position = self._buffer_position + frame_end
+        while self._pending_fds and self._pending_fds[0][0] <= frame_position:
+            fds.extend(self._pending_fds.popleft()[1])
+
+        return Frame(memoryview(self._buffer)[payload_start:payload_end].toreadonly(), fds)
+
+    def _reserve(self, size: int) -> None:
+        if len(self._buffer) - self._write_offset >= size:
+            return
+        unread = self._write_offset - self._read_offset
+        buffer_size = len(self._buffer)
+        while buffer_size < unread + size:
+            buffer_size *= 2
+        buffer = bytearray(buffer_size)
+        buffer[:unread] = memoryview(self._buffer)[self._read_offset:self._write_offset]
+        self._buffer_position += self._read_offset
+        self._buffer = buffer
+        self._read_offset = 0
+        self._write_offset = unread
+
+    async def _receive_chunk(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._write_offset - self._read_offset > MAX_BUFFER_SIZE:
+            raise BufferError(
+                f"Receive buffer exceeded {MAX_BUFFER_SIZE} bytes"
+            )
+
+        receive_size = self._receive_size
+        self._reserve(receive_size)
+        while True:
             try:
-                n = self._socket.sendmsg([data], ancdata)
-                data = data[n:]
-                ancdata = []
+                size, ancdata, _flags, _addr = self._socket.recvmsg_into(
+                    [memoryview(self._buffer)[self._write_offset:self._write_offset + receive_size]],
+                    _CMSG_SPACE_SIZE,
+                    # Like any fd Python opens, so that children only inherit the ones given to them.
+                    socket.MSG_CMSG_CLOEXEC,
+                )
+                break
             except BlockingIOError:
-                await self._wait_writable(loop)
+                await self._wait_readable(loop)
+            except ConnectionResetError as e:
+                raise EOFError("Connection reset") from e
+
+        if not size:
+            raise EOFError("Connection closed")
+
+        self._write_offset += size
+        self._metrics.increment(BYTES_RECEIVED, size)
+
+        # Read more at once while the peer keeps the socket full, and fall back once it calms down.
+        if size == receive_size:
+            self._receive_size = min(receive_size * 2, _MAX_RECEIVE_SIZE)
+        elif size < receive_size // 4:
+            self._receive_size = max(receive_size // 2, _MIN_RECEIVE_SIZE)
+
+        for cmsg_level, cmsg_type, cmsg_data in ancdata:
+            if cmsg_level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+                fds_array = array.array("i")
+                fds_array.frombytes(
+                    cmsg_data[: len(cmsg_data) - (len(cmsg_data) % fds_array.itemsize)]
+                )
+                self._pending_fds.append((self._buffer_position + self._write_offset, list(fds_array)))
 
     async def receive_frame(self) -> Frame:
         loop = asyncio.get_running_loop()
-        all_fds: list[int] = []
-
         while True:
-            frame_data, self._buffer = self._framing.extract(self._buffer)
-            if frame_data is not None:
-                return Frame(frame_data, all_fds)
-
-            if len(self._buffer) > MAX_BUFFER_SIZE:
-                raise BufferError(
-                    f"Receive buffer exceeded {MAX_BUFFER_SIZE} bytes"
-                )
-
-            while True:
-                try:
-                    msg, ancdata, _flags, _addr = self._socket.recvmsg(4096, _CMSG_SPACE_SIZE)
-                    break
-                except BlockingIOError:
-                    await self._wait_readable(loop)
-                except ConnectionResetError as e:
-                    raise EOFError("Connection reset") from e
-
-            if not msg:
-                raise EOFError("Connection closed")
-
-            self._buffer += msg
-
-            for cmsg_level, cmsg_type, cmsg_data in ancdata:
-                if cmsg_level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
-                    fds_array = array.array("i")
-                    fds_array.frombytes(
-                        cmsg_data[: len(cmsg_data) - (len(cmsg_data) % fds_array.itemsize)]
-                    )
-                    all_fds.extend(fds_array)
-
-    async def __aiter__(self) -> AsyncIterator[Frame]:
+            frame = self._extract_frame()
+            if frame is not None:
+                self._metrics.increment(FRAMES_RECEIVED)
+                return frame
+            await self._receive_chunk(loop)
+
+    async def receive_frames(self) -> list[Frame]:
+        """Wait for at least one frame, then return every complete frame already buffered."""
+        loop = asyncio.get_running_loop()
+        while True:
+            frames: list[Frame] = []
+            while (frame := self._extract_frame()) is not None:
+                frames.append(frame)
+            if frames:
+                self._metrics.increment(FRAMES_RECEIVED, len(frames))
+                return frames
+            await self._receive_chunk(loop)
+
+    async def batches(self) -> AsyncIterator[list[Frame]]:
         while True:
             try:
-                yield await self.receive_frame()
+                yield await self.receive_frames()
             except (EOFError, OSError):
                 return
 
+    async def __aiter__(self) -> AsyncIterator[Frame]:
+        async for frames in self.batches():
+            for frame in frames:
+                yield frame
+
     async def aclose(self) -> None:
         loop = asyncio.get_running_loop()
+        if self._send_task is not None:
+            self._send_task.cancel()
+            try:
+                await self._send_task
+            except asyncio.CancelledError:
+                pass
+        self._send_error = self._send_error or ConnectionError("Connection closed")
         fd = self._socket.fileno()
         if fd != -1:
             loop.remove_reader(fd)
+            self._reading = False
             loop.remove_writer(fd)
             if self._read_waiter is not None and not self._read_waiter.done():
                 self._read_waiter.cancel()
             if self._write_waiter is not None and not self._write_waiter.done():
                 self._write_waiter.cancel()
         self._socket.close()
+        while self._pending_fds:
+            for fd in self._pending_fds.popleft()[1]:
+                os.close(fd)
 
 
-async def accept_connections(
-    path: Path, framing: Framing = NullCharFraming()
-) -> AsyncIterator[Connection]:
+async def accept_sockets(path: Path) -> AsyncIterator[socket.socket]:
     loop = asyncio.get_running_loop()
     server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     if path.exists():
@@ -174,16 +418,23 @@ async def accept_connections(
     try:
         while True:
             client_sock, _ = await loop.sock_accept(server_sock)
-            yield Connection.from_socket(client_sock, framing)
+            yield client_sock
     finally:
         server_sock.close()
 
 
+async def accept_connections(
+    path: Path, framing: Framing = NullCharFraming(), metrics: Metrics = NULL_METRICS
+) -> AsyncIterator[Connection]:
+    async for client_sock in accept_sockets(path):
+        yield Connection.from_socket(client_sock, framing, metrics)
+
+
 async def open_connection(
-    path: Path, framing: Framing = NullCharFraming()
+    path: Path, framing: Framing = NullCharFraming(), metrics: Metrics = NULL_METRICS
 ) -> Connection:
     loop = asyncio.get_running_loop()
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     sock.setblocking(False)
     await loop.sock_connect(sock, str(path))
-    return Connection.from_socket(sock, framing)
+    return Connection.from_socket(sock, framing, metrics)
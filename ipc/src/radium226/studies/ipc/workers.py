@@ -0,0 +1,224 @@
+"""Serve a socket from several worker processes.
+
+The supervisor owns the listening socket and accepts connections itself. It hands each
+connection over to one of its workers through a channel: a unix socket pair, on which the
+accepted socket travels as an fd of an otherwise empty frame. Every worker runs a `Server` on
+its own event loop, so decoding, validation and handlers spread across cores.
+
+Workers are started with the `spawn` method, so the handler, codecs and framings must be
+picklable, e.g. defined at module level. A worker that dies is restarted; the connections it was
+serving are lost and their clients see the connection close.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+import socket
+import time
+from collections.abc import Sequence
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import AsyncIterator
+
+from loguru import logger
+
+from .protocol import Codec, Request, Response
+from .server import Limits, OverloadHandler, RequestHandler, Server
+from .transport import Connection, Frame, Framing, NullCharFraming, accept_sockets
+
+# A worker dying sooner than this after being started is restarted with a delay, so that one
+# failing on startup does not keep the supervisor busy respawning it.
+_MIN_WORKER_LIFETIME = 1.0
+
+_RESTART_DELAY = 1.0
+
+_HANDOVER = b"connection"
+
+_READY = b"ready"
+
+
+async def _received_connections(channel: Connection) -> AsyncIterator[Connection]:
+    async for frame in channel:
+        for fd in frame.fds:
+            yield Connection.from_socket(socket.socket(fileno=fd))
+
+
+async def _serve_worker[RequestT: Request, EventT, ResponseT: Response](
+    channel_socket: socket.socket,
+    server: Server[RequestT, EventT, ResponseT],
+) -> None:
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+
+    channel = Connection.from_socket(channel_socket)
+    await channel.send_frame(Frame(_READY, []))
+    serving = asyncio.create_task(server.serve_connections(_received_connections(channel)))
+    waiting = asyncio.create_task(stopping.wait())
+    try:
+        # Stop once asked to, or once the supervisor is gone and no connection can come anymore.
+        await asyncio.wait([serving, waiting], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        serving.cancel()
+        waiting.cancel()
+        await server.aclose()
+        await channel.aclose()
+
+
+def _run_worker[RequestT: Request, EventT, ResponseT: Response](
+    channel_socket: socket.socket,
+    socket_path: Path,
+    handler: RequestHandler[RequestT, EventT, ResponseT],
+    codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+    framing: Framing | Sequence[Framing],
+    limits: Limits,
+    on_overload: OverloadHandler[RequestT, ResponseT] | None,
+) -> None:
+    # Interrupting the terminal reaches every process of the group: leave it to the supervisor.
+    # Through a handler doing nothing rather than by ignoring it, as handlers are reset on exec
+    # while an ignored SIGINT would be passed on to the processes the worker spawns.
+    signal.signal(signal.SIGINT, lambda *_: None)
+    server = Server(socket_path, handler, codec, framing, limits, on_overload)
+    asyncio.run(_serve_worker(channel_socket, server))
+
+
+@dataclass
+class _Worker:
+    process: BaseProcess
+    channel: Connection
+    started_at: float
+
+
+class Supervisor[RequestT: Request, EventT, ResponseT: Response]():
+    def __init__(
+        self,
+        socket_path: Path,
+        handler: RequestHandler[RequestT, EventT, ResponseT],
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        limits: Limits = Limits(),
+        on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+        worker_count: int = 2,
+    ) -> None:
+        if worker_count < 1:
+            raise ValueError(f"Worker count must be at least 1, got {worker_count}")
+        self._socket_path = socket_path
+        self._worker_args = (socket_path, handler, codec, framing, limits, on_overload)
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: list[_Worker | None] = [None] * worker_count
+        self._next_worker = 0
+        self._closing = False
+        self._restarts: set[asyncio.Task] = set()
+
+    @property
+    def worker_pids(self) -> list[int | None]:
+        return [worker.process.pid if worker is not None else None for worker in self._workers]
+
+    def _start_worker(self, index: int) -> None:
+        supervisor_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        process = self._context.Process(
+            target=_run_worker,
+            args=(worker_end, *self._worker_args),
+            name=f"ipc-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        worker_end.close()
+        worker = _Worker(process, Connection.from_socket(supervisor_end), time.monotonic())
+        self._workers[index] = worker
+        asyncio.get_running_loop().add_reader(process.sentinel, self._on_worker_exit, index, worker)
+        logger.info("Started worker {} (pid={})", index, process.pid)
+
+    def _on_worker_exit(self, index: int, worker: _Worker) -> None:
+        asyncio.get_running_loop().remove_reader(worker.process.sentinel)
+        worker.process.join()
+        if self._workers[index] is worker:
+            self._workers[index] = None
+        task = asyncio.create_task(self._replace_worker(index, worker))
+        self._restarts.add(task)
+        task.add_done_callback(self._restarts.discard)
+
+    async def _replace_worker(self, index: int, worker: _Worker) -> None:
+        await worker.channel.aclose()
+        if self._closing:
+            return
+        logger.warning("Worker {} (pid={}) exited with code {}, restarting it", index, worker.process.pid, worker.process.exitcode)
+        if time.monotonic() - worker.started_at < _MIN_WORKER_LIFETIME:
+            await asyncio.sleep(_RESTART_DELAY)
+        if not self._closing and self._workers[index] is None:
+            self._start_worker(index)
+
+    def _pick_worker(self) -> _Worker | None:
+        # Round robin over the workers that are running.
+        for _ in range(len(self._workers)):
+            worker = self._workers[self._next_worker]
+            self._next_worker = (self._next_worker + 1) % len(self._workers)
+            if worker is not None:
+                return worker
+        return None
+
+    async def _wait_ready(self, worker: _Worker) -> None:
+        try:
+            await worker.channel.receive_frame()
+        except (OSError, EOFError):
+            logger.warning("Worker (pid={}) exited before being ready", worker.process.pid)
+
+    async def serve(self) -> None:
+        for index in range(len(self._workers)):
+            self._start_worker(index)
+        # Importing the handler takes a while in a spawned process: only listen once the workers
+        # can take connections, or the first clients would time out on the handshake.
+        await asyncio.gather(*(self._wait_ready(worker) for worker in self._workers if worker is not None))
+        logger.info("Supervisor listening on {} with {} workers", self._socket_path, len(self._workers))
+        async for client_sock in accept_sockets(self._socket_path):
+            with client_sock:
+                worker = self._pick_worker()
+                if worker is None:
+                    logger.warning("No worker is running, dropping connection")
+                    continue
+                try:
+                    # Returns once the fd is written, after which our copy can be closed.
+                    await worker.channel.send_frame(Frame(_HANDOVER, [client_sock.fileno()]))
+                except (OSError, EOFError):
+                    logger.warning("Failed to hand a connection over to worker (pid={})", worker.process.pid)
+
+    async def wait_forever(self) -> None:
+        await asyncio.get_running_loop().create_future()
+
+    async def aclose(self) -> None:
+        self._closing = True
+        loop = asyncio.get_running_loop()
+        workers = [worker for worker in self._workers if worker is not None]
+        for worker in workers:
+            loop.remove_reader(worker.process.sentinel)
+            worker.process.terminate()
+        for worker in workers:
+            await loop.run_in_executor(None, worker.process.join)
+            await worker.channel.aclose()
+        self._workers = [None] * len(self._workers)
+        for task in list(self._restarts):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        if self._socket_path.exists():
+            self._socket_path.unlink()
+
+    @classmethod
+    @asynccontextmanager
+    async def open(
+        cls,
+        socket_path: Path,
+        handler: RequestHandler[RequestT, EventT, ResponseT],
+        codec: Codec[RequestT, EventT, ResponseT] | Sequence[Codec[RequestT, EventT, ResponseT]],
+        framing: Framing | Sequence[Framing] = NullCharFraming(),
+        limits: Limits = Limits(),
+        on_overload: OverloadHandler[RequestT, ResponseT] | None = None,
+        worker_count: int = 2,
+    ) -> AsyncIterator["Supervisor[RequestT, EventT, ResponseT]"]:
+        supervisor: Supervisor[RequestT, EventT, ResponseT] = cls(socket_path, handler, codec, framing, limits, on_overload, worker_count)
+        try:
+            yield supervisor
+        finally:
+            await supervisor.aclose()
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import signal
+
+from radium226.studies.ipc.cli.app import handle_request
+from radium226.studies.ipc.cli.messages import (
+    CommandNotFound,
+    KillProcess,
+    ListProcesses,
+    ProcessKilled,
+    ProcessList,
+    ProcessNotFound,
+    ProcessOutput,
+    ProcessStarted,
+    ProcessTerminated,
+    RequestFailed,
+    RunProcess,
+)
+from radium226.studies.ipc.cli.processes import ForkServerSpawner, ProcessRegistry, Reaper
+
+
+async def _run(request, events: list, processes: ProcessRegistry | None = None):
+    async def emit(event, fds: list[int] | None = None) -> None:
+        events.append(event)
+
+    response, _ = await handle_request(request, [], emit, processes or ProcessRegistry())
+    return response
+
+
+def test_stream_relays_output_before_the_response():
+    events: list = []
+    request = RunProcess(id="stream", command="sh", args=["-c", "echo out; echo err >&2; exit 3"], io="stream")
+    response = asyncio.run(_run(request, events))
+
+    assert isinstance(events[0], ProcessStarted)
+    output = {stream: b"".join(event.data for event in events if isinstance(event, ProcessOutput) and event.stream == stream) for stream in ("stdout", "stderr")}
+    assert output == {"stdout": b"out\n", "stderr": b"err\n"}
+    assert isinstance(response, ProcessTerminated)
+    assert response.exit_code == 3
+
+
+def test_stream_relays_large_output_in_batches():
+    events: list = []
+    request = RunProcess(id="large", command="head", args=["-c", "1000000", "/dev/zero"], io="stream")
+    asyncio.run(_run(request, events))
+
+    outputs = [event for event in events if isinstance(event, ProcessOutput)]
+    assert sum(len(event.data) for event in outputs) == 1_000_000
+    assert len(outputs) < 100
+
+
+def test_stream_command_not_found():
+    events: list = []
+    response = asyncio.run(_run(RunProcess(id="missing", command="nonexistent-command", io="stream"), events))
+    assert response == CommandNotFound(request_id="missing", command="nonexistent-command")
+    assert events == []
+
+
+def _ignored_signals(processes: ProcessRegistry) -> set[signal.Signals]:
+    """Return the signals ignored by a process run through *processes*."""
+    events: list = []
+    asyncio.run(_run(RunProcess(id="status", command="grep", args=["SigIgn", "/proc/self/status"], io="stream"), events, processes))
+    mask = int(b"".join(event.data for event in events if isinstance(event, ProcessOutput)).split()[1], 16)
+    return {sig for sig in signal.Signals if mask & (1 << (sig - 1))}
+
+
+def test_processes_do_not_inherit_ignored_signals():
+    assert not _ignored_signals(ProcessRegistry()) & {signal.SIGPIPE, signal.SIGXFSZ}
+
+
+def test_kill_process_only_signals_processes_of_the_registry():
+    async def run() -> tuple:
+        processes = ProcessRegistry()
+        running = asyncio.create_task(_run(RunProcess(id="sleep", command="sleep", args=["10"], io="stream"), [], processes))
+        while not processes.processes:
+            await asyncio.sleep(0.001)
+        pid = processes.processes[0].pid
+        unknown = await _run(KillProcess(id="unknown", pid=1, signal=signal.SIGTERM), [], processes)
+        killed = await _run(KillProcess(id="kill", pid=pid, signal=signal.SIGTERM), [], processes)
+        return pid, unknown, killed, await running
+
+    pid, unknown, killed, terminated = asyncio.run(run())
+    assert unknown == ProcessNotFound(request_id="unknown", pid=1)
+    assert killed == ProcessKilled(request_id="kill", pid=pid)
+    assert terminated.exit_code == -signal.SIGTERM
+
+
+def test_list_processes():
+    async def run() -> ProcessList:
+        processes = ProcessRegistry()
+        running = asyncio.create_task(_run(RunProcess(id="sleep", command="sleep", args=["10"], io="stream"), [], processes))
+        while not processes.processes:
+            await asyncio.sleep(0.001)
+        listed = await _run(ListProcesses(id="list"), [], processes)
+        await _run(KillProcess(id="kill", pid=processes.processes[0].pid, signal=signal.SIGKILL), [], processes)
+        await running
+        assert (await _run(ListProcesses(id="empty"), [], processes)).processes == []
+        return listed
+
+    listed = asyncio.run(run())
+    assert [(process.request_id, process.command, process.args) for process in listed.processes] == [("sleep", "sleep", ["10"])]
+
+
+def test_workers_refuse_what_their_registry_cannot_tell():
+    async def run() -> tuple:
+        processes = ProcessRegistry(exhaustive=False)
+        return (
+            await _run(ListProcesses(id="list"), [], processes),
+            await _run(KillProcess(id="kill", pid=1, signal=signal.SIGTERM), [], processes),
+        )
+
+    listed, killed = asyncio.run(run())
+    assert isinstance(listed, RequestFailed)
+    assert isinstance(killed, RequestFailed)
+
+
+def test_reaper_reports_the_exit_to_every_watcher():
+    async def run() -> tuple:
+        reaper = Reaper()
+        pid = os.posix_spawnp("sh", ["sh", "-c", "exit 3"], os.environ)
+        exited = reaper.watch(pid)
+        assert reaper.watch(pid) is exited
+        await asyncio.sleep(0.2)
+        # Already reaped: the future is all that is left of it.
+        return pid, await exited, await asyncio.gather(exited, exited)
+
+    pid, exit, exits = asyncio.run(run())
+    assert exit.exit_code == 3
+    assert exit.wall_seconds > 0
+    assert exits == [exit, exit]
+    assert not _is_running(pid)
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # Once terminated, it stays a zombie until whoever inherited it reaps it.
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_fork_server_spawns_processes():
+    async def run() -> tuple:
+        processes = ProcessRegistry(ForkServerSpawner())
+        return (
+            await _run(RunProcess(id="exit", command="sh", args=["-c", "echo out; exit 3"], io="stream"), events := [], processes),
+            await _run(RunProcess(id="missing", command="nonexistent-command", io="stream"), [], processes),
+            events,
+        )
+
+    terminated, missing, events = asyncio.run(run())
+    assert terminated.exit_code == 3
+    assert b"".join(event.data for event in events if isinstance(event, ProcessOutput)) == b"out\n"
+    assert missing == CommandNotFound(request_id="missing", command="nonexistent-command")
+
+
+def test_fork_server_processes_do_not_inherit_ignored_signals():
+    assert not _ignored_signals(ProcessRegistry(ForkServerSpawner())) & {signal.SIGINT, signal.SIGPIPE, signal.SIGXFSZ}
+
+
+def test_fork_server_processes_end_on_forwarded_sigint():
+    async def run() -> ProcessTerminated:
+        processes = ProcessRegistry(ForkServerSpawner())
+        running = asyncio.create_task(_run(RunProcess(id="sleep", command="sleep", args=["10"], io="stream"), [], processes))
+        while not processes.processes:
+            await asyncio.sleep(0.001)
+        await _run(KillProcess(id="interrupt", pid=processes.processes[0].pid, signal=signal.SIGINT), [], processes)
+        async with asyncio.timeout(5):
+            return await running
+
+    assert asyncio.run(run()).exit_code == -signal.SIGINT
+
+
+def test_fork_server_refuses_oversized_command_lines():
+    async def run() -> tuple:
+        processes = ProcessRegistry(ForkServerSpawner())
+        return (
+            await _run(RunProcess(id="large", command="true", args=["x" * 300_000], io="stream"), [], processes),
+            await _run(RunProcess(id="small", command="true", io="stream"), [], processes),
+        )
+
+    large, small = asyncio.run(run())
+    assert isinstance(large, RequestFailed)
+    assert small.exit_code == 0
+
+
+def test_fork_server_dying_fails_requests_and_terminates_their_processes():
+    async def run() -> tuple:
+        spawner = ForkServerSpawner()
+        processes = ProcessRegistry(spawner)
+        running = asyncio.create_task(_run(RunProcess(id="sleep", command="sleep", args=["10"], io="stream"), [], processes))
+        while not processes.processes:
+            await asyncio.sleep(0.001)
+        pid = processes.processes[0].pid
+        os.kill(spawner._helper_pid, signal.SIGKILL)
+        async with asyncio.timeout(5):
+            response = await running
+        # A new helper is started for the next process.
+        return pid, response, await _run(RunProcess(id="after", command="true", io="stream"), [], processes)
+
+    pid, response, after = asyncio.run(run())
+    assert isinstance(response, RequestFailed)
+    assert not _is_running(pid)
+    assert after.exit_code == 0
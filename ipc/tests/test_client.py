@@ -0,0 +1,144 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC
+from radium226.studies.ipc.cli.messages import ProcessStarted, ProcessTerminated, RunProcess
+from radium226.studies.ipc.ipc import open_client, open_server
+from radium226.studies.ipc.protocol import ResponseHandler
+
+
+@asynccontextmanager
+async def _serving(socket_path: Path, handler, **kwargs) -> AsyncIterator[None]:
+    async with open_server(socket_path, JSON_CODEC, handler=handler, **kwargs):
+        yield
+
+
+def _collect(events: list, responses: list) -> ResponseHandler:
+    async def on_event(event, fds: list[int]) -> None:
+        events.append(event)
+
+    async def on_response(response, fds: list[int]) -> None:
+        responses.append(response)
+
+    return ResponseHandler(on_event=on_event, on_response=on_response)
+
+
+def test_events_are_routed_to_their_request(tmp_path: Path):
+    async def handler(request: RunProcess, fds: list[int], emit):
+        pid = int(request.args[0])
+        await emit(ProcessStarted(pid=pid, request_id=request.id))
+        # Interleave the events of concurrent requests.
+        await asyncio.sleep(0.01)
+        await emit(ProcessStarted(pid=pid + 1, request_id=request.id))
+        return ProcessTerminated(request_id=request.id, exit_code=pid), []
+
+    async def run() -> dict[str, tuple[list, list]]:
+        collected: dict[str, tuple[list, list]] = {"a": ([], []), "b": ([], [])}
+        async with _serving(tmp_path / "ipc.sock", handler):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                await asyncio.gather(
+                    client.request(RunProcess(id="a", command="true", args=["10"]), handler=_collect(*collected["a"])),
+                    client.request(RunProcess(id="b", command="true", args=["20"]), handler=_collect(*collected["b"])),
+                )
+        return collected
+
+    collected = asyncio.run(run())
+    assert [event.pid for event in collected["a"][0]] == [10, 11]
+    assert [event.pid for event in collected["b"][0]] == [20, 21]
+    assert [response.exit_code for response in collected["a"][1]] == [10]
+    assert [response.exit_code for response in collected["b"][1]] == [20]
+
+
+def test_untagged_events_go_to_every_pending_request(tmp_path: Path):
+    async def run() -> tuple[list, list]:
+        both_pending = asyncio.Barrier(2)
+
+        async def handler(request: RunProcess, fds: list[int], emit):
+            await both_pending.wait()
+            if request.id == "a":
+                await emit(ProcessStarted(pid=1))
+            await asyncio.sleep(0.01)
+            return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+        a_events: list = []
+        b_events: list = []
+        async with _serving(tmp_path / "ipc.sock", handler):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                await asyncio.gather(
+                    client.request(RunProcess(id="a", command="true"), handler=_collect(a_events, [])),
+                    client.request(RunProcess(id="b", command="true"), handler=_collect(b_events, [])),
+                )
+        return a_events, b_events
+
+    a_events, b_events = asyncio.run(run())
+    assert [event.pid for event in a_events] == [1]
+    assert [event.pid for event in b_events] == [1]
+
+
+def _sleeping_handler(cancelled: list[str]):
+    async def handler(request: RunProcess, fds: list[int], emit):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(request.id)
+            raise
+        return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+    return handler
+
+
+async def _wait_for(condition) -> None:
+    async with asyncio.timeout(1):
+        while not condition():
+            await asyncio.sleep(0.001)
+
+
+def test_timeout_cancels_the_request_on_the_server(tmp_path: Path):
+    cancelled: list[str] = []
+
+    async def run() -> None:
+        async with _serving(tmp_path / "ipc.sock", _sleeping_handler(cancelled)):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                with pytest.raises(TimeoutError):
+                    await client.request(RunProcess(id="slow", command="true"), timeout=0.05)
+                assert client.pending_count == 0
+                await _wait_for(lambda: cancelled)
+
+    asyncio.run(run())
+    assert cancelled == ["slow"]
+
+
+def test_deadline_bounds_the_request_on_both_ends(tmp_path: Path):
+    cancelled: list[str] = []
+
+    async def run() -> None:
+        async with _serving(tmp_path / "ipc.sock", _sleeping_handler(cancelled)):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                request = RunProcess(id="late", command="true", deadline=time.time() + 0.05)
+                with pytest.raises(TimeoutError):
+                    await client.request(request)
+                await _wait_for(lambda: cancelled)
+
+    asyncio.run(run())
+    assert cancelled == ["late"]
+
+
+def test_disconnecting_cancels_running_requests(tmp_path: Path):
+    cancelled: list[str] = []
+
+    async def run() -> None:
+        async with _serving(tmp_path / "ipc.sock", _sleeping_handler(cancelled)):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                requesting = asyncio.create_task(client.request(RunProcess(id="orphan", command="true")))
+                await asyncio.sleep(0.05)
+            with pytest.raises(ConnectionError):
+                await requesting
+            await _wait_for(lambda: cancelled)
+
+    asyncio.run(run())
+    assert cancelled == ["orphan"]
@@ -0,0 +1,123 @@
+import pytest
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC, MSGPACK_CODEC, TRUSTED_MSGPACK_CODEC
+from radium226.studies.ipc.cli.messages import (
+    Cancel,
+    CommandNotFound,
+    KillProcess,
+    ListProcesses,
+    ProcessInfo,
+    ProcessKilled,
+    ProcessList,
+    ProcessNotFound,
+    ProcessOutput,
+    ProcessStarted,
+    ProcessTerminated,
+    RequestFailed,
+    RunProcess,
+)
+
+# Each message with its msgpack encoding, pinned so that any change to the wire layout shows up.
+MESSAGES = [
+    (
+        RunProcess(id="r1", command="echo", args=["hi"], io="stream", deadline=1.5),
+        b"\x96\x01\xa2r1\xa4echo\x91\xa2hi\xcb?\xf8\x00\x00\x00\x00\x00\x00\xa6stream",
+    ),
+    (
+        KillProcess(id="k1", pid=42, signal=15),
+        b"\x95\x02\xa2k1*\x0f\xc0",
+    ),
+    (
+        ProcessStarted(pid=42, request_id="r1"),
+        b"\x93\x03*\xa2r1",
+    ),
+    (
+        ProcessTerminated(
+            request_id="r1",
+            exit_code=3,
+            wall_seconds=0.5,
+            user_cpu_seconds=0.25,
+            system_cpu_seconds=0.125,
+            max_rss_kib=1024,
+        ),
+        b"\x97\x04\xa2r1\x03\xcb?\xe0\x00\x00\x00\x00\x00\x00\xcb?\xd0\x00\x00\x00\x00\x00\x00"
+        b"\xcb?\xc0\x00\x00\x00\x00\x00\x00\xcd\x04\x00",
+    ),
+    (
+        CommandNotFound(request_id="r1", command="nope"),
+        b"\x93\x05\xa2r1\xa4nope",
+    ),
+    (
+        ProcessKilled(request_id="k1", pid=42),
+        b"\x93\x06\xa2k1*",
+    ),
+    (
+        Cancel(cancelled_id="r1"),
+        b"\x92\x07\xa2r1",
+    ),
+    (
+        ProcessOutput(request_id="r1", stream="stdout", data=b"\x00\xff"),
+        b"\x94\x08\xa2r1\xa6stdout\xc4\x02\x00\xff",
+    ),
+    (
+        ListProcesses(id="l1"),
+        b"\x93\t\xa2l1\xc0",
+    ),
+    (
+        ProcessList(
+            request_id="l1",
+            processes=[ProcessInfo(request_id="r1", pid=42, command="sleep", args=["1"], started_at=2.0)],
+        ),
+        b"\x93\n\xa2l1\x91\x85\xaarequest_id\xa2r1\xa3pid*\xa7command\xa5sleep\xa4args\x91\xa11"
+        b"\xaastarted_at\xcb@\x00\x00\x00\x00\x00\x00\x00",
+    ),
+    (
+        ProcessNotFound(request_id="k1", pid=43),
+        b"\x93\x0b\xa2k1+",
+    ),
+    (
+        RequestFailed(request_id="l1", reason="no"),
+        b"\x93\x0c\xa2l1\xa2no",
+    ),
+]
+
+_IDS = [type(message).__name__ for message, _ in MESSAGES]
+
+
+@pytest.mark.parametrize("message, encoded", MESSAGES, ids=_IDS)
+def test_msgpack_encoding(message, encoded):
+    assert MSGPACK_CODEC.encode(message) == encoded
+
+
+@pytest.mark.parametrize("codec", [JSON_CODEC, MSGPACK_CODEC, TRUSTED_MSGPACK_CODEC], ids=["json", "msgpack", "trusted-msgpack"])
+@pytest.mark.parametrize("message, encoded", MESSAGES, ids=_IDS)
+def test_round_trip(codec, message, encoded):
+    decoded = codec.decode(memoryview(codec.encode(message)))
+    assert type(decoded) is type(message)
+    assert decoded == message
+
+
+def test_msgpack_decodes_messages_from_older_peers():
+    # A peer predating a field sends fewer values: the missing fields take their defaults.
+    assert MSGPACK_CODEC.decode(b"\x93\x04\xa2r1\x03") == ProcessTerminated(request_id="r1", exit_code=3)
+
+
+def test_msgpack_decodes_requests_from_version_1_peers():
+    # Requests of version 1 stop before `deadline`.
+    assert MSGPACK_CODEC.decode(b"\x94\x01\xa2r1\xa4echo\x91\xa2hi") == RunProcess(id="r1", command="echo", args=["hi"])
+    assert MSGPACK_CODEC.decode(b"\x94\x02\xa2k1*\x0f") == KillProcess(id="k1", pid=42, signal=15)
+
+
+def test_trusted_msgpack_validates_what_it_cannot_construct():
+    # Frames with missing fields and messages nesting models go through validation.
+    assert TRUSTED_MSGPACK_CODEC.decode(b"\x93\x04\xa2r1\x03") == ProcessTerminated(request_id="r1", exit_code=3)
+    encoded = next(encoded for message, encoded in MESSAGES if isinstance(message, ProcessList))
+    assert all(isinstance(process, ProcessInfo) for process in TRUSTED_MSGPACK_CODEC.decode(encoded).processes)
+
+
+def test_trusted_msgpack_skips_validation():
+    # Meant for peers known to send well-formed messages: nothing is checked.
+    decoded = TRUSTED_MSGPACK_CODEC.decode(b"\x93\x06\xa2k1\xa3pid")
+    assert decoded.pid == "pid"
+    with pytest.raises(ValueError):
+        MSGPACK_CODEC.decode(b"\x93\x06\xa2k1\xa3pid")
@@ -0,0 +1,161 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC, MSGPACK_CODEC
+from radium226.studies.ipc.cli.messages import ProcessTerminated, RunProcess
+from radium226.studies.ipc.client import Client
+from radium226.studies.ipc import handshake
+from radium226.studies.ipc.handshake import HandshakeError, accept, offer
+from radium226.studies.ipc.ipc import open_server
+from radium226.studies.ipc.protocol import ResponseHandler
+from radium226.studies.ipc.transport import (
+    Frame,
+    LengthPrefixedFraming,
+    NullCharFraming,
+    accept_connections,
+    open_connection,
+)
+
+
+async def _handler(request: RunProcess, fds: list[int], emit):
+    return ProcessTerminated(request_id=request.id, exit_code=7), []
+
+
+def _names(wire_format) -> tuple[int, str, str]:
+    return wire_format.version, wire_format.codec.name, wire_format.framing.name
+
+
+async def _negotiate(socket_path: Path, client_codecs, client_framings, server_codecs, server_framings):
+    connections = accept_connections(socket_path)
+    accepting = asyncio.create_task(anext(connections))
+    while not socket_path.exists():
+        await asyncio.sleep(0.001)
+    client_connection = await open_connection(socket_path)
+    server_connection = await accepting
+    try:
+        return await asyncio.gather(
+            offer(client_connection, client_codecs, client_framings),
+            accept(server_connection, server_codecs, server_framings),
+        )
+    finally:
+        await client_connection.aclose()
+        await server_connection.aclose()
+        await connections.aclose()
+
+
+def test_server_preference_wins(tmp_path: Path):
+    client_wire_format, (server_wire_format, first_frame) = asyncio.run(_negotiate(
+        tmp_path / "ipc.sock",
+        [JSON_CODEC, MSGPACK_CODEC], [NullCharFraming(), LengthPrefixedFraming()],
+        [MSGPACK_CODEC, JSON_CODEC], [LengthPrefixedFraming(), NullCharFraming()],
+    ))
+    assert first_frame is None
+    assert _names(client_wire_format) == _names(server_wire_format)
+    assert _names(client_wire_format)[1:] == ("msgpack", "length-prefixed")
+
+
+def test_binary_codec_needs_binary_safe_framing(tmp_path: Path):
+    client_wire_format, _ = asyncio.run(_negotiate(
+        tmp_path / "ipc.sock",
+        [MSGPACK_CODEC, JSON_CODEC], [NullCharFraming()],
+        [MSGPACK_CODEC, JSON_CODEC], [LengthPrefixedFraming(), NullCharFraming()],
+    ))
+    assert _names(client_wire_format)[1:] == ("json", "null-char")
+
+
+def test_nothing_in_common(tmp_path: Path):
+    with pytest.raises(HandshakeError):
+        asyncio.run(_negotiate(
+            tmp_path / "ipc.sock",
+            [MSGPACK_CODEC], [LengthPrefixedFraming()],
+            [JSON_CODEC], [NullCharFraming()],
+        ))
+
+
+def test_server_accepts_client_predating_the_handshake(tmp_path: Path):
+    async def run() -> ProcessTerminated:
+        async with open_server(tmp_path / "ipc.sock", [MSGPACK_CODEC, JSON_CODEC], handler=_handler, framing=[LengthPrefixedFraming(), NullCharFraming()]):
+            connection = await open_connection(tmp_path / "ipc.sock")
+            try:
+                await connection.send_frame(Frame(JSON_CODEC.encode(RunProcess(id="legacy", command="true"))))
+                return JSON_CODEC.decode((await connection.receive_frame()).data)
+            finally:
+                await connection.aclose()
+
+    response = asyncio.run(run())
+    assert response == ProcessTerminated(request_id="legacy", exit_code=7)
+
+
+def test_client_falls_back_for_server_predating_the_handshake(tmp_path: Path):
+    socket_path = tmp_path / "ipc.sock"
+
+    async def legacy_server() -> None:
+        async for connection in accept_connections(socket_path):
+            try:
+                async for frame in connection:
+                    # The hello is not a request to a legacy server, which skips it.
+                    if b"hello" in bytes(frame.data):
+                        continue
+                    request = JSON_CODEC.decode(frame.data)
+                    response = ProcessTerminated(request_id=request.id, exit_code=0)
+                    await connection.send_frame(Frame(json.dumps(response.model_dump()).encode()))
+            finally:
+                await connection.aclose()
+
+    async def run() -> list:
+        serving = asyncio.create_task(legacy_server())
+        while not socket_path.exists():
+            await asyncio.sleep(0.001)
+        responses: list = []
+
+        async def on_response(response, fds: list[int]) -> None:
+            responses.append(response)
+
+        try:
+            client = await Client.connect(socket_path, [MSGPACK_CODEC, JSON_CODEC], [LengthPrefixedFraming(), NullCharFraming()], handshake_timeout=0.05)
+            try:
+                await client.request(RunProcess(id="new", command="true"), handler=ResponseHandler(on_response=on_response))
+            finally:
+                await client.aclose()
+        finally:
+            serving.cancel()
+        return responses
+
+    assert asyncio.run(run()) == [ProcessTerminated(request_id="new", exit_code=0)]
+
+
+def test_msgpack_needs_protocol_version_2(tmp_path: Path, monkeypatch):
+    # A client of version 1 lays out msgpack requests differently, so it gets JSON instead.
+    monkeypatch.setattr(handshake, "PROTOCOL_VERSION", 1)
+    client_wire_format, (server_wire_format, _) = asyncio.run(_negotiate(
+        tmp_path / "ipc.sock",
+        [MSGPACK_CODEC, JSON_CODEC], [LengthPrefixedFraming()],
+        [MSGPACK_CODEC, JSON_CODEC], [LengthPrefixedFraming()],
+    ))
+    assert _names(client_wire_format) == _names(server_wire_format) == (1, "json", "length-prefixed")
+
+
+def test_client_refuses_msgpack_below_protocol_version_2(tmp_path: Path):
+    async def run() -> None:
+        connections = accept_connections(tmp_path / "ipc.sock")
+        accepting = asyncio.create_task(anext(connections))
+        while not (tmp_path / "ipc.sock").exists():
+            await asyncio.sleep(0.001)
+        client_connection = await open_connection(tmp_path / "ipc.sock")
+        server_connection = await accepting
+        try:
+            offering = asyncio.create_task(offer(client_connection, [MSGPACK_CODEC], [LengthPrefixedFraming()]))
+            await server_connection.receive_frame()
+            welcome = {"welcome": {"version": 1, "codec": "msgpack", "framing": "length-prefixed"}}
+            await server_connection.send_frame(Frame(json.dumps(welcome).encode()))
+            await offering
+        finally:
+            await client_connection.aclose()
+            await server_connection.aclose()
+            await connections.aclose()
+
+    with pytest.raises(HandshakeError):
+        asyncio.run(run())
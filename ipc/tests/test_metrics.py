@@ -0,0 +1,60 @@
+import asyncio
+import math
+from pathlib import Path
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC
+from radium226.studies.ipc.cli.messages import ProcessTerminated, RunProcess
+from radium226.studies.ipc.ipc import open_client, open_server
+from radium226.studies.ipc.metrics import (
+    ACTIVE_CONNECTIONS,
+    FRAMES_RECEIVED,
+    FRAMES_SENT,
+    HANDLER_SECONDS,
+    REQUEST_SECONDS,
+    REQUESTS,
+    Histogram,
+    InMemoryMetrics,
+)
+
+
+def test_histogram_summary():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    summary = histogram.summary()
+    assert (summary["count"], summary["mean"], summary["min"], summary["max"]) == (1000, 500.5, 1, 1000)
+    for q in (0.5, 0.9, 0.99):
+        # Within a bucket, i.e. a factor of 2 ** (1 / 4), of the actual quantile.
+        assert q * 1000 <= histogram.quantile(q) <= q * 1000 * 2 ** 0.25
+
+
+def test_histogram_of_zeros_and_nothing():
+    histogram = Histogram()
+    assert math.isnan(histogram.quantile(0.5))
+    histogram.record(0)
+    assert histogram.quantile(0.5) == 0
+
+
+def test_client_and_server_metrics(tmp_path: Path):
+    async def handler(request: RunProcess, fds: list[int], emit):
+        return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+    async def run() -> tuple[InMemoryMetrics, InMemoryMetrics, int]:
+        server_metrics = InMemoryMetrics()
+        client_metrics = InMemoryMetrics()
+        async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=handler, metrics=server_metrics):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC, metrics=client_metrics) as client:
+                for index in range(5):
+                    await client.request(RunProcess(id=str(index), command="true"))
+                active_connections = server_metrics.counters[ACTIVE_CONNECTIONS]
+        return server_metrics, client_metrics, active_connections
+
+    server_metrics, client_metrics, active_connections = asyncio.run(run())
+    assert active_connections == 1
+    assert server_metrics.counters[ACTIVE_CONNECTIONS] == 0
+    assert server_metrics.counters[REQUESTS] == 5
+    assert server_metrics.histograms[HANDLER_SECONDS].count == 5
+    assert client_metrics.histograms[REQUEST_SECONDS].count == 5
+    # The handshake adds a frame each way.
+    assert client_metrics.counters[FRAMES_SENT] == server_metrics.counters[FRAMES_RECEIVED] == 6
+    assert server_metrics.counters[FRAMES_SENT] == client_metrics.counters[FRAMES_RECEIVED] == 6
@@ -0,0 +1,38 @@
+import asyncio
+from pathlib import Path
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC
+from radium226.studies.ipc.cli.messages import ProcessTerminated, RunProcess
+from radium226.studies.ipc.ipc import open_client_pool, open_server
+from radium226.studies.ipc.metrics import ACTIVE_CONNECTIONS, InMemoryMetrics
+
+
+async def _handler(request: RunProcess, fds: list[int], emit):
+    await asyncio.sleep(0.01)
+    return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+
+def test_pool_opens_connections_on_demand(tmp_path: Path):
+    async def run() -> tuple[int, int]:
+        metrics = InMemoryMetrics()
+        async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=_handler, metrics=metrics):
+            async with open_client_pool(tmp_path / "ipc.sock", JSON_CODEC, size=3) as pool:
+                await pool.request(RunProcess(id="first", command="true"))
+                connections_after_one = metrics.counters[ACTIVE_CONNECTIONS]
+                await asyncio.gather(*(pool.request(RunProcess(id=str(index), command="true")) for index in range(20)))
+                return connections_after_one, metrics.counters[ACTIVE_CONNECTIONS]
+
+    connections_after_one, connections_after_many = asyncio.run(run())
+    assert connections_after_one == 1
+    assert connections_after_many == 3
+
+
+def test_pool_replaces_closed_connections(tmp_path: Path):
+    async def run() -> None:
+        async with open_client_pool(tmp_path / "ipc.sock", JSON_CODEC, size=1) as pool:
+            async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=_handler):
+                await pool.request(RunProcess(id="before", command="true"))
+            async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=_handler):
+                await pool.request(RunProcess(id="after", command="true"))
+
+    asyncio.run(run())
@@ -0,0 +1,94 @@
+import asyncio
+from pathlib import Path
+
+from radium226.studies.ipc.cli.codecs import JSON_CODEC
+from radium226.studies.ipc.cli.messages import CommandNotFound, ProcessTerminated, RunProcess
+from radium226.studies.ipc.ipc import open_client, open_server
+from radium226.studies.ipc.protocol import ResponseHandler
+from radium226.studies.ipc.server import Limits
+
+
+def _on_response(responses: list) -> ResponseHandler:
+    async def on_response(response, fds: list[int]) -> None:
+        responses.append(response)
+
+    return ResponseHandler(on_response=on_response)
+
+
+def test_max_concurrent_requests(tmp_path: Path):
+    running = 0
+    most_running = 0
+
+    async def handler(request: RunProcess, fds: list[int], emit):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+    async def run() -> None:
+        limits = Limits(max_concurrent_requests=2)
+        async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=handler, limits=limits):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                await asyncio.gather(*(client.request(RunProcess(id=str(index), command="true")) for index in range(10)))
+
+    asyncio.run(run())
+    assert most_running == 2
+
+
+def test_overloaded_requests_are_rejected(tmp_path: Path):
+    async def handler(request: RunProcess, fds: list[int], emit):
+        await asyncio.sleep(0.05)
+        return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+    def on_overload(request: RunProcess) -> CommandNotFound:
+        return CommandNotFound(request_id=request.id, command=request.command)
+
+    async def run() -> list:
+        responses: list = []
+        limits = Limits(max_outstanding_requests_per_connection=1)
+        async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=handler, limits=limits, on_overload=on_overload):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                await asyncio.gather(
+                    *(client.request(RunProcess(id=str(index), command="true"), handler=_on_response(responses)) for index in range(3))
+                )
+        return responses
+
+    responses = asyncio.run(run())
+    assert sorted(type(response).__name__ for response in responses) == ["CommandNotFound", "CommandNotFound", "ProcessTerminated"]
+
+
+def test_cancel_is_handled_at_the_outstanding_limit(tmp_path: Path):
+    started = asyncio.Event()
+    cancelled: list[str] = []
+
+    async def handler(request: RunProcess, fds: list[int], emit):
+        if request.id == "blocked":
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(request.id)
+                raise
+        return ProcessTerminated(request_id=request.id, exit_code=0), []
+
+    async def run() -> list:
+        responses: list = []
+        limits = Limits(max_outstanding_requests_per_connection=1)
+        async with open_server(tmp_path / "ipc.sock", JSON_CODEC, handler=handler, limits=limits):
+            async with open_client(tmp_path / "ipc.sock", JSON_CODEC) as client:
+                blocked = asyncio.create_task(client.request(RunProcess(id="blocked", command="true"), timeout=0.2))
+                await started.wait()
+                # Queued behind the blocked request, until cancelling it frees the connection's slot.
+                async with asyncio.timeout(5):
+                    await client.request(RunProcess(id="queued", command="true"), handler=_on_response(responses))
+                try:
+                    await blocked
+                except TimeoutError:
+                    pass
+        return responses
+
+    responses = asyncio.run(run())
+    assert cancelled == ["blocked"]
+    assert responses == [ProcessTerminated(request_id="queued", exit_code=0)]
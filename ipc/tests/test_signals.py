@@ -0,0 +1,68 @@
+import asyncio
+import signal
+
+from radium226.studies.ipc.cli.signals import SignalForwarder
+
+
+def _forwarding(test):
+    """Run *test* with a forwarder whose requests are recorded, each taking 50 ms to complete."""
+
+    async def run() -> list:
+        sent: list = []
+
+        async def send(pid: int, sig: signal.Signals) -> None:
+            sent.append((pid, sig))
+            await asyncio.sleep(0.05)
+
+        escalations: list = []
+        forwarder = SignalForwarder(send, kill_timeout=0.1, on_escalate=lambda: escalations.append(True))
+        try:
+            await test(forwarder)
+        finally:
+            await forwarder.aclose()
+        return sent + escalations
+
+    return asyncio.run(run())
+
+
+def test_signals_received_before_the_start_are_forwarded_once_started():
+    async def test(forwarder: SignalForwarder) -> None:
+        forwarder.forward(signal.SIGINT)
+        await asyncio.sleep(0.01)
+        forwarder.start(42)
+        await asyncio.sleep(0.01)
+
+    assert _forwarding(test) == [(42, signal.SIGINT)]
+
+
+def test_bursts_are_coalesced_while_a_request_is_on_its_way():
+    async def test(forwarder: SignalForwarder) -> None:
+        forwarder.start(42)
+        forwarder.forward(signal.SIGINT)
+        await asyncio.sleep(0.01)
+        for sig in (signal.SIGINT, signal.SIGHUP, signal.SIGINT, signal.SIGHUP, signal.SIGINT):
+            forwarder.forward(sig)
+        await asyncio.sleep(0.2)
+
+    assert _forwarding(test) == [(42, signal.SIGINT), (42, signal.SIGINT), (42, signal.SIGHUP)]
+
+
+def test_sigterm_escalates_to_sigkill():
+    async def test(forwarder: SignalForwarder) -> None:
+        forwarder.start(42)
+        forwarder.forward(signal.SIGTERM)
+        await asyncio.sleep(0.3)
+
+    assert _forwarding(test) == [(42, signal.SIGTERM), (42, signal.SIGKILL), True]
+
+
+def test_closing_cancels_the_escalation():
+    async def test(forwarder: SignalForwarder) -> None:
+        forwarder.start(42)
+        forwarder.forward(signal.SIGTERM)
+        await asyncio.sleep(0.06)
+        await forwarder.aclose()
+        # Past the kill timeout.
+        await asyncio.sleep(0.2)
+
+    assert _forwarding(test) == [(42, signal.SIGTERM)]
@@ -0,0 +1,289 @@
+import array
+import asyncio
+import os
+import socket
+
+import pytest
+
+from radium226.studies.ipc.transport import Connection, Frame, LengthPrefixedFraming, NullCharFraming
+
+
+def _locate_all(framing, data: bytes) -> list[bytes]:
+    buffer = bytearray(data)
+    payloads = []
+    start = 0
+    while (located := framing.locate(buffer, start, len(buffer))) is not None:
+        payload_start, payload_end, start = located
+        payloads.append(bytes(buffer[payload_start:payload_end]))
+    return payloads
+
+
+async def _exchange(framing, payloads: list[bytes]) -> list[bytes]:
+    left, right = socket.socketpair()
+    sender = Connection.from_socket(left, framing)
+    receiver = Connection.from_socket(right, framing)
+    try:
+        received = []
+        for payload in payloads:
+            await sender.send_frame(Frame(payload))
+            received.append(bytes((await receiver.receive_frame()).data))
+        return received
+    finally:
+        await sender.aclose()
+        await receiver.aclose()
+
+
+def test_length_prefixed_delimit():
+    assert b"".join(LengthPrefixedFraming().delimit(b"hello")) == b"\x00\x00\x00\x05hello"
+
+
+def test_length_prefixed_locate():
+    framing = LengthPrefixedFraming()
+    wire = b"".join([*framing.delimit(b"a\x00b"), *framing.delimit(b""), *framing.delimit(b"cd")])
+    assert _locate_all(framing, wire) == [b"a\x00b", b"", b"cd"]
+
+
+def test_length_prefixed_locate_incomplete():
+    framing = LengthPrefixedFraming()
+    wire = b"".join(framing.delimit(b"hello"))
+    for end in range(len(wire)):
+        assert framing.locate(bytearray(wire), 0, end) is None
+
+
+def test_length_prefixed_locate_rejects_oversized_frame():
+    with pytest.raises(BufferError):
+        LengthPrefixedFraming().locate(bytearray(b"\xff\xff\xff\xff"), 0, 4)
+
+
+def test_length_prefixed_delimit_rejects_oversized_frame():
+    framing = LengthPrefixedFraming()
+    with pytest.raises(BufferError):
+        framing.delimit(memoryview(bytearray(framing._MAX_PAYLOAD_SIZE + 1)))
+
+
+def test_null_char_locate():
+    assert _locate_all(NullCharFraming(), b"ab\x00\x00c\x00d") == [b"ab", b"", b"c"]
+
+
+@pytest.mark.parametrize("framing", [LengthPrefixedFraming(), NullCharFraming()], ids=lambda framing: framing.name)
+def test_connection_exchanges_frames(framing):
+    payloads = [b"first", b"x" * 1_000_000, b"last"]
+    assert asyncio.run(_exchange(framing, payloads)) == payloads
+
+
+def test_length_prefixed_connection_carries_any_byte():
+    payloads = [bytes(range(256)), b"\x00\x00"]
+    assert asyncio.run(_exchange(LengthPrefixedFraming(), payloads)) == payloads
+
+
+def _send_raw(sock: socket.socket, data: bytes, fds: list[int] | None = None) -> None:
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))] if fds else []
+    sock.sendmsg([data], ancdata)
+
+
+def _same_file(fd: int, other_fd: int) -> bool:
+    stat, other_stat = os.fstat(fd), os.fstat(other_fd)
+    return (stat.st_dev, stat.st_ino) == (other_stat.st_dev, other_stat.st_ino)
+
+
+async def _receive_all(connection: Connection, count: int) -> list[Frame]:
+    frames: list[Frame] = []
+    while len(frames) < count:
+        frames.extend(await connection.receive_frames())
+    return frames
+
+
+def test_received_frames_stay_valid_when_the_buffer_moves():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, LengthPrefixedFraming())
+        framing = LengthPrefixedFraming()
+        try:
+            _send_raw(left, b"".join(framing.delimit(b"first")))
+            first = await receiver.receive_frame()
+            with pytest.raises(TypeError):
+                first.data[0] = 0
+
+            # Larger than the initial buffer, so the unread bytes move to a new one.
+            large = b"x" * 1_000_000
+            left.setblocking(False)
+            writer = asyncio.create_task(asyncio.get_running_loop().sock_sendall(left, b"".join(framing.delimit(large))))
+            assert bytes((await receiver.receive_frame()).data) == large
+            await writer
+            assert bytes(first.data) == b"first"
+        finally:
+            left.close()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_fds_go_to_the_frame_ending_the_read_that_carried_them():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, NullCharFraming())
+        read_fd, write_fd = os.pipe()
+        try:
+            # Several frames in one message: the fds belong to the last one.
+            _send_raw(left, b"a\x00b\x00c\x00", [read_fd])
+            # A frame split across messages, with the fds coming along with its first part.
+            _send_raw(left, b"d", [write_fd])
+            _send_raw(left, b"\x00e\x00")
+            frames = await _receive_all(receiver, 5)
+
+            assert [bytes(frame.data) for frame in frames] == [b"a", b"b", b"c", b"d", b"e"]
+            assert [len(frame.fds) for frame in frames] == [0, 0, 1, 1, 0]
+            assert _same_file(frames[2].fds[0], read_fd)
+            assert _same_file(frames[3].fds[0], write_fd)
+            for frame in frames:
+                for fd in frame.fds:
+                    os.close(fd)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+            left.close()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_unclaimed_fds_are_closed_with_the_connection():
+    async def run() -> int:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, NullCharFraming())
+        read_fd, write_fd = os.pipe()
+        try:
+            _send_raw(left, b"a\x00", [read_fd])
+            _send_raw(left, b"incomplete", [read_fd])
+            frame = await receiver.receive_frame()
+            os.close(frame.fds[0])
+            # Make sure the second message was read, so that its fd is pending.
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.05):
+                    await receiver.receive_frame()
+            pending_fd = receiver._pending_fds[0][1][0]
+            await receiver.aclose()
+            return pending_fd
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+            left.close()
+
+    pending_fd = asyncio.run(run())
+    with pytest.raises(OSError):
+        os.fstat(pending_fd)
+
+
+def test_receive_frames_returns_every_buffered_frame():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, NullCharFraming())
+        try:
+            _send_raw(left, b"a\x00b\x00c\x00d")
+            assert [bytes(frame.data) for frame in await receiver.receive_frames()] == [b"a", b"b", b"c"]
+            _send_raw(left, b"\x00")
+            assert [bytes(frame.data) for frame in await receiver.receive_frames()] == [b"d"]
+        finally:
+            left.close()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_receive_size_follows_the_peer():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, LengthPrefixedFraming())
+        framing = LengthPrefixedFraming()
+        try:
+            initial_size = receiver._receive_size
+            left.setblocking(False)
+            large = b"x" * 4_000_000
+            writer = asyncio.create_task(asyncio.get_running_loop().sock_sendall(left, b"".join(framing.delimit(large))))
+            assert len((await receiver.receive_frame()).data) == len(large)
+            await writer
+            grown_size = receiver._receive_size
+            assert grown_size > initial_size
+
+            for _ in range(8):
+                _send_raw(left, b"".join(framing.delimit(b"small")))
+                await receiver.receive_frame()
+            assert receiver._receive_size < grown_size
+        finally:
+            left.close()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_concurrent_sends_keep_call_order_and_fds():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        sender = Connection.from_socket(left, LengthPrefixedFraming())
+        receiver = Connection.from_socket(right, LengthPrefixedFraming())
+        read_fd, write_fd = os.pipe()
+        try:
+            sends = [
+                sender.send_frame(Frame(str(index).encode(), [read_fd] if index % 10 == 5 else []))
+                for index in range(100)
+            ]
+            frames_task = asyncio.create_task(_receive_all(receiver, 100))
+            await asyncio.gather(*sends)
+            frames = await frames_task
+
+            assert [bytes(frame.data) for frame in frames] == [str(index).encode() for index in range(100)]
+            for index, frame in enumerate(frames):
+                assert len(frame.fds) == (1 if index % 10 == 5 else 0)
+                for fd in frame.fds:
+                    assert _same_file(fd, read_fd)
+                    os.close(fd)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+            await sender.aclose()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_send_after_close_raises():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        sender = Connection.from_socket(left, NullCharFraming())
+        await sender.send_frame(Frame(b"sent"))
+        await sender.drain()
+        await sender.aclose()
+        right.close()
+        with pytest.raises(ConnectionError):
+            await sender.send_frame(Frame(b"lost"))
+
+    asyncio.run(run())
+
+
+def test_receiving_resumes_after_nobody_read():
+    async def run() -> None:
+        left, right = socket.socketpair()
+        receiver = Connection.from_socket(right, NullCharFraming())
+        try:
+            _send_raw(left, b"first")
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.01):
+                    await receiver.receive_frame()
+            # Arrives while nobody is reading, so the connection stops watching the socket.
+            _send_raw(left, b"\x00")
+            await asyncio.sleep(0.01)
+            assert not receiver._reading
+            assert bytes((await receiver.receive_frame()).data) == b"first"
+            _send_raw(left, b"second\x00")
+            assert bytes((await receiver.receive_frame()).data) == b"second"
+        finally:
+            left.close()
+            await receiver.aclose()
+
+    asyncio.run(run())
+
+
+def test_connection_on_uvloop():
+    uvloop = pytest.importorskip("uvloop")
+    payloads = [b"first", b"x" * 1_000_000, b"last"]
+    assert asyncio.run(_exchange(LengthPrefixedFraming(), payloads), loop_factory=uvloop.new_event_loop) == payloads
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import signal
+from functools import partial
+from pathlib import Path
+
+from radium226.studies.ipc.cli.app import handle_request
+from radium226.studies.ipc.cli.codecs import CODECS
+from radium226.studies.ipc.cli.messages import ProcessOutput, ProcessTerminated, RunProcess
+from radium226.studies.ipc.cli.processes import ProcessRegistry
+from radium226.studies.ipc.ipc import open_client, open_supervisor
+from radium226.studies.ipc.protocol import ResponseHandler
+
+_HANDLER = partial(handle_request, processes=ProcessRegistry(exhaustive=False))
+
+
+async def _run_true(socket_path: Path) -> ProcessTerminated:
+    responses: list = []
+
+    async def on_response(response, fds: list[int]) -> None:
+        responses.append(response)
+
+    async with open_client(socket_path, list(CODECS.values())) as client:
+        await client.request(RunProcess(id="true", command="true", io="stream"), handler=ResponseHandler(on_response=on_response))
+    return responses[0]
+
+
+def test_workers_serve_connections_and_are_restarted(tmp_path: Path):
+    socket_path = tmp_path / "ipc.sock"
+
+    async def run() -> tuple[list, list, list]:
+        async with open_supervisor(socket_path, list(CODECS.values()), handler=_HANDLER, worker_count=2) as supervisor:
+            responses = await asyncio.gather(*(_run_true(socket_path) for _ in range(4)))
+            worker_pids = supervisor.worker_pids
+            os.kill(worker_pids[0], signal.SIGKILL)
+            async with asyncio.timeout(10):
+                while supervisor.worker_pids[0] in (None, worker_pids[0]):
+                    await asyncio.sleep(0.05)
+            responses += await asyncio.gather(*(_run_true(socket_path) for _ in range(4)))
+            return responses, worker_pids, supervisor.worker_pids
+
+    responses, worker_pids, restarted_worker_pids = asyncio.run(run())
+    assert [response.exit_code for response in responses] == [0] * 8
+    assert len(set(worker_pids)) == 2
+    assert restarted_worker_pids[0] not in worker_pids
+    assert restarted_worker_pids[1] == worker_pids[1]
+
+
+def test_worker_processes_do_not_inherit_ignored_sigint(tmp_path: Path):
+    socket_path = tmp_path / "ipc.sock"
+    output: list[bytes] = []
+
+    async def on_event(event, fds: list[int]) -> None:
+        if isinstance(event, ProcessOutput):
+            output.append(event.data)
+
+    async def run() -> None:
+        async with open_supervisor(socket_path, list(CODECS.values()), handler=_HANDLER, worker_count=2):
+            async with open_client(socket_path, list(CODECS.values())) as client:
+                request = RunProcess(id="status", command="grep", args=["SigIgn", "/proc/self/status"], io="stream")
+                await client.request(request, handler=ResponseHandler(on_event=on_event))
+
+    asyncio.run(run())
+    mask = int(b"".join(output).split()[1], 16)
+    assert not mask & (1 << (signal.SIGINT - 1))
@@ -1,24 +1,148 @@
 """Varlink client with file descriptor passing."""
 
 import asyncio
+import errno
+import fcntl
+import io
 import os
+import select
 import signal
+import socket
 import sys
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import suppress
 
-from .protocol import Request, Response, read_message
-from .socket import create_client_socket, recv_with_fds, send_with_fds
+from .interface import STUDY
+from .protocol import MessageReader, Request, Response
+from .socket import create_client_socket, send_with_fds_async
 
 
-async def relay_fd_to_stream(fd: int, stream) -> None:
-    """Relay data from a file descriptor to a stream."""
-    loop = asyncio.get_event_loop()
+EXECUTE = STUDY.methods["Execute"]
+SIGNAL = STUDY.methods["Signal"]
+
+# Up to /proc/sys/fs/pipe-max-size, which is the default limit of unprivileged processes.
+_MAX_PIPE_SIZE = 1024 * 1024
+
+
+def _grow_pipe(fd: int, size: int, received: int) -> int:
+    """Double the buffer of the pipe *fd* if *received* bytes filled it, and return its size.
+
+    Output produced faster than it is relayed is then read in fewer, larger chunks.
+    """
+    if received < size or size >= _MAX_PIPE_SIZE:
+        return size
+    try:
+        return fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, size * 2)
+    except OSError:
+        # Not a pipe, or above the limit of the user: keep it as it is.
+        return _MAX_PIPE_SIZE
+
+
+def _pipe_size(fd: int) -> int:
+    try:
+        return fcntl.fcntl(fd, fcntl.F_GETPIPE_SZ)
+    except OSError:
+        return _MAX_PIPE_SIZE
+
+
+async def _wait_writable(fd: int) -> None:
+    loop = asyncio.get_running_loop()
+    writable = loop.create_future()
+    loop.add_writer(fd, writable.set_result, None)
+    try:
+        await writable
+    finally:
+        loop.remove_writer(fd)
+
+
+def _is_writable(fd: int) -> bool:
+    return bool(select.select([], [fd], [], 0)[1])
+
+
+async def splice_fd_to_fd(fd: int, out_fd: int) -> bool:
+    """Move the data of the pipe *fd* to *out_fd* within the kernel, until the writing end is closed.
+
+    Returns False without moving anything if *out_fd* does not support splice, as terminals.
+    """
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    size = _pipe_size(fd)
+    spliced = False
+    loop.add_reader(fd, readable.set)
     try:
         while True:
-            data = await loop.run_in_executor(None, os.read, fd, 4096)
-            if not data:
-                break
-            stream.buffer.write(data)
-            stream.buffer.flush()
+            try:
+                # Non-blocking on both pipes, so that a full out_fd does not block the loop, without
+                # setting O_NONBLOCK on out_fd, whose file description may be shared, e.g. stdout.
+                moved = os.splice(fd, out_fd, size, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            except BlockingIOError:
+                if _is_writable(out_fd):
+                    # Nothing to read yet.
+                    readable.clear()
+                    await readable.wait()
+                else:
+                    # Ahead of a slow reader: fd stays readable meanwhile, and watching it would
+                    # wake the loop up on every iteration.
+                    loop.remove_reader(fd)
+                    await _wait_writable(out_fd)
+                    loop.add_reader(fd, readable.set)
+                continue
+            except OSError as e:
+                if e.errno == errno.EINVAL and not spliced:
+                    return False
+                raise
+            if not moved:
+                return True
+            spliced = True
+            size = _grow_pipe(fd, size, moved)
+    finally:
+        loop.remove_reader(fd)
+
+
+class _StreamRelay(asyncio.Protocol):
+    def __init__(self, fd: int, stream):
+        self.fd = fd
+        self.stream = stream
+        self.size = _pipe_size(fd)
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def data_received(self, data: bytes) -> None:
+        self.stream.buffer.write(data)
+        self.stream.buffer.flush()
+        self.size = _grow_pipe(self.fd, self.size, len(data))
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+async def copy_fd_to_stream(fd: int, stream) -> None:
+    """Write the data read from *fd* to a stream, until the writing end is closed."""
+    loop = asyncio.get_running_loop()
+    # The fd stays ours: the transport only closes the file object.
+    pipe = os.fdopen(fd, "rb", buffering=0, closefd=False)
+    transport, relay = await loop.connect_read_pipe(lambda: _StreamRelay(fd, stream), pipe)
+    try:
+        await relay.closed
+    finally:
+        transport.close()
+
+
+async def relay_fd_to_stream(fd: int, stream) -> None:
+    """Relay data from a file descriptor to a stream.
+
+    The data is spliced to the stream's fd where possible, and copied through Python otherwise.
+    """
+    try:
+        # What was written to the stream so far comes first.
+        stream.flush()
+        try:
+            out_fd = stream.fileno()
+        except io.UnsupportedOperation:
+            out_fd = None
+        if out_fd is None or not hasattr(os, "splice") or not await splice_fd_to_fd(fd, out_fd):
+            await copy_fd_to_stream(fd, stream)
     except OSError:
         pass
     finally:
@@ -28,77 +152,149 @@ async def relay_fd_to_stream(fd: int, stream) -> None:
             pass
 
 
-async def run_client(command: list[str]) -> int:
-    """Run a command via the server and return its exit code."""
-    sock = create_client_socket()
-    loop = asyncio.get_event_loop()
+class Client:
+    """A connection to the server, over which any number of calls can be made.
+
+    Calls can be pipelined: the replies come back in the order the calls were made, and each is
+    routed to its call by a single task reading the socket. Once the connection ends, calls raise
+    `ConnectionError`.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self._replies: deque[asyncio.Queue[tuple[Response, list[int]] | None]] = deque()
+        # Held from queueing a call to sending all of it, so that calls are sent in queue order.
+        self._sending = asyncio.Lock()
+        self._reading_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    def connect(cls) -> "Client":
+        return cls(create_client_socket())
+
+    async def _read_replies(self) -> None:
+        reader = MessageReader(self.sock, Response)
+        try:
+            async for response, fds in reader:
+                if not self._replies:
+                    # A reply to no call: the replies can't be told apart from now on.
+                    for fd in fds:
+                        os.close(fd)
+                    with suppress(OSError):
+                        self.sock.shutdown(socket.SHUT_RDWR)
+                    return
+                replies = self._replies[0]
+                if not response.continues:
+                    self._replies.popleft()
+                replies.put_nowait((response, fds))
+        finally:
+            reader.close()
+            # The calls still waiting for a reply will never get it.
+            for replies in self._replies:
+                replies.put_nowait(None)
+            self._replies.clear()
 
-    stdin_fd = os.dup(sys.stdin.fileno())
+    async def call(
+        self, request: Request, fds: list[int] | None = None
+    ) -> AsyncIterator[tuple[Response, list[int]]]:
+        """Make a call, and yield its replies with the fds received along with each."""
+        data = request.encode()
+        async with self._sending:
+            if self._reading_task.done():
+                raise ConnectionError("Connection closed")
+            if not request.oneway:
+                replies: asyncio.Queue[tuple[Response, list[int]] | None] = asyncio.Queue()
+                self._replies.append(replies)
+            await send_with_fds_async(self.sock, data, fds or [])
+        if request.oneway:
+            return
+        while True:
+            reply = await replies.get()
+            if reply is None:
+                raise ConnectionError("Connection closed by the server")
+            yield reply
+            if not reply[0].continues:
+                return
+
+    async def execute(self, command: list[str]) -> int:
+        """Run a command via the server, relaying its output, and return its exit code."""
+        loop = asyncio.get_running_loop()
+
+        stdin_fd = os.dup(sys.stdin.fileno())
+        request = EXECUTE.request(command=command, more=True)
+        replies = self.call(request, [stdin_fd])
+        try:
+            response, fds = await anext(replies)
+        except ConnectionError:
+            print("Protocol error: connection closed before any reply", file=sys.stderr)
+            return 1
+        finally:
+            os.close(stdin_fd)
 
-    request = Request(method="Execute", parameters={"command": command})
-    send_with_fds(sock, request.encode(), [stdin_fd])
-    os.close(stdin_fd)
+        if response.error:
+            details = ", ".join(f"{name}={value}" for name, value in (response.parameters or {}).items())
+            print(f"Server error: {response.error}" + (f" ({details})" if details else ""), file=sys.stderr)
+            return 1
 
-    buffer = b""
-    data, fds = recv_with_fds(sock)
-    buffer += data
+        if len(fds) < 2:
+            print("Protocol error: expected stdout and stderr FDs", file=sys.stderr)
+            return 1
 
-    msg_data, buffer = read_message(buffer)
-    if msg_data is None:
-        print("Protocol error: incomplete message", file=sys.stderr)
-        return 1
+        stdout_fd, stderr_fd = fds[0], fds[1]
 
-    response = Response.decode(msg_data)
-    if response.error:
-        print(f"Server error: {response.error}", file=sys.stderr)
-        return 1
+        # Set up signal handlers to forward signals to the server
+        signal_tasks: set[asyncio.Task] = set()
 
-    if len(fds) < 2:
-        print("Protocol error: expected stdout and stderr FDs", file=sys.stderr)
-        return 1
+        async def send_signal(signum):
+            sig_request = SIGNAL.request(signal=int(signum), oneway=True)
+            with suppress(OSError):  # Socket may be closed
+                async for _ in self.call(sig_request):
+                    pass
 
-    stdout_fd, stderr_fd = fds[0], fds[1]
+        def forward_signal(signum):
+            task = asyncio.create_task(send_signal(signum))
+            signal_tasks.add(task)
+            task.add_done_callback(signal_tasks.discard)
+
+        loop.add_signal_handler(signal.SIGTERM, forward_signal, signal.SIGTERM)
+        loop.add_signal_handler(signal.SIGINT, forward_signal, signal.SIGINT)
+
+        stdout_task = asyncio.create_task(relay_fd_to_stream(stdout_fd, sys.stdout))
+        stderr_task = asyncio.create_task(relay_fd_to_stream(stderr_fd, sys.stderr))
 
-    # Set up signal handlers to forward signals to the server
-    def send_signal(signum):
         try:
-            sig_request = Request(method="Signal", parameters={"signal": int(signum)})
-            send_with_fds(sock, sig_request.encode(), [])
-        except OSError:
-            pass  # Socket may be closed
-
-    loop.add_signal_handler(signal.SIGTERM, lambda: send_signal(signal.SIGTERM))
-    loop.add_signal_handler(signal.SIGINT, lambda: send_signal(signal.SIGINT))
-
-    stdout_task = asyncio.create_task(relay_fd_to_stream(stdout_fd, sys.stdout))
-    stderr_task = asyncio.create_task(relay_fd_to_stream(stderr_fd, sys.stderr))
-
-    def recv_blocking():
-        return recv_with_fds(sock)
-
-    while True:
-        data, _ = await loop.run_in_executor(None, recv_blocking)
-        if not data:
-            break
-        buffer += data
-
-        msg_data, buffer = read_message(buffer)
-        if msg_data is not None:
-            exit_response = Response.decode(msg_data)
-            if exit_response.parameters and "exit_code" in exit_response.parameters:
-                await stdout_task
-                await stderr_task
-                loop.remove_signal_handler(signal.SIGTERM)
-                loop.remove_signal_handler(signal.SIGINT)
-                sock.close()
-                return exit_response.parameters["exit_code"]
-
-    await stdout_task
-    await stderr_task
-    loop.remove_signal_handler(signal.SIGTERM)
-    loop.remove_signal_handler(signal.SIGINT)
-    sock.close()
-    return 1
+            async for exit_response, _ in replies:
+                returns = EXECUTE.returns.model_validate(exit_response.parameters or {})
+                if returns.exit_code is not None:
+                    await stdout_task
+                    await stderr_task
+                    return returns.exit_code
+            return 1
+        except ConnectionError:
+            await stdout_task
+            await stderr_task
+            return 1
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            loop.remove_signal_handler(signal.SIGINT)
+
+    async def close(self) -> None:
+        self._reading_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._reading_task
+        self.sock.close()
+
+    async def __aenter__(self) -> "Client":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+async def run_client(command: list[str]) -> int:
+    """Run a command via the server and return its exit code."""
+    async with Client.connect() as client:
+        return await client.execute(command)
 
 
 def main():
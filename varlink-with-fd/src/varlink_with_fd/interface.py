@@ -0,0 +1,269 @@
+"""Varlink interface descriptions, parsed into pydantic models of the parameters of their calls.
+
+An interface file looks like:
+
+    interface org.example.ping
+
+    type Pong (message: string, at: ?float)
+
+    method Ping(message: string) -> (pong: Pong)
+
+    error Unreachable (host: string)
+
+Types are `bool`, `int`, `float`, `string`, `object`, the name of a `type` of the interface, an
+inline struct `(name: type, ...)` or enum `(a, b, ...)`, and `?T` (optional), `[]T` (array) or
+`[string]T` (map) of these.
+"""
+
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+from importlib.resources import files
+from typing import Any, Literal
+
+from pydantic import BaseModel, ConfigDict, create_model
+
+from .protocol import Request, VarlinkError
+
+_TOKEN_PATTERN = re.compile(
+    r"\s+|#[^\n]*|(?P<token>->|\[\]|\[string\]|[?():,]|[A-Za-z_][A-Za-z0-9_.]*)"
+)
+
+_BASIC_TYPES: dict[str, Any] = {
+    "bool": bool,
+    "int": int,
+    "float": float,
+    "string": str,
+    "object": Any,
+}
+
+
+@dataclass(frozen=True)
+class Method:
+    name: str
+    """Qualified with the name of its interface, as in calls."""
+    parameters: type[BaseModel]
+    returns: type[BaseModel]
+
+    def request(self, *, more: bool = False, oneway: bool = False, **parameters: Any) -> Request:
+        """Build a call of this method, validating its parameters."""
+        return Request(
+            method=self.name,
+            parameters=self.parameters(**parameters).model_dump(exclude_none=True),
+            more=more,
+            oneway=oneway,
+        )
+
+
+@dataclass(frozen=True)
+class Interface:
+    name: str
+    description: str
+    """The text the interface was parsed from, as returned by GetInterfaceDescription."""
+    types: dict[str, Any]
+    methods: dict[str, Method]
+    errors: dict[str, type[BaseModel]]
+
+    def error(self, name: str, **parameters: Any) -> VarlinkError:
+        """Build an error of this interface, validating its parameters."""
+        model = self.errors[name](**parameters)
+        return VarlinkError(f"{self.name}.{name}", model.model_dump(exclude_none=True))
+
+
+class _Parser:
+    """Parse an interface description, then build the models of its types once all are known."""
+
+    def __init__(self, description: str):
+        self.description = description
+        self.tokens: list[tuple[str, int]] = []
+        position = 0
+        while position < len(description):
+            match = _TOKEN_PATTERN.match(description, position)
+            if match is None:
+                raise ValueError(f"Unexpected character {description[position]!r} at {position}")
+            if match["token"] is not None:
+                self.tokens.append((match["token"], position))
+            position = match.end()
+        self.index = 0
+        # The definitions of the types of the interface, and their models once built.
+        self.definitions: dict[str, tuple] = {}
+        self.models: dict[str, Any] = {}
+
+    def peek(self) -> str | None:
+        return self.tokens[self.index][0] if self.index < len(self.tokens) else None
+
+    def take(self, expected: str | None = None) -> str:
+        if self.index == len(self.tokens):
+            raise ValueError(f"Unexpected end of interface, expected {expected or 'more'}")
+        token, position = self.tokens[self.index]
+        if expected is not None and token != expected:
+            raise ValueError(f"Expected {expected!r} at {position}, got {token!r}")
+        self.index += 1
+        return token
+
+    def take_name(self) -> str:
+        token = self.take()
+        if not token[0].isalpha() and token[0] != "_":
+            raise ValueError(f"Expected a name at {self.tokens[self.index - 1][1]}, got {token!r}")
+        return token
+
+    def take_type(self) -> tuple:
+        """Parse a type into a definition, as a tuple whose first item tells its kind."""
+        token = self.peek()
+        if token == "?":
+            self.take()
+            return ("optional", self.take_type())
+        if token == "[]":
+            self.take()
+            return ("array", self.take_type())
+        if token == "[string]":
+            self.take()
+            return ("map", self.take_type())
+        if token == "(":
+            return self.take_struct_or_enum()
+        name = self.take_name()
+        return ("basic", name) if name in _BASIC_TYPES else ("named", name)
+
+    def take_struct_or_enum(self) -> tuple:
+        self.take("(")
+        fields: list[tuple[str, tuple]] = []
+        values: list[str] = []
+        while self.peek() != ")":
+            if fields or values:
+                self.take(",")
+            name = self.take_name()
+            if self.peek() == ":":
+                self.take()
+                fields.append((name, self.take_type()))
+            else:
+                values.append(name)
+        self.take(")")
+        if fields and values:
+            names = [name for name, _ in fields]
+            raise ValueError(f"Struct fields {names} mixed with enum values {values}")
+        return ("enum", values) if values else ("struct", fields)
+
+    def model(self, definition: tuple, name: str) -> Any:
+        """Build the Python type of a definition, named *name* if it is a struct."""
+        match definition:
+            case ("optional", inner):
+                return self.model(inner, name) | None
+            case ("array", inner):
+                return list[self.model(inner, name)]
+            case ("map", inner):
+                return dict[str, self.model(inner, name)]
+            case ("basic", basic):
+                return _BASIC_TYPES[basic]
+            case ("named", named):
+                if named not in self.definitions:
+                    raise ValueError(f"Unknown type: {named}")
+                if named not in self.models:
+                    # Stands for the type while its model is built, to tell a recursive one.
+                    self.models[named] = None
+                    self.models[named] = self.model(self.definitions[named], named)
+                elif self.models[named] is None:
+                    raise ValueError(f"Recursive type: {named}")
+                return self.models[named]
+            case ("enum", values):
+                return Literal[tuple(values)]
+            case ("struct", fields):
+                return self.struct(fields, name)
+
+    def struct(
+        self, fields: list[tuple[str, tuple]], name: str, config: ConfigDict | None = None
+    ) -> type[BaseModel]:
+        return create_model(
+            name,
+            __config__=config,
+            **{
+                field: (
+                    self.model(definition, f"{name}{field.title().replace('_', '')}"),
+                    None if definition[0] == "optional" else ...,
+                )
+                for field, definition in fields
+            },
+        )
+
+    def parse(self) -> Interface:
+        self.take("interface")
+        interface_name = self.take_name()
+        methods: dict[str, tuple] = {}
+        errors: dict[str, tuple] = {}
+        while (keyword := self.peek()) is not None:
+            self.take()
+            name = self.take_name()
+            if name in self.definitions or name in methods or name in errors:
+                raise ValueError(f"{name} is defined twice")
+            match keyword:
+                case "type":
+                    self.definitions[name] = self.take_struct_or_enum()
+                case "method":
+                    parameters = self.take_struct_or_enum()
+                    self.take("->")
+                    methods[name] = (parameters, self.take_struct_or_enum())
+                case "error":
+                    errors[name] = self.take_struct_or_enum()
+                case _:
+                    raise ValueError(f"Expected type, method or error, got {keyword!r}")
+
+        for name in self.definitions:
+            self.model(("named", name), name)
+        # Unknown parameters are refused, while unknown results are left for newer servers to add.
+        forbid = ConfigDict(extra="forbid")
+        return Interface(
+            name=interface_name,
+            description=self.description,
+            types=self.models,
+            methods={
+                name: Method(
+                    name=f"{interface_name}.{name}",
+                    parameters=self.struct(_fields(parameters, name), f"{name}Parameters", forbid),
+                    returns=self.struct(_fields(returns, name), f"{name}Returns"),
+                )
+                for name, (parameters, returns) in methods.items()
+            },
+            errors={
+                name: self.struct(_fields(parameters, name), f"{name}Error")
+                for name, parameters in errors.items()
+            },
+        )
+
+
+def _fields(definition: tuple, name: str) -> list[tuple[str, tuple]]:
+    if definition[0] != "struct" and definition[1]:
+        raise ValueError(f"{name} takes an enum instead of fields")
+    return definition[1]
+
+
+def parse_interface(description: str) -> Interface:
+    """Parse a varlink interface description. Raises `ValueError` if it is not valid."""
+    return _Parser(description).parse()
+
+
+def load_interface(name: str) -> Interface:
+    """Load the interface *name* from the `<name>.varlink` file shipped with this package."""
+    return parse_interface((files(__package__) / f"{name}.varlink").read_text())
+
+
+def dispatch_table[H: Callable](
+    interfaces: list[Interface], handlers: dict[str, H]
+) -> dict[str, tuple[Method, H]]:
+    """Map the qualified name of each method to the method and the handler of its calls.
+
+    Raises `ValueError` unless there is a handler for each method of the interfaces, and a
+    method for each handler, so that a mismatch shows up on startup rather than on a call.
+    """
+    methods = {
+        method.name: method
+        for interface in interfaces
+        for method in interface.methods.values()
+    }
+    if missing := methods.keys() - handlers.keys():
+        raise ValueError(f"No handler for {', '.join(sorted(missing))}")
+    if unknown := handlers.keys() - methods.keys():
+        raise ValueError(f"No method for the handlers of {', '.join(sorted(unknown))}")
+    return {name: (method, handlers[name]) for name, method in methods.items()}
+
+
+SERVICE = load_interface("org.varlink.service")
+STUDY = load_interface("xyz.rouages.study")
@@ -1,19 +1,29 @@
 """Varlink protocol: JSON messages with null-byte framing."""
 
+import os
+import socket
 from typing import Any
 
 from pydantic import BaseModel
 
+from .socket import recv_with_fds_async
+
 
 class Request(BaseModel):
-    """Varlink request message."""
+    """Varlink request message.
+
+    A call with `more` set may get several replies, all but the last one with `continues` set.
+    A call with `oneway` set gets no reply at all.
+    """
 
     method: str
     parameters: dict[str, Any] = {}
+    more: bool = False
+    oneway: bool = False
 
     def encode(self) -> bytes:
-        """Encode request to bytes with null terminator."""
-        return self.model_dump_json().encode("utf-8") + b"\0"
+        """Encode request to bytes with null terminator, leaving out the unset flags."""
+        return self.model_dump_json(exclude_defaults=True).encode("utf-8") + b"\0"
 
     @classmethod
     def decode(cls, data: bytes) -> "Request":
@@ -26,10 +36,11 @@ class Response(BaseModel):
 
     parameters: dict[str, Any] | None = None
     error: str | None = None
+    continues: bool = False
 
     def encode(self) -> bytes:
         """Encode response to bytes with null terminator."""
-        return self.model_dump_json(exclude_none=True).encode("utf-8") + b"\0"
+        return self.model_dump_json(exclude_none=True, exclude_defaults=True).encode("utf-8") + b"\0"
 
     @classmethod
     def decode(cls, data: bytes) -> "Response":
@@ -37,6 +48,18 @@ class Response(BaseModel):
         return cls.model_validate_json(data)
 
 
+class VarlinkError(Exception):
+    """Varlink error, replied to a call with its name and parameters."""
+
+    def __init__(self, name: str, parameters: dict[str, Any] | None = None):
+        super().__init__(name, parameters or {})
+        self.name = name
+        self.parameters = parameters or {}
+
+    def to_response(self) -> Response:
+        return Response(error=self.name, parameters=self.parameters)
+
+
 def read_message(buffer: bytes) -> tuple[bytes | None, bytes]:
     """Extract a complete message from buffer.
 
@@ -46,3 +69,71 @@ def read_message(buffer: bytes) -> tuple[bytes | None, bytes]:
     if idx == -1:
         return None, buffer
     return buffer[:idx], buffer[idx + 1 :]
+
+
+# Up to this size, reads get larger as long as they fill the buffer they are given.
+_MAX_RECV_SIZE = 1024 * 1024
+
+
+class MessageReader[M: (Request, Response)]:
+    """Read the messages received on a non-blocking socket, each with the fds sent along with it.
+
+    A recvmsg returning fds stops right after the data they were sent with, so they belong to
+    the last message starting in that data, or to the message it continues if none does. Fds
+    sent along with several parts of a message all belong to it.
+    """
+
+    def __init__(self, sock: socket.socket, message_type: type[M]):
+        self.sock = sock
+        self.message_type = message_type
+        self._buffer = bytearray()
+        # The bytes before this offset are known not to end a message.
+        self._scanned = 0
+        # The fds received, with the offset in the buffer of the message they belong to.
+        self._fds: list[tuple[int, list[int]]] = []
+        self._recv_size = 4096
+
+    async def read(self) -> tuple[M, list[int]] | None:
+        """Return the next message with its fds, or None once the peer closed the connection."""
+        while (end := self._buffer.find(b"\0", self._scanned)) == -1:
+            self._scanned = len(self._buffer)
+            data, fds = await recv_with_fds_async(self.sock, self._recv_size)
+            if not data:
+                if self._buffer:
+                    raise ConnectionError("Connection closed in the middle of a message")
+                return None
+            if fds:
+                offset = len(self._buffer) + data.rfind(b"\0", 0, len(data) - 1) + 1
+                self._fds.append((offset, fds))
+            self._buffer += data
+            if len(data) == self._recv_size:
+                self._recv_size = min(self._recv_size * 2, _MAX_RECV_SIZE)
+
+        msg_fds = [fd for offset, fds in self._fds if offset <= end for fd in fds]
+        self._fds = [(offset - end - 1, fds) for offset, fds in self._fds if offset > end]
+        msg_data = self._buffer[:end]
+        # Deleting from the start of a bytearray does not move what follows.
+        del self._buffer[: end + 1]
+        self._scanned = 0
+        try:
+            return self.message_type.decode(msg_data), msg_fds
+        except Exception:
+            for fd in msg_fds:
+                os.close(fd)
+            raise
+
+    def __aiter__(self) -> "MessageReader[M]":
+        return self
+
+    async def __anext__(self) -> tuple[M, list[int]]:
+        message = await self.read()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def close(self) -> None:
+        """Close the fds received along with a message not read yet."""
+        for _, fds in self._fds:
+            for fd in fds:
+                os.close(fd)
+        self._fds.clear()
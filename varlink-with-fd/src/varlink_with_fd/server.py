@@ -2,60 +2,117 @@
 
 import asyncio
 import os
-import select
 import signal
 import socket
-import subprocess
 import sys
-import threading
+from contextlib import suppress
+from typing import Any
 
-from .protocol import Request, Response, read_message
+from pydantic import ValidationError
+
+from . import __version__
+from .interface import SERVICE, STUDY, dispatch_table
+from .protocol import MessageReader, Request, Response, VarlinkError
 from .socket import (
     SOCKET_PATH,
-    recv_with_fds,
-    send_with_fds,
+    send_with_fds_async,
 )
 
 # Global tracking of running processes
 running_processes: dict[int, list[str]] = {}
-processes_lock = threading.Lock()
 
 
-def handle_client_sync(client_sock: socket.socket):
-    """Handle a single client connection synchronously."""
-    buffer = b""
+class Connection:
+    """A client connection, over which any number of calls can be made.
 
-    try:
-        data, fds = recv_with_fds(client_sock)
-        if not data:
-            return
-        buffer += data
+    Calls are answered in the order they were made, each once the previous one got its last reply,
+    so a client can pipeline them. Oneway calls get no reply: they are handled as soon as they
+    come, which is how a Signal reaches the process of an Execute still running. The methods
+    that can be called are those of `INTERFACES`, each dispatched through `METHODS`.
+    """
 
-        msg_data, buffer = read_message(buffer)
-        if msg_data is None:
-            return
+    def __init__(self, client_sock: socket.socket):
+        self.client_sock = client_sock
+        self.process: asyncio.subprocess.Process | None = None
 
-        request = Request.decode(msg_data)
+    async def reply(
+        self, request: Request, response: Response, fds: list[int] | None = None
+    ) -> None:
+        if not request.oneway:
+            await send_with_fds_async(self.client_sock, response.encode(), fds or [])
 
-        if request.method != "Execute":
-            response = Response(error=f"Unknown method: {request.method}")
-            send_with_fds(client_sock, response.encode(), [])
-            return
+    async def call(self, request: Request, fds: list[int]) -> None:
+        """Validate the parameters of a call and hand it to the handler of its method.
 
-        command = request.parameters.get("command", [])
+        Handlers take the fds they keep out of *fds*: the others are closed once they return.
+        """
+        try:
+            try:
+                method, handler = METHODS[request.method]
+            except KeyError:
+                raise SERVICE.error("MethodNotFound", method=request.method) from None
+            try:
+                parameters = method.parameters.model_validate(request.parameters)
+            except ValidationError as e:
+                parameter = ".".join(str(loc) for loc in e.errors()[0]["loc"])
+                raise SERVICE.error("InvalidParameter", parameter=parameter) from None
+            await handler(self, request, parameters, fds)
+        except VarlinkError as e:
+            await self.reply(request, e.to_response())
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    async def get_info(self, request: Request, parameters: Any, fds: list[int]) -> None:
+        returns = SERVICE.methods["GetInfo"].returns(
+            vendor="radium226",
+            product="studyd",
+            version=__version__,
+            url="",
+            interfaces=list(INTERFACES),
+        )
+        await self.reply(request, Response(parameters=returns.model_dump()))
+
+    async def get_interface_description(
+        self, request: Request, parameters: Any, fds: list[int]
+    ) -> None:
+        interface = INTERFACES.get(parameters.interface)
+        if interface is None:
+            raise SERVICE.error("InterfaceNotFound", interface=parameters.interface)
+        returns = SERVICE.methods["GetInterfaceDescription"].returns(
+            description=interface.description
+        )
+        await self.reply(request, Response(parameters=returns.model_dump()))
+
+    async def signal(self, request: Request, parameters: Any, fds: list[int]) -> None:
+        sig = signal.SIGTERM if parameters.signal is None else parameters.signal
+        if self.process is None:
+            print(f"No process to forward signal {sig} to", file=sys.stderr)
+        else:
+            print(f"Forwarding signal {sig} to process {self.process.pid}", file=sys.stderr)
+            # The process may have exited in the meantime.
+            with suppress(ProcessLookupError):
+                self.process.send_signal(sig)
+        await self.reply(request, Response(parameters={}))
+
+    async def execute(self, request: Request, parameters: Any, fds: list[int]) -> None:
+        # Replies go out as the process starts and exits.
+        if not request.more and not request.oneway:
+            raise SERVICE.error("ExpectedMore")
+
+        command = parameters.command
         if not command:
-            response = Response(error="No command specified")
-            send_with_fds(client_sock, response.encode(), [])
-            return
+            raise SERVICE.error("InvalidParameter", parameter="command")
 
-        stdin_fd = fds[0] if fds else os.open("/dev/null", os.O_RDONLY)
+        stdin_fd = fds.pop(0) if fds else os.open("/dev/null", os.O_RDONLY)
 
         stdout_read, stdout_write = os.pipe()
         stderr_read, stderr_write = os.pipe()
 
         try:
-            process = subprocess.Popen(
-                command,
+            # Its exit is reported by the loop's child watcher, which watches a pidfd per process.
+            process = await asyncio.create_subprocess_exec(
+                *command,
                 stdin=stdin_fd,
                 stdout=stdout_write,
                 stderr=stderr_write,
@@ -67,70 +124,108 @@ def handle_client_sync(client_sock: socket.socket):
             os.close(stderr_read)
             os.close(stderr_write)
             os.close(stdin_fd)
-            response = Response(error=str(e))
-            send_with_fds(client_sock, response.encode(), [])
-            return
+            raise STUDY.error("ExecutionFailed", reason=str(e)) from e
 
         os.close(stdout_write)
         os.close(stderr_write)
         os.close(stdin_fd)
 
-        with processes_lock:
-            running_processes[process.pid] = command
-
-        response = Response(parameters={})
-        send_with_fds(client_sock, response.encode(), [stdout_read, stderr_read])
+        running_processes[process.pid] = command
+        self.process = process
 
-        os.close(stdout_read)
-        os.close(stderr_read)
+        try:
+            try:
+                await self.reply(
+                    request,
+                    Response(parameters={}, continues=True),
+                    [stdout_read, stderr_read],
+                )
+            finally:
+                os.close(stdout_read)
+                os.close(stderr_read)
 
-        # Wait for process while listening for Signal requests from client
-        signal_buffer = b""
-        while True:
-            readable, _, _ = select.select([client_sock], [], [], 0.1)
-
-            if readable:
-                try:
-                    data, _ = recv_with_fds(client_sock)
-                    if data:
-                        signal_buffer += data
-                        msg_data, signal_buffer = read_message(signal_buffer)
-                        if msg_data:
-                            req = Request.decode(msg_data)
-                            if req.method == "Signal":
-                                sig = req.parameters.get("signal", signal.SIGTERM)
-                                print(f"Forwarding signal {sig} to process {process.pid}", file=sys.stderr)
-                                process.send_signal(sig)
-                except OSError:
-                    pass
-
-            ret = process.poll()
-            if ret is not None:
-                exit_code = ret
-                print(f"Process {process.pid} exited with code {exit_code}", file=sys.stderr)
-                break
-
-        with processes_lock:
+            exit_code = await process.wait()
+            print(f"Process {process.pid} exited with code {exit_code}", file=sys.stderr)
+        finally:
             running_processes.pop(process.pid, None)
+            self.process = None
+
+        returns = STUDY.methods["Execute"].returns(exit_code=exit_code)
+        await self.reply(request, Response(parameters=returns.model_dump()))
 
-        exit_response = Response(parameters={"exit_code": exit_code})
-        send_with_fds(client_sock, exit_response.encode(), [])
 
+INTERFACES = {interface.name: interface for interface in (SERVICE, STUDY)}
+
+# Built on import, so that a method without handler or the other way around fails on startup.
+METHODS = dispatch_table(
+    list(INTERFACES.values()),
+    {
+        "org.varlink.service.GetInfo": Connection.get_info,
+        "org.varlink.service.GetInterfaceDescription": Connection.get_interface_description,
+        "xyz.rouages.study.Execute": Connection.execute,
+        "xyz.rouages.study.Signal": Connection.signal,
+    },
+)
+
+
+async def handle_client(client_sock: socket.socket):
+    """Handle the calls of a client connection on the event loop, until it disconnects."""
+    connection = Connection(client_sock)
+    calls: asyncio.Queue[tuple[Request, list[int]] | None] = asyncio.Queue()
+
+    async def answer_calls():
+        while (call := await calls.get()) is not None:
+            await connection.call(*call)
+
+    answering_task = asyncio.create_task(answer_calls())
+    oneway_tasks: set[asyncio.Task] = set()
+    reader = MessageReader(client_sock, Request)
+    try:
+        async for request, fds in reader:
+            if request.oneway:
+                task = asyncio.create_task(connection.call(request, fds))
+                oneway_tasks.add(task)
+                task.add_done_callback(oneway_tasks.discard)
+            else:
+                calls.put_nowait((request, fds))
+        # The calls made before the client stopped sending still get their replies.
+        calls.put_nowait(None)
+        await answering_task
+        if oneway_tasks:
+            await asyncio.wait(oneway_tasks)
     except Exception as e:
         print(f"Error handling client: {e}", file=sys.stderr)
     finally:
+        answering_task.cancel()
+        for task in oneway_tasks:
+            task.cancel()
+        reader.close()
         client_sock.close()
 
 
+async def accept_clients(server_sock: socket.socket):
+    """Accept clients, each handled by a task of its own."""
+    loop = asyncio.get_running_loop()
+    client_tasks: set[asyncio.Task] = set()
+    try:
+        while True:
+            client_sock, _ = await loop.sock_accept(server_sock)
+            task = asyncio.create_task(handle_client(client_sock))
+            client_tasks.add(task)
+            task.add_done_callback(client_tasks.discard)
+    finally:
+        for task in client_tasks:
+            task.cancel()
+
+
 async def log_running_processes(stop_event: asyncio.Event):
     """Log running processes every second."""
     while not stop_event.is_set():
-        with processes_lock:
-            if running_processes:
-                procs = ", ".join(
-                    f"{pid}:{cmd[0]}" for pid, cmd in running_processes.items()
-                )
-                print(f"Running: {procs}", file=sys.stderr)
+        if running_processes:
+            procs = ", ".join(
+                f"{pid}:{cmd[0]}" for pid, cmd in running_processes.items()
+            )
+            print(f"Running: {procs}", file=sys.stderr)
         try:
             await asyncio.wait_for(stop_event.wait(), timeout=1.0)
         except asyncio.TimeoutError:
@@ -144,12 +239,13 @@ async def run_server():
 
     server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     server_sock.bind(SOCKET_PATH)
-    server_sock.listen(5)
+    # Clients are accepted as fast as they come: let them queue up as much as the kernel allows.
+    server_sock.listen(socket.SOMAXCONN)
     server_sock.setblocking(False)
 
     print(f"Server listening on {SOCKET_PATH}", file=sys.stderr)
 
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     stop_event = asyncio.Event()
 
     def handle_signal():
@@ -159,17 +255,12 @@ async def run_server():
         loop.add_signal_handler(sig, handle_signal)
 
     logging_task = asyncio.create_task(log_running_processes(stop_event))
+    accepting_task = asyncio.create_task(accept_clients(server_sock))
 
     try:
-        while not stop_event.is_set():
-            try:
-                client_sock, _ = await asyncio.wait_for(
-                    loop.sock_accept(server_sock), timeout=0.5
-                )
-                loop.run_in_executor(None, handle_client_sync, client_sock)
-            except asyncio.TimeoutError:
-                continue
+        await stop_event.wait()
     finally:
+        accepting_task.cancel()
         logging_task.cancel()
         server_sock.close()
         if os.path.exists(SOCKET_PATH):
@@ -1,6 +1,7 @@
 """Unix socket utilities with SCM_RIGHTS file descriptor passing."""
 
 import array
+import asyncio
 import socket
 import struct
 
@@ -32,6 +33,50 @@ def recv_with_fds(
     return data, fds
 
 
+async def _wait_for(sock: socket.socket, add, remove) -> None:
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    add(sock, ready.set_result, None)
+    try:
+        await ready
+    finally:
+        remove(sock)
+
+
+async def send_with_fds_async(
+    sock: socket.socket, data: bytes, fds: list[int]
+) -> None:
+    """Send data with file descriptors on a non-blocking socket, without blocking the loop."""
+    loop = asyncio.get_running_loop()
+    view = memoryview(data)
+    while view:
+        try:
+            if fds:
+                fd_array = array.array("i", fds)
+                ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fd_array)]
+                sent = sock.sendmsg([view], ancdata)
+                # The fds go along with the first byte sent.
+                fds = []
+            else:
+                sent = sock.send(view)
+        except BlockingIOError:
+            await _wait_for(sock, loop.add_writer, loop.remove_writer)
+        else:
+            view = view[sent:]
+
+
+async def recv_with_fds_async(
+    sock: socket.socket, bufsize: int = 4096
+) -> tuple[bytes, list[int]]:
+    """Receive data with file descriptors from a non-blocking socket, without blocking the loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            return recv_with_fds(sock, bufsize)
+        except BlockingIOError:
+            await _wait_for(sock, loop.add_reader, loop.remove_reader)
+
+
 def create_server_socket() -> socket.socket:
     """Create and bind a Unix domain socket for the server."""
     import os
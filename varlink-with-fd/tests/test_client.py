@@ -0,0 +1,90 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+from varlink_with_fd.client import relay_fd_to_stream, splice_fd_to_fd
+
+
+class _BufferStream:
+    """A stream without fd, as sys.stdout when captured."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+
+def _pipe_with(data: bytes) -> int:
+    """Return the reading end of a pipe fed with data, from a thread as it may exceed its buffer."""
+    read_fd, write_fd = os.pipe()
+
+    def write():
+        with os.fdopen(write_fd, "wb") as pipe:
+            pipe.write(data)
+
+    asyncio.get_running_loop().run_in_executor(None, write)
+    return read_fd
+
+
+# relay_fd_to_stream tests
+
+
+def test_relay_splices_to_file():
+    """Relay to a file, through splice: it has no buffer to copy the data to."""
+    data = os.urandom(4 * 1024 * 1024)
+    with tempfile.TemporaryFile() as out:
+
+        async def relay():
+            await relay_fd_to_stream(_pipe_with(data), out)
+
+        asyncio.run(relay())
+        out.seek(0)
+        assert out.read() == data
+
+
+def test_relay_copies_to_stream_without_fd():
+    """Relay to a stream without fd, through a read pipe transport."""
+    data = os.urandom(4 * 1024 * 1024)
+    stream = _BufferStream()
+
+    async def relay():
+        await relay_fd_to_stream(_pipe_with(data), stream)
+
+    asyncio.run(relay())
+    assert stream.buffer.getvalue() == data
+
+
+def test_splice_to_full_pipe_does_not_block_the_loop():
+    """Splice to a pipe read late, as stdout ahead of a slow reader: the loop keeps running."""
+    data = os.urandom(4 * 1024 * 1024)
+    read_fd, write_fd = os.pipe()
+
+    def read_late() -> bytes:
+        time.sleep(0.3)
+        with os.fdopen(read_fd, "rb") as pipe:
+            return pipe.read()
+
+    async def relay() -> tuple[bytes, int]:
+        loop = asyncio.get_running_loop()
+        reading = loop.run_in_executor(None, read_late)
+        source_fd = _pipe_with(data)
+        splicing = asyncio.create_task(splice_fd_to_fd(source_fd, write_fd))
+        ticks = 0
+        while not splicing.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert splicing.result()
+        os.close(source_fd)
+        os.close(write_fd)
+        return await reading, ticks
+
+    received, ticks = asyncio.run(relay())
+    assert received == data
+    # About 30 while the pipe is not read, none if the splice blocked the loop meanwhile.
+    assert ticks > 10
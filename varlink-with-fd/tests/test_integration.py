@@ -1,9 +1,16 @@
+import asyncio
 import os
+import signal
 import socket
 import tempfile
 
-from varlink_with_fd.protocol import Request, Response, read_message
-from varlink_with_fd.socket import recv_with_fds, send_with_fds
+import pytest
+
+from varlink_with_fd.client import Client
+from varlink_with_fd.interface import STUDY
+from varlink_with_fd.protocol import MessageReader, Request, Response, read_message
+from varlink_with_fd.server import handle_client
+from varlink_with_fd.socket import recv_with_fds, send_with_fds, send_with_fds_async
 
 
 def test_client_server_request_response():
@@ -95,3 +102,218 @@ def test_client_server_with_fd_passing():
         sock2.close()
         if tmp_path:
             os.unlink(tmp_path)
+
+
+async def _execute(
+    client: Client, command: list[str], signum: int | None = None
+) -> tuple[bytes, int]:
+    """Run a command through the client, return its stdout and exit code."""
+    loop = asyncio.get_running_loop()
+    stdin_fd = os.open(os.devnull, os.O_RDONLY)
+    request = STUDY.methods["Execute"].request(command=command, more=True)
+    replies = client.call(request, [stdin_fd])
+    response, fds = await anext(replies)
+    os.close(stdin_fd)
+    assert response.error is None
+    assert response.continues
+    stdout_fd, stderr_fd = fds
+    os.close(stderr_fd)
+
+    if signum is not None:
+        signal_request = STUDY.methods["Signal"].request(signal=signum, oneway=True)
+        async for _ in client.call(signal_request):
+            pass
+
+    with os.fdopen(stdout_fd, "rb") as stdout:
+        output = await loop.run_in_executor(None, stdout.read)
+    response, _ = await anext(replies)
+    assert not response.continues
+    return output, response.parameters["exit_code"]
+
+
+def _with_client(test):
+    """Run a test coroutine with a client connected to handle_client over a socketpair."""
+
+    async def run():
+        client_sock, server_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_sock.setblocking(False)
+        handling_task = asyncio.create_task(handle_client(server_sock))
+        async with Client(client_sock) as client:
+            result = await test(client)
+        await handling_task
+        return result
+
+    return asyncio.run(run())
+
+
+def test_handle_client_execute():
+    """Execute runs the command and reports its exit code once it exits."""
+    output, exit_code = _with_client(
+        lambda client: _execute(client, ["sh", "-c", "echo hello; exit 3"])
+    )
+    assert output == b"hello\n"
+    assert exit_code == 3
+
+
+def test_handle_client_forwards_signal():
+    """A oneway Signal request reaches the running process."""
+    _, exit_code = _with_client(
+        lambda client: _execute(client, ["sleep", "30"], signal.SIGTERM)
+    )
+    assert exit_code == -signal.SIGTERM
+
+
+def test_handle_client_several_calls():
+    """Calls made over the same connection are answered in order, even when pipelined."""
+
+    async def test(client):
+        first, second = await asyncio.gather(
+            _execute(client, ["sh", "-c", "sleep 0.2; echo first; exit 1"]),
+            _execute(client, ["sh", "-c", "echo second; exit 2"]),
+        )
+        third = await _execute(client, ["sh", "-c", "echo third"])
+        return [first, second, third]
+
+    assert _with_client(test) == [(b"first\n", 1), (b"second\n", 2), (b"third\n", 0)]
+
+
+def test_handle_client_execute_expects_more():
+    """Execute has several replies, so it can't be called without more."""
+
+    async def test(client):
+        request = STUDY.methods["Execute"].request(command=["true"])
+        return [response async for response, _ in client.call(request)]
+
+    assert _with_client(test) == [Response(error="org.varlink.service.ExpectedMore", parameters={})]
+
+
+def _call(request: Request) -> list[Response]:
+    """Make a call over a fresh connection, return its replies."""
+
+    async def test(client):
+        return [response async for response, _ in client.call(request)]
+
+    return _with_client(test)
+
+
+def test_handle_client_get_info():
+    """GetInfo lists the interfaces of the service."""
+    [response] = _call(Request(method="org.varlink.service.GetInfo"))
+    assert response.parameters["interfaces"] == ["org.varlink.service", "xyz.rouages.study"]
+
+
+def test_handle_client_get_interface_description():
+    """GetInterfaceDescription returns the interface file."""
+    request = Request(
+        method="org.varlink.service.GetInterfaceDescription",
+        parameters={"interface": "xyz.rouages.study"},
+    )
+    [response] = _call(request)
+    assert response.parameters["description"] == STUDY.description
+
+
+def test_handle_client_method_not_found():
+    """Calling an unknown method is a MethodNotFound error."""
+    assert _call(Request(method="xyz.rouages.study.Unknown")) == [
+        Response(
+            error="org.varlink.service.MethodNotFound",
+            parameters={"method": "xyz.rouages.study.Unknown"},
+        )
+    ]
+
+
+def test_handle_client_invalid_parameter():
+    """Parameters not matching the interface are an InvalidParameter error."""
+    request = Request(
+        method="xyz.rouages.study.Execute", parameters={"command": "true"}, more=True
+    )
+    assert _call(request) == [
+        Response(
+            error="org.varlink.service.InvalidParameter",
+            parameters={"parameter": "command"},
+        )
+    ]
+
+
+async def _echo(sock: socket.socket) -> None:
+    """Answer each call with its parameters, as a server would."""
+    async for request, fds in MessageReader(sock, Request):
+        for fd in fds:
+            os.close(fd)
+        await send_with_fds_async(sock, Response(parameters=request.parameters).encode(), [])
+
+
+def _with_echo_client(test):
+    """Run a test coroutine with a client connected to _echo over a socketpair."""
+
+    async def run():
+        client_sock, server_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_sock.setblocking(False)
+        echoing_task = asyncio.create_task(_echo(server_sock))
+        try:
+            async with Client(client_sock) as client:
+                return await test(client)
+        finally:
+            await echoing_task
+            server_sock.close()
+
+    return asyncio.run(run())
+
+
+def test_client_concurrent_large_calls():
+    """Calls larger than the socket buffer are sent whole, in the order of their replies."""
+
+    async def test(client):
+        async def call(letter):
+            request = Request(method="xyz.rouages.study.Echo", parameters={"data": letter * 2**21})
+            [(response, _)] = [reply async for reply in client.call(request)]
+            return response.parameters["data"] == letter * 2**21
+
+        return await asyncio.gather(*[call(letter) for letter in "abcd"])
+
+    assert _with_echo_client(test) == [True] * 4
+
+
+def test_client_call_after_connection_closed():
+    """Calls made once the server stopped replying raise rather than wait forever."""
+    client_sock, server_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Calls can still be sent, but no reply will come.
+    server_sock.shutdown(socket.SHUT_WR)
+
+    async def test():
+        async with Client(client_sock) as client:
+            await asyncio.sleep(0.1)
+            with pytest.raises(ConnectionError):
+                async for _ in client.call(Request(method="org.varlink.service.GetInfo")):
+                    pass
+
+    try:
+        asyncio.run(test())
+    finally:
+        server_sock.close()
+
+
+def test_client_unsolicited_reply_ends_connection():
+    """A reply to no call closes the connection, along with the fds it came with."""
+    client_sock, server_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    read_fd, write_fd = os.pipe()
+
+    async def test():
+        async with Client(client_sock) as client:
+            send_with_fds(server_sock, Response(parameters={}).encode(), [read_fd])
+            os.close(read_fd)
+            await asyncio.sleep(0.1)
+            # Shut down by the client, so the server reads the end of the connection.
+            assert server_sock.recv(1) == b""
+            with pytest.raises(ConnectionError):
+                async for _ in client.call(Request(method="org.varlink.service.GetInfo")):
+                    pass
+
+    try:
+        asyncio.run(test())
+        # The client closed the reading end it received, the last one.
+        with pytest.raises(BrokenPipeError):
+            os.write(write_fd, b"x")
+    finally:
+        os.close(write_fd)
+        server_sock.close()
@@ -0,0 +1,136 @@
+import pytest
+from pydantic import ValidationError
+
+from varlink_with_fd.interface import dispatch_table, parse_interface
+
+_DESCRIPTION = """
+# An interface using every kind of type.
+interface org.example.test
+
+type Color (red, green, blue)
+
+type Item (name: string, tags: []string, attributes: [string]string)
+
+method Paint(item: Item, color: Color, shade: ?float, extra: object) -> (
+  painted: bool,
+  previous: ?Color,
+  position: (x: int, y: int)
+)
+
+error NotPaintable (reason: string)
+"""
+
+
+# parse_interface tests
+
+
+def test_parse_interface_methods():
+    """Methods are qualified with the name of the interface."""
+    interface = parse_interface(_DESCRIPTION)
+    assert interface.name == "org.example.test"
+    assert interface.description == _DESCRIPTION
+    assert list(interface.methods) == ["Paint"]
+    assert interface.methods["Paint"].name == "org.example.test.Paint"
+
+
+def test_parse_interface_parameters_model():
+    """Parameters are validated against the types of the interface."""
+    parameters = parse_interface(_DESCRIPTION).methods["Paint"].parameters
+    validated = parameters.model_validate(
+        {
+            "item": {"name": "box", "tags": ["a"], "attributes": {"k": "v"}},
+            "color": "red",
+            "extra": {"any": [1]},
+        }
+    )
+    assert validated.item.tags == ["a"]
+    assert validated.shade is None
+
+    with pytest.raises(ValidationError):
+        parameters.model_validate({"item": {"name": "box"}, "color": "red", "extra": 1})
+    with pytest.raises(ValidationError):
+        parameters.model_validate(
+            {
+                "item": {"name": "box", "tags": [], "attributes": {}},
+                "color": "purple",
+                "extra": 1,
+            }
+        )
+
+
+def test_parse_interface_refuses_unknown_parameters():
+    """Unknown parameters are refused, unknown results are not."""
+    method = parse_interface(_DESCRIPTION).methods["Paint"]
+    with pytest.raises(ValidationError):
+        method.parameters.model_validate(
+            {
+                "item": {"name": "box", "tags": [], "attributes": {}},
+                "color": "red",
+                "extra": None,
+                "unknown": 1,
+            }
+        )
+    returns = method.returns.model_validate(
+        {"painted": True, "position": {"x": 1, "y": 2}, "unknown": 1}
+    )
+    assert returns.position.x == 1
+
+
+def test_parse_interface_request():
+    """Requests are built from validated parameters, without the unset optional ones."""
+    request = parse_interface(_DESCRIPTION).methods["Paint"].request(
+        item={"name": "box", "tags": [], "attributes": {}}, color="blue", extra=1, more=True
+    )
+    assert request.method == "org.example.test.Paint"
+    assert request.parameters == {
+        "item": {"name": "box", "tags": [], "attributes": {}},
+        "color": "blue",
+        "extra": 1,
+    }
+    assert request.more
+
+
+def test_parse_interface_error():
+    """Errors are qualified with the name of the interface."""
+    error = parse_interface(_DESCRIPTION).error("NotPaintable", reason="wet")
+    assert error.name == "org.example.test.NotPaintable"
+    assert error.parameters == {"reason": "wet"}
+
+
+@pytest.mark.parametrize(
+    "description",
+    [
+        "method M() -> ()",
+        "interface a.b method M() (",
+        "interface a.b method M() -> () method M() -> ()",
+        "interface a.b method M() -> (x: Unknown)",
+        "interface a.b method M(a, b) -> ()",
+        "interface a.b type T (t: ?T)",
+        "interface a.b type T (x: int, y)",
+        "interface a.b thing T ()",
+        "interface a.b type T (x: int) @",
+    ],
+)
+def test_parse_interface_invalid(description):
+    """Invalid descriptions raise ValueError."""
+    with pytest.raises(ValueError):
+        parse_interface(description)
+
+
+# dispatch_table function tests
+
+
+def test_dispatch_table():
+    """Each method is mapped to its handler by its qualified name."""
+    interface = parse_interface(_DESCRIPTION)
+    table = dispatch_table([interface], {"org.example.test.Paint": print})
+    assert table == {"org.example.test.Paint": (interface.methods["Paint"], print)}
+
+
+def test_dispatch_table_mismatch():
+    """Methods without handler and handlers without method are refused."""
+    interface = parse_interface(_DESCRIPTION)
+    with pytest.raises(ValueError):
+        dispatch_table([interface], {})
+    with pytest.raises(ValueError):
+        dispatch_table([interface], {"org.example.test.Paint": print, "org.example.test.Other": print})
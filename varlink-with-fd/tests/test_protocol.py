@@ -1,6 +1,12 @@
+import asyncio
+import os
 import signal
+import socket
 
-from varlink_with_fd.protocol import Request, Response, read_message
+import pytest
+
+from varlink_with_fd.protocol import MessageReader, Request, Response, read_message
+from varlink_with_fd.socket import send_with_fds
 
 
 def test_signal_enum_serialization():
@@ -63,6 +69,14 @@ def test_request_roundtrip():
     assert decoded.parameters == original.parameters
 
 
+def test_request_encode_flags():
+    """The more and oneway flags are only sent when set."""
+    assert b"more" not in Request(method="test").encode()
+    assert b"oneway" not in Request(method="test").encode()
+    assert b'"more":true' in Request(method="test", more=True).encode()
+    assert b'"oneway":true' in Request(method="test", oneway=True).encode()
+
+
 # Response class tests
 
 
@@ -115,6 +129,14 @@ def test_response_roundtrip():
     assert decoded.error == original.error
 
 
+def test_response_continues_roundtrip():
+    """A reply followed by others has continues set."""
+    encoded = Response(parameters={}, continues=True).encode()
+    assert encoded == b'{"parameters":{},"continues":true}\0'
+    assert Response.decode(encoded[:-1]).continues
+    assert not Response.decode(b'{"parameters": {}}').continues
+
+
 def test_response_excludes_none_fields():
     """Verify exclude_none behavior."""
     response = Response(parameters={"value": 1}, error=None)
@@ -161,3 +183,98 @@ def test_read_message_empty_buffer():
     message, remaining = read_message(buffer)
     assert message is None
     assert remaining == b""
+
+
+# MessageReader class tests
+
+
+def _read_all(send) -> list[tuple[Request, list[bytes]]]:
+    """Read the requests sent by send(sock), with the content of the pipes sent along with each."""
+    sock1, sock2 = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock2.setblocking(False)
+
+    async def read():
+        loop = asyncio.get_running_loop()
+        sending = loop.run_in_executor(None, send, sock1)
+        reader = MessageReader(sock2, Request)
+        messages = []
+        async for request, fds in reader:
+            contents = []
+            for fd in fds:
+                contents.append(os.read(fd, 1024))
+                os.close(fd)
+            messages.append((request, contents))
+        await sending
+        return messages
+
+    try:
+        return asyncio.run(read())
+    finally:
+        sock2.close()
+
+
+def _pipe_with(data: bytes) -> int:
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    return read_fd
+
+
+def _send_and_close(sock: socket.socket, *parts: tuple[bytes, list[int]]) -> None:
+    with sock:
+        for data, fds in parts:
+            send_with_fds(sock, data, fds)
+            for fd in fds:
+                os.close(fd)
+
+
+def test_message_reader_large_message():
+    """Read a message far larger than a single read."""
+    command = ["echo", "x" * (4 * 1024 * 1024)]
+    request = Request(method="Execute", parameters={"command": command})
+    messages = _read_all(lambda sock: _send_and_close(sock, (request.encode(), [])))
+    assert messages == [(request, [])]
+
+
+def test_message_reader_split_message():
+    """Read a message sent in several parts."""
+    encoded = Request(method="test", parameters={"key": "value"}).encode()
+    parts = [(encoded[i : i + 3], []) for i in range(0, len(encoded), 3)]
+    messages = _read_all(lambda sock: _send_and_close(sock, *parts))
+    assert messages == [(Request(method="test", parameters={"key": "value"}), [])]
+
+
+def test_message_reader_fds_per_message():
+    """Each message comes with the fds sent along with it, even when read at once."""
+    messages = _read_all(
+        lambda sock: _send_and_close(
+            sock,
+            (Request(method="first").encode(), []),
+            (Request(method="second").encode(), [_pipe_with(b"a"), _pipe_with(b"b")]),
+            (Request(method="third").encode(), []),
+        )
+    )
+    assert messages == [
+        (Request(method="first"), []),
+        (Request(method="second"), [b"a", b"b"]),
+        (Request(method="third"), []),
+    ]
+
+
+def test_message_reader_fds_across_parts():
+    """The fds sent along with several parts of a message all belong to it."""
+    encoded = Request(method="test").encode()
+    messages = _read_all(
+        lambda sock: _send_and_close(
+            sock,
+            (encoded[:5], [_pipe_with(b"a")]),
+            (encoded[5:], [_pipe_with(b"b")]),
+        )
+    )
+    assert messages == [(Request(method="test"), [b"a", b"b"])]
+
+
+def test_message_reader_incomplete_message():
+    """A connection closed in the middle of a message is an error."""
+    with pytest.raises(ConnectionError):
+        _read_all(lambda sock: _send_and_close(sock, (b'{"method": "te', [])))